@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Load and latency benchmark of the HtREST server, running against the in-process heat pump simulator.
+
+    Several concurrent clients drive the endpoints of all namespaces for the given duration; afterwards the
+    number of requests, the errors, the p50/p99 latencies and the throughput (requests/sec) are reported for
+    each endpoint. The results can be stored as JSON and compared against a baseline of a previous run to
+    detect performance regressions.
+
+    Example:
+
+    .. code-block:: shell
+
+       $ python3 -m benchmarks.load --baudrate 19200 --clients 8 --duration 30 --json result.json
+       $ python3 -m benchmarks.load --baudrate 19200 --clients 8 --duration 30 --baseline result.json
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Final, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+
+from werkzeug.serving import make_server
+
+from htrest.app import create_app
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+
+class Scenario(NamedTuple):
+    """A single request (method, path and optional JSON payload) driven by the benchmark."""
+
+    name: str
+    method: str
+    path: str
+    payload: Optional[object] = None
+    stream: bool = False
+
+
+SCENARIOS: Final = (
+    Scenario("device", "GET", "/api/v1/device/"),
+    Scenario("datetime", "GET", "/api/v1/datetime/"),
+    Scenario("faultlist", "GET", "/api/v1/faultlist/"),
+    Scenario("faultlist/size", "GET", "/api/v1/faultlist/size"),
+    Scenario("faultlist/<id>", "GET", "/api/v1/faultlist/0"),
+    Scenario("faultlist/last", "GET", "/api/v1/faultlist/last"),
+    Scenario("timeprog", "GET", "/api/v1/timeprog/"),
+    Scenario("timeprog/<id>", "GET", "/api/v1/timeprog/0"),
+    Scenario("timeprog/<id>/<day>/<num>", "GET", "/api/v1/timeprog/0/0/0"),
+    Scenario(
+        "timeprog/<id>/<day>/<num> [PUT]",
+        "PUT",
+        "/api/v1/timeprog/0/0/0",
+        {"state": 1, "start": "06:00", "end": "08:00"},
+    ),
+    Scenario("param", "GET", "/api/v1/param/"),
+    Scenario("param/<name>", "GET", "/api/v1/param/{}".format(quote("Temp. Aussen"))),
+    Scenario("param/<name> [PUT]", "PUT", "/api/v1/param/{}".format(quote("HKR Soll_Raum")), {"value": 21.5}),
+    Scenario("fastquery", "GET", "/api/v1/fastquery/"),
+    Scenario("fastquery/<name>", "GET", "/api/v1/fastquery/{}".format(quote("Temp. Aussen"))),
+    Scenario("stream", "GET", "/api/v1/stream/?{}".format(quote("Temp. Aussen")), stream=True),
+    Scenario("history", "GET", "/api/v1/history/"),
+    Scenario("history/<name>", "GET", "/api/v1/history/{}?step=60".format(quote("Temp. Aussen"))),
+    Scenario("metrics", "GET", "/metrics"),
+)
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Return the p-th percentile (nearest rank) of the given, sorted values."""
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * p // 100))  # ceil(len * p / 100)
+    return values[int(rank) - 1]
+
+
+def request(port: int, scenario: Scenario) -> Tuple[float, bool]:
+    """Perform the request of the given scenario and return its latency in seconds and whether it succeeded.
+
+    For a stream, the latency is the time until the first event has been received.
+    """
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    try:
+        body = json.dumps(scenario.payload) if scenario.payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        start = time.perf_counter()
+        conn.request(scenario.method, scenario.path, body=body, headers=headers)
+        resp = conn.getresponse()
+        if scenario.stream and resp.status == 200:
+            while not resp.readline().startswith(b"event:"):
+                pass
+        else:
+            resp.read()
+        return time.perf_counter() - start, resp.status < 400
+    except (OSError, http.client.HTTPException) as ex:
+        _LOGGER.error("%s %s failed: %s", scenario.method, scenario.path, ex)
+        return 0.0, False
+    finally:
+        conn.close()
+
+
+def run(port: int, scenarios: List[Scenario], clients: int, duration: float) -> Dict[str, Dict[str, float]]:
+    """Drive the given scenarios with several concurrent clients for the given duration.
+
+    :returns: The benchmark results (requests, errors, p50, p99 and rps) per scenario and in total.
+    :rtype: ``dict``
+    """
+    samples: Dict[str, List[float]] = {scenario.name: [] for scenario in scenarios}
+    errors: Dict[str, int] = {scenario.name: 0 for scenario in scenarios}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(offset: int) -> None:
+        n = offset
+        while time.monotonic() < deadline:
+            scenario = scenarios[n % len(scenarios)]
+            latency, ok = request(port, scenario)
+            with lock:
+                if ok:
+                    samples[scenario.name].append(latency)
+                else:
+                    errors[scenario.name] += 1
+            n += 1
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    results: Dict[str, Dict[str, float]] = {}
+    for name in list(samples.keys()) + ["TOTAL"]:
+        values = sorted(samples[name]) if name in samples else sorted(v for s in samples.values() for v in s)
+        failed = errors[name] if name in errors else sum(errors.values())
+        results[name] = {
+            "requests": len(values) + failed,
+            "errors": failed,
+            "p50": percentile(values, 50),
+            "p99": percentile(values, 99),
+            "rps": (len(values) + failed) / elapsed,
+        }
+    return results
+
+
+def report(results: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Dict[str, float]]] = None) -> None:
+    """Print the benchmark results as table (together with the relative change of p99 against the baseline)."""
+    print(
+        "{:<34} {:>9} {:>7} {:>10} {:>10} {:>9} {:>8}".format(
+            "endpoint", "requests", "errors", "p50 [ms]", "p99 [ms]", "req/s", "p99 +/-"
+        )
+    )
+    for name, res in results.items():
+        change = ""
+        if baseline and name in baseline and baseline[name]["p99"] > 0:
+            change = "{:+.0%}".format(res["p99"] / baseline[name]["p99"] - 1)
+        print(
+            "{:<34} {:>9d} {:>7d} {:>10.1f} {:>10.1f} {:>9.1f} {:>8}".format(
+                name, int(res["requests"]), int(res["errors"]), res["p50"] * 1e3, res["p99"] * 1e3, res["rps"], change
+            )
+        )
+
+
+def regressions(
+    results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float
+) -> List[str]:
+    """Return the endpoints whose p99 latency or throughput got worse than the baseline by more than the tolerance."""
+    worse = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if base is None or (name == "TOTAL" and results.keys() != baseline.keys()):
+            continue  # the totals are only comparable for the same set of endpoints
+        if base["p99"] > 0 and res["p99"] > base["p99"] * (1 + tolerance):
+            worse.append("{}: p99 {:.1f} ms > {:.1f} ms".format(name, res["p99"] * 1e3, base["p99"] * 1e3))
+        if res["rps"] < base["rps"] * (1 - tolerance):
+            worse.append("{}: {:.1f} req/s < {:.1f} req/s".format(name, res["rps"], base["rps"]))
+        if res["errors"] > base["errors"]:
+            worse.append("{}: {:d} errors > {:d} errors".format(name, int(res["errors"]), int(base["errors"])))
+    return worse
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="HtREST load and latency benchmark (heat pump simulator)")
+    parser.add_argument("--baudrate", default=115200, type=int, help="simulated baudrate, default: %(default)s")
+    parser.add_argument(
+        "--time-scale",
+        default=1.0,
+        type=float,
+        help="factor applied to the simulated transmission delays (0 = no delays), default: %(default)s",
+    )
+    parser.add_argument("--clients", default=4, type=int, help="number of concurrent clients, default: %(default)s")
+    parser.add_argument("--duration", default=10, type=float, help="duration in seconds, default: %(default)s")
+    parser.add_argument("--warmup", default=2, type=float, help="warm-up in seconds, default: %(default)s")
+    parser.add_argument(
+        "--only",
+        default="",
+        type=str,
+        help="comma separated list of the endpoints to drive (e.g. 'param,fastquery'), default: all",
+    )
+    parser.add_argument("--sample-interval", default=10.0, type=float, help="see htrest, default: %(default)s")
+    parser.add_argument("--session-timeout", default=0, type=float, help="see htrest, default: %(default)s")
+    parser.add_argument("--timeprog-cache-ttl", default=0, type=float, help="see htrest, default: %(default)s")
+    parser.add_argument("--json", default="", type=str, help="file to store the results as JSON")
+    parser.add_argument("--baseline", default="", type=str, help="JSON results of a previous run to compare with")
+    parser.add_argument(
+        "--tolerance",
+        default=0.25,
+        type=float,
+        help="tolerated relative degradation against the baseline, default: %(default)s",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    only = [name.strip() for name in args.only.split(",") if name.strip()]
+    scenarios = [s for s in SCENARIOS if not only or s.name.split(" ")[0] in only or s.name.split("/")[0] in only]
+    if not scenarios:
+        parser.error("no endpoint matches {!r}".format(args.only))
+
+    with tempfile.TemporaryDirectory(prefix="htrest-benchmark-") as history_dir:
+        app = create_app(
+            "simulator",
+            args.baudrate,
+            sample_interval=args.sample_interval,
+            session_timeout=args.session_timeout,
+            history_dir=history_dir if args.sample_interval > 0 else "",
+            timeprog_cache_ttl=args.timeprog_cache_ttl,
+            simulate=True,
+        )
+        app.ht_heatpump.time_scale = args.time_scale  # type: ignore[attr-defined]
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            if args.warmup > 0:
+                run(server.server_port, scenarios, args.clients, args.warmup)
+            results = run(server.server_port, scenarios, args.clients, args.duration)
+        finally:
+            server.shutdown()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print(
+        "baudrate={}, clients={}, duration={}s, sample-interval={}s".format(
+            args.baudrate, args.clients, args.duration, args.sample_interval
+        )
+    )
+    report(results, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"arguments": vars(args), "results": results}, f, indent=2)
+    if baseline is not None:
+        worse = regressions(results, baseline, args.tolerance)
+        for line in worse:
+            print("REGRESSION {}".format(line))
+        if worse:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
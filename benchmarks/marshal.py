@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Micro-benchmark of the marshalling of parameter list responses (``param_list_model``).
+
+    Compares the wildcard marshalling of flask_restx (with :class:`~htrest.apis.utils.DotKeyField`) against
+    :func:`~htrest.apis.utils.format_param_list` for a list of all known parameters and for larger,
+    synthetic parameter lists, and verifies that both produce the same result.
+
+    Example:
+
+    .. code-block:: shell
+
+       $ python3 -m benchmarks.marshal
+"""
+
+import argparse
+import timeit
+from typing import Dict
+
+from flask_restx import Model, fields, marshal
+from htheatpump import HtDataTypes, HtParams
+
+from htrest.apis.utils import DotKeyField, format_param_list
+
+
+def param_list(size: int) -> Dict[str, object]:
+    """Return a parameter list with all known parameters, extended with synthetic (dotted) names up to the size."""
+    data: Dict[str, object] = {
+        name: (True if param.data_type == HtDataTypes.BOOL else 12.3) for name, param in HtParams.items()
+    }
+    for n in range(len(data), size):
+        data["Param. {:d}".format(n)] = float(n)
+    return data
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="HtREST micro-benchmark of the parameter list marshalling")
+    parser.add_argument("--repeat", default=5, type=int, help="number of repetitions, default: %(default)s")
+    args = parser.parse_args()
+
+    model = Model("param_list_model", {"*": fields.Wildcard(DotKeyField)})
+    print("{:>6} {:>16} {:>16} {:>9}".format("size", "marshal [us]", "fast [us]", "speedup"))
+    for size in (len(HtParams), 250, 1000):
+        data = param_list(size)
+        assert marshal(data, model) == format_param_list(data)
+        assert list(marshal(data, model)) == list(format_param_list(data))  # same order of the keys
+        number = max(1, 20000 // size**2)
+        slow = min(timeit.repeat(lambda: marshal(data, model), number=number, repeat=args.repeat)) / number
+        number = max(1, 100000 // size)
+        fast = min(timeit.repeat(lambda: format_param_list(data), number=number, repeat=args.repeat)) / number
+        print("{:>6d} {:>16.1f} {:>16.1f} {:>8.0f}x".format(size, slow * 1e6, fast * 1e6, slow / fast))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Startup benchmark of the HtREST server, running against the in-process heat pump simulator.
+
+    The server is started as a separate process (with ``--simulate --production``) several times, once
+    with and once without ``--lazy-connect``, while a client polls the liveness and readiness endpoints.
+    For each mode the median time until the server answers (``/health/live``), until it is ready to serve
+    requests on the heat pump (``/health/ready``) and until the OpenAPI document has been delivered is
+    reported, together with the number of refused connections during the startup.
+
+    Example:
+
+    .. code-block:: shell
+
+       $ python3 -m benchmarks.startup --runs 5
+"""
+
+import argparse
+import http.client
+import json
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+
+def free_port() -> int:
+    """Return a free TCP port on the local host."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get(port: int, path: str, timeout: float) -> int:
+    """Perform a GET request on the server and return the status code of the response."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        resp.read()
+        return resp.status
+    finally:
+        conn.close()
+
+
+def measure(args: argparse.Namespace, lazy: bool) -> Dict[str, float]:
+    """Start the server once and return the times (in seconds since the start of the process) until it was
+    alive, ready and delivered the OpenAPI document, and the number of refused connections meanwhile."""
+    port = free_port()
+    cmd = [sys.executable, "-m", "htrest", "--simulate", "--production", "--host", "127.0.0.1", "--port", str(port)]
+    cmd += ["--baudrate", str(args.baudrate)] + (["--lazy-connect"] if lazy else [])
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    res = {"refused": 0.0}
+    try:
+        deadline = start + args.timeout
+        while "ready" not in res:
+            if time.perf_counter() > deadline or proc.poll() is not None:
+                raise RuntimeError("server didn't get ready within {}s".format(args.timeout))
+            try:
+                path = "/health/live" if "live" not in res else "/health/ready"
+                status = get(port, path, args.timeout)
+                res.setdefault("live", time.perf_counter() - start)
+                if path == "/health/ready" and status == 200:
+                    res["ready"] = time.perf_counter() - start
+            except ConnectionRefusedError:
+                res["refused"] += 1
+            time.sleep(args.poll)
+        t = time.perf_counter()
+        get(port, "/api/v1/swagger.json", args.timeout)
+        res["spec"] = time.perf_counter() - t
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait()
+    return res
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="HtREST startup benchmark (heat pump simulator)")
+    parser.add_argument("--baudrate", default=115200, type=int, help="simulated baudrate, default: %(default)s")
+    parser.add_argument("--runs", default=3, type=int, help="number of starts per mode, default: %(default)s")
+    parser.add_argument("--poll", default=0.01, type=float, help="poll interval in seconds, default: %(default)s")
+    parser.add_argument("--timeout", default=60, type=float, help="startup timeout in seconds, default: %(default)s")
+    parser.add_argument("--json", default="", type=str, help="file to store the results as JSON")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, float]] = {}
+    print("{:<14} {:>10} {:>10} {:>10} {:>9}".format("mode", "live [ms]", "ready [ms]", "spec [ms]", "refused"))
+    for mode, lazy in (("eager", False), ("lazy-connect", True)):
+        runs: List[Dict[str, float]] = [measure(args, lazy) for _ in range(args.runs)]
+        results[mode] = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+        res = results[mode]
+        print(
+            "{:<14} {:>10.0f} {:>10.0f} {:>10.1f} {:>9.0f}".format(
+                mode, res["live"] * 1e3, res["ready"] * 1e3, res["spec"] * 1e3, res["refused"]
+            )
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"arguments": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -30,11 +30,11 @@ import argparse
 import logging.config
 import os
 import re
+import socket
 import textwrap
-from typing import Final
+from typing import Final, Optional
 
 from .__version__ import __version__
-from .app import create_app
 
 
 class UserAction(argparse.Action):
@@ -167,29 +167,301 @@ def main() -> None:
         help="disable all parameter verification actions",
     )
 
+    parser.add_argument(
+        "--sample-interval",
+        default=0,
+        type=float,
+        help="interval in seconds for the background sampling of all heat pump parameters; GET requests on"
+        " /api/v1/param are then served from the in-memory snapshot (0 = disabled), default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--adaptive-sampling",
+        action="store_true",
+        help="learn the sampling interval of each parameter from its changes (between every tick and every 60th"
+        " tick of --sample-interval) instead of reading all parameters every tick",
+    )
+
+    parser.add_argument(
+        "--sample-classes",
+        default="",
+        type=str,
+        help="JSON file with the sampling class ('fast', 'slow', 'static' or 'adaptive') of the parameters, e.g."
+        ' {"Temp. Aussen": "fast", "HKR Soll_Raum": "slow"} (requires --sample-interval), default: %(default)s',
+    )
+
+    parser.add_argument(
+        "--session-timeout",
+        default=0,
+        type=float,
+        help="idle time in seconds after which the server logs out from the heat pump; the login is kept"
+        " across requests until then (0 = login/logout for every request), default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--history-dir",
+        default="",
+        type=str,
+        help="directory for recording the history of the sampled heat pump parameters (requires"
+        " --sample-interval; empty = disabled), default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--history-retention",
+        default=30,
+        type=float,
+        help="retention period in days of the parameter history, default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--fault-cache",
+        default="",
+        type=str,
+        help="file in which the fault list entries are cached persistently (empty = memory only),"
+        " default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--timeprog-cache-ttl",
+        default=0,
+        type=float,
+        help="time in seconds after which cached time programs are read again from the heat pump"
+        " (0 = caching disabled), default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--simulate",
+        action="store_true",
+        help="use an in-process heat pump simulator instead of the heat pump connected on the serial device"
+        " (the transmission delays are simulated according to the baudrate)",
+    )
+
+    parser.add_argument(
+        "--write-filter-ttl",
+        default=0,
+        type=float,
+        help="time in seconds for which the last written value of a parameter is trusted, writes of an unchanged"
+        " value are skipped within this time (0 = disabled), default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--write-debounce",
+        default=0,
+        type=float,
+        help="minimal time in seconds between two writes of the same parameter, only the latest of the writes"
+        " arriving meanwhile is performed (0 = disabled), default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--unit",
+        action="append",
+        default=[],
+        type=str,
+        metavar="UNIT=DEVICE[:BAUDRATE]",
+        help="serve several heat pumps by one server: name and serial device (with an optional baudrate) of a"
+        " heat pump, whose REST API is then available under /api/v1/<unit>/...; may be given several times"
+        " (--device is ignored)",
+    )
+
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        help="serve the API by a multi-threaded server with a bounded number of threads, a listen backlog and"
+        " a graceful shutdown (instead of the Flask development server); without keep-alive connections, which"
+        " are only supported by --asyncio",
+    )
+
+    parser.add_argument(
+        "--threads",
+        default=8,
+        type=int,
+        help="maximal number of worker threads (concurrent connections) of the production server,"
+        " default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--backlog",
+        default=64,
+        type=int,
+        help="maximal number of connections waiting for a free worker thread of the production server,"
+        " default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--client-timeout",
+        default=5,
+        type=float,
+        help="time in seconds after which a client which doesn't send or receive data is disconnected by the"
+        " production server, default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--max-streams",
+        default=16,
+        type=int,
+        help="maximal number of concurrent event streams (served besides the worker threads) of the production"
+        " server, default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--shutdown-timeout",
+        default=10,
+        type=float,
+        help="maximal time in seconds the production server waits for the active connections on shutdown,"
+        " default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--asyncio",
+        action="store_true",
+        help="serve the API by the asyncio variant of the app (requires 'aiohttp'); sampled values, streams and"
+        " metrics are served on the event loop, all other requests on a single thread",
+    )
+
+    parser.add_argument(
+        "--subscription-interval",
+        default=1,
+        type=float,
+        help="interval in seconds for the sampling of the parameters subscribed by the WebSocket clients"
+        " (requires --asyncio), default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--clock-sync-interval",
+        default=0,
+        type=float,
+        help="interval in seconds for the measurement of the heat pump clock offset; if given, the date and time"
+        " of the heat pump is estimated from the measured offset, default: %(default)s (read on every request)",
+    )
+
+    parser.add_argument(
+        "--clock-max-offset",
+        default=0,
+        type=float,
+        help="offset in seconds above which the clock of the heat pump is set to the host time (requires"
+        " --clock-sync-interval), default: %(default)s (no correction)",
+    )
+
+    parser.add_argument(
+        "--trace-file",
+        default="",
+        type=str,
+        help="file in which the traces of the serial transactions with the heat pump are written (JSON lines,"
+        " rolled over at 10 MB with 5 backups), default: no trace file",
+    )
+
+    parser.add_argument(
+        "--profile-token",
+        default="",
+        type=str,
+        help="token which enables the profiling of a request, if given in the request header X-HtREST-Profile,"
+        " default: no profiling on request",
+    )
+
+    parser.add_argument(
+        "--profile-every",
+        default=0,
+        type=int,
+        help="profile every n-th request automatically, default: %(default)s (never)",
+    )
+
+    parser.add_argument(
+        "--profile-dir",
+        default="",
+        type=str,
+        help="directory in which the collapsed stacks of the profiled requests are stored by namespace,"
+        " default: kept in memory only",
+    )
+
+    parser.add_argument(
+        "--lazy-connect",
+        action="store_true",
+        help="bind the socket of the server at once and connect to the heat pump in the background; the requests"
+        " on the heat pump are answered with '503 Service Unavailable' until the connection is established",
+    )
+
     args = parser.parse_args()
     print("Start Heliotherm heat pump REST API server v{}.".format(__version__))
     print(args)
 
+    # bind the socket of the server before the app is created (only the production and the asyncio server can
+    # take over a socket), so the clients wait in the listen backlog instead of being refused during the startup
+    sock: Optional[socket.socket] = None
+    if args.lazy_connect and (args.production or args.asyncio):
+        family = socket.AF_INET6 if ":" in args.host else socket.AF_INET
+        sock = socket.create_server((args.host, args.port), family=family, backlog=args.backlog)
+
     # load logging config from file
     logging.config.fileConfig(args.logging_config, disable_existing_loggers=False)
 
-    # create and start the Flask application
-    app = create_app(
-        args.device,
-        args.baudrate,
-        args.user,
-        args.bool_as_int,
-        args.read_only,
-        args.no_param_verification,
-    )
-    app.run(
-        host=args.host,
-        port=args.port,
-        debug=args.debug,
-        use_reloader=False,
-        threaded=False,
+    from .app import create_app
+    from .server import serve
+    from .units import create_multi_app, parse_units
+
+    # create and start the Flask application (or its asyncio variant)
+    app_kwargs = dict(
+        user=args.user,
+        bool_as_int=args.bool_as_int,
+        read_only=args.read_only,
+        no_param_verification=args.no_param_verification,
+        sample_interval=args.sample_interval,
+        session_timeout=args.session_timeout,
+        history_dir=args.history_dir,
+        history_retention=args.history_retention,
+        fault_cache=args.fault_cache,
+        timeprog_cache_ttl=args.timeprog_cache_ttl,
+        simulate=args.simulate,
+        write_filter_ttl=args.write_filter_ttl,
+        write_debounce=args.write_debounce,
+        subscription_interval=args.subscription_interval,
+        adaptive_sampling=args.adaptive_sampling,
+        sample_classes=args.sample_classes,
+        clock_sync_interval=args.clock_sync_interval,
+        clock_max_offset=args.clock_max_offset,
+        trace_file=args.trace_file,
+        profile_token=args.profile_token,
+        profile_every=args.profile_every,
+        profile_dir=args.profile_dir,
+        lazy_connect=args.lazy_connect,
     )
+    if args.asyncio:
+        if args.unit:
+            parser.error("argument --asyncio: not supported together with --unit")
+        from .aio import create_aio_app, run_aio_app
+
+        aio_app = create_aio_app(args.device, args.baudrate, **app_kwargs)
+        run_aio_app(
+            aio_app, args.host, args.port, backlog=args.backlog, shutdown_timeout=args.shutdown_timeout, sock=sock
+        )
+        return
+    if args.unit:
+        try:
+            units = parse_units(args.unit, args.baudrate)
+        except ValueError as ex:
+            parser.error("argument --unit: {}".format(ex))
+        app = create_multi_app(units, **app_kwargs)
+    else:
+        app = create_app(args.device, args.baudrate, **app_kwargs)
+    if args.production:
+        serve(
+            app,
+            args.host,
+            args.port,
+            threads=args.threads,
+            backlog=args.backlog,
+            client_timeout=args.client_timeout,
+            max_streams=args.max_streams,
+            shutdown_timeout=args.shutdown_timeout,
+            sock=sock,
+        )
+    else:
+        app.run(
+            host=args.host,
+            port=args.port,
+            debug=args.debug,
+            use_reloader=False,
+            threaded=True,  # the accesses to the heat pump are serialized by the session of the heat pump
+        )
 
 
 if __name__ == "__main__":
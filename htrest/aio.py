@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Asyncio variant of the REST API application (requires the optional dependency ``aiohttp``).
+
+    The requests which can be answered from memory (sampled parameter values, change stream, WebSocket
+    subscriptions and metrics) are handled natively on the event loop, so idle clients (e.g. of
+    ``GET /api/v1/stream``) don't need a thread each. All other requests are passed to the Flask app of
+    :func:`~htrest.app.create_app`, which is run on a single dedicated executor thread, the only one talking
+    to the heat pump on behalf of the clients.
+"""
+
+import asyncio
+import base64
+import binascii
+import hmac
+import io
+import json
+import logging
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Final, List, Optional, Tuple
+from urllib.parse import unquote_to_bytes
+
+from flask import Flask
+
+from .app import create_app
+from .apis.utils import format_param_list
+from .feed import DeltaFilter
+from .metrics import CONTENT_TYPE
+from .sampler import ParamSnapshot
+
+try:
+    from aiohttp import WSMsgType, web
+except ImportError:  # pragma: no cover
+    WSMsgType = web = None  # type: ignore[assignment,misc]
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+# name of the query argument to specify the maximal accepted age of sampled parameter values
+MAX_AGE_ARG: Final = "max_age"
+# interval in seconds for sending a keep-alive comment if nothing changed
+KEEP_ALIVE_INTERVAL: Final = 15.0
+
+# keys of the aiohttp application
+FLASK_APP_KEY: Final = "htrest.flask_app"
+EXECUTOR_KEY: Final = "htrest.executor"
+
+
+class SnapshotQueue:
+    """Queue which passes the snapshots of the sampler (called from the sampling thread) to a coroutine.
+
+    If the consumer is too slow, the oldest snapshots are dropped.
+
+    :param loop: The event loop of the consumer.
+    :type loop: ``asyncio.AbstractEventLoop``
+    :param maxsize: The maximal number of queued snapshots.
+    :type maxsize: int
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int = 8) -> None:
+        self._loop = loop
+        self._queue: "asyncio.Queue[ParamSnapshot]" = asyncio.Queue(maxsize)
+
+    def put_threadsafe(self, snapshot: ParamSnapshot) -> None:
+        """Queue the given snapshot; may be called from any thread."""
+        self._loop.call_soon_threadsafe(self._put, snapshot)
+
+    def _put(self, snapshot: ParamSnapshot) -> None:
+        if self._queue.full():
+            self._queue.get_nowait()  # drop the oldest snapshot
+        self._queue.put_nowait(snapshot)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[ParamSnapshot]:
+        """Wait for the next snapshot.
+
+        :param timeout: The maximal time in seconds to wait.
+        :type timeout: float or None
+        :returns: The next snapshot or :const:`None` on timeout.
+        :rtype: ``ParamSnapshot`` or ``None``
+        """
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+def _environ(request: "web.Request", body: bytes) -> Dict[str, Any]:
+    """Return the WSGI environment of the given request."""
+    host, _, port = request.host.rpartition(":") if ":" in request.host else (request.host, "", "")
+    environ: Dict[str, Any] = {
+        "REQUEST_METHOD": request.method,
+        "SCRIPT_NAME": "",
+        "PATH_INFO": unquote_to_bytes(request.rel_url.raw_path).decode("latin-1"),
+        "QUERY_STRING": request.query_string,
+        "SERVER_NAME": host,
+        "SERVER_PORT": port or ("443" if request.secure else "80"),
+        "SERVER_PROTOCOL": "HTTP/{}.{}".format(*request.version),
+        "REMOTE_ADDR": request.remote or "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": request.scheme,
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": False,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for key, value in request.headers.items():
+        key = key.upper().replace("-", "_")
+        if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            key = "HTTP_" + key
+        environ[key] = environ[key] + "," + value if key in environ else value
+    return environ
+
+
+def _call_wsgi(app: Flask, environ: Dict[str, Any]) -> Tuple[str, List[Tuple[str, str]], bytes]:
+    """Call the WSGI application and return the status, the headers and the (complete) body of the response."""
+    response: List[Any] = []
+
+    def start_response(status, headers, exc_info=None):
+        response[:] = [status, headers]
+
+    result = app(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response[0], response[1], body
+
+
+def _authorized(app: Flask, request: "web.Request") -> bool:
+    """Return :const:`True` if the request passes the basic access authentication of the Flask app (if any)."""
+    if not app.config.get("BASIC_AUTH_FORCE"):
+        return True
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "basic":
+        return False
+    try:
+        username, _, password = base64.b64decode(credentials).decode("utf-8").partition(":")
+    except (binascii.Error, UnicodeDecodeError):
+        return False
+    return hmac.compare_digest(username, app.config["BASIC_AUTH_USERNAME"]) and hmac.compare_digest(
+        password, app.config["BASIC_AUTH_PASSWORD"]
+    )
+
+
+def _max_age(request: "web.Request") -> Tuple[bool, Optional[float]]:
+    """Return whether the request contains a valid maximal age (or none) and its value."""
+    value = request.query.get(MAX_AGE_ARG)
+    if value is None or value == "":
+        return True, None
+    try:
+        max_age = float(value)
+    except ValueError:
+        return False, None
+    return max_age >= 0, max_age
+
+
+def _json_response(data: Any, headers: Optional[Dict[str, str]] = None) -> "web.Response":
+    return web.Response(text=json.dumps(data) + "\n", content_type="application/json", headers=headers)
+
+
+async def forward(request: "web.Request") -> "web.StreamResponse":
+    """Pass the request to the Flask app, which runs on the dedicated executor thread."""
+    app: Flask = request.app[FLASK_APP_KEY]
+    body = await request.read()
+    environ = _environ(request, body)
+    loop = asyncio.get_running_loop()
+    status, headers, data = await loop.run_in_executor(request.app[EXECUTOR_KEY], _call_wsgi, app, environ)
+    code, _, reason = status.partition(" ")
+    response = web.Response(status=int(code), reason=reason or None, body=data)
+    for key, value in headers:
+        if key.lower() not in ("content-length", "transfer-encoding", "connection"):
+            response.headers.add(key, value)
+    return response
+
+
+def _native(handler: Callable[["web.Request"], Any]) -> Callable[["web.Request"], Any]:
+    """Decorator for the natively handled requests, which falls back to the Flask app if the handler returns
+    :const:`None` (e.g. on invalid arguments or if the data isn't available in memory) and records the
+    request duration like the Flask app does."""
+
+    async def wrapper(request: "web.Request") -> "web.StreamResponse":
+        app: Flask = request.app[FLASK_APP_KEY]
+        if not _authorized(app, request):
+            return await forward(request)  # let the Flask app answer with '401 Unauthorized'
+        if not app.ht_connector.ready:  # type: ignore[attr-defined]
+            return await forward(request)  # let the Flask app answer with '503 Service Unavailable'
+        start = time.perf_counter()
+        response = await handler(request)
+        if response is None:
+            return await forward(request)
+        if not isinstance(response, web.Response):  # e.g. a stream, which lasts as long as the connection
+            return response
+        path = request.path[len("/api/v1"):] if request.path.startswith("/api/v1") else request.path
+        app.ht_metrics.observe(  # type: ignore[attr-defined]
+            "htrest_request_duration_seconds",
+            "Duration of the REST API requests.",
+            time.perf_counter() - start,
+            namespace=path.strip("/").partition("/")[0] or "root",
+            method=request.method,
+            code=str(response.status),
+        )
+        return response
+
+    return wrapper
+
+
+@_native
+async def param_list(request: "web.Request") -> Optional["web.StreamResponse"]:
+    """``GET /api/v1/param/`` served from the latest snapshot of the sampler."""
+    app: Flask = request.app[FLASK_APP_KEY]
+    sampler = app.ht_sampler  # type: ignore[attr-defined]
+    valid, max_age = _max_age(request)
+    index = app.ht_params  # type: ignore[attr-defined]
+    params = [name for name in request.query.keys() if name != MAX_AGE_ARG]
+    if sampler is None or not valid or index.unknown(params):
+        return None
+    if not params:
+        params = index.names
+    snapshot = sampler.get(params, max_age)
+    if snapshot is None:
+        return None
+    _LOGGER.info("*** [GET] %s", request.url)
+    headers = {
+        "X-Data-Age": "{:.3f}".format(snapshot.age),
+        "X-Serial-Calls": "0",
+        "X-Serial-Calls-Saved": str(len(params)),
+    }
+    return _json_response(format_param_list(index.values_to_json(snapshot.values)), headers)
+
+
+@_native
+async def param(request: "web.Request") -> Optional["web.StreamResponse"]:
+    """``GET /api/v1/param/<name>`` served from the latest snapshot of the sampler."""
+    app: Flask = request.app[FLASK_APP_KEY]
+    sampler = app.ht_sampler  # type: ignore[attr-defined]
+    valid, max_age = _max_age(request)
+    index = app.ht_params  # type: ignore[attr-defined]
+    name = request.match_info["name"]
+    if sampler is None or not valid or name not in index:
+        return None
+    snapshot = sampler.get([name], max_age)
+    if snapshot is None:
+        return None
+    _LOGGER.info("*** [GET] %s -- name='%s'", request.url, name)
+    headers = {"X-Data-Age": "{:.3f}".format(snapshot.age)}
+    return _json_response({"value": index.to_json(name, snapshot.values[name])}, headers)
+
+
+@_native
+async def stream(request: "web.Request") -> Optional["web.StreamResponse"]:
+    """``GET /api/v1/stream/`` as Server-Sent Events, without a thread per client."""
+    app: Flask = request.app[FLASK_APP_KEY]
+    sampler = app.ht_sampler  # type: ignore[attr-defined]
+    index = app.ht_params  # type: ignore[attr-defined]
+    if sampler is None or index.unknown(request.query.keys()):
+        return None
+    deadbands = {}
+    for name, value in request.query.items():
+        try:
+            deadbands[name] = float(value) if value else 0.0
+        except ValueError:
+            return None
+        if not deadbands[name] >= 0:
+            return None
+    if not deadbands:
+        deadbands = {name: 0.0 for name in index.names}
+    _LOGGER.info("*** [GET] %s", request.url)
+    response = web.StreamResponse(headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.content_type = "text/event-stream"
+    await response.prepare(request)
+    delta_filter = DeltaFilter(deadbands)
+    queue = SnapshotQueue(asyncio.get_running_loop())
+    snapshot = sampler.snapshot
+    if snapshot is not None:
+        queue.put_threadsafe(snapshot)
+    sampler.add_listener(queue.put_threadsafe)
+    try:
+        while True:
+            snapshot = await queue.get(KEEP_ALIVE_INTERVAL)
+            if snapshot is None:
+                await response.write(b": keep-alive\n\n")
+                continue
+            delta = delta_filter.update(snapshot.values)
+            if delta:
+                data = "event: update\nid: {:.3f}\ndata: {}\n\n".format(
+                    snapshot.timestamp, json.dumps(index.values_to_json(delta))
+                )
+                await response.write(data.encode("utf-8"))
+    except ConnectionResetError:
+        _LOGGER.debug("*** [GET] %s -- client disconnected", request.url)
+    finally:
+        sampler.remove_listener(queue.put_threadsafe)
+    return response
+
+
+def _subscription_arg(data: Dict[str, Any], key: str) -> Dict[str, Any]:
+    """Return the parameters of a subscription message (a list of names or an object with the deadbands by name).
+
+    :raises ValueError:
+        If the value is neither a list of names nor an object.
+    """
+    value = data[key]
+    if isinstance(value, dict):
+        return value
+    if isinstance(value, list) and all(isinstance(name, str) for name in value):
+        return dict.fromkeys(value, 0.0)
+    raise ValueError(
+        "Invalid value for {!r}, must be a list of parameter names or an object with the deadbands by name".format(key)
+    )
+
+
+async def websocket(request: "web.Request") -> "web.StreamResponse":
+    """``GET /api/v1/ws``: live values of the subscribed parameters by a WebSocket.
+
+    The client subscribes parameters representing a "MP" data point by sending
+    ``{"subscribe": ["Temp. Aussen", "Stoerung"]}`` (or ``{"subscribe": {"Temp. Aussen": 0.5}}`` with deadbands)
+    and unsubscribes them by ``{"unsubscribe": ["Stoerung"]}``; the server pushes the changed values as
+    ``{"event": "update", "timestamp": ..., "values": {...}}``. Invalid messages are answered by
+    ``{"event": "error", "message": ...}``.
+    """
+    app: Flask = request.app[FLASK_APP_KEY]
+    if not _authorized(app, request):
+        return await forward(request)  # let the Flask app answer with '401 Unauthorized'
+    _LOGGER.info("*** [GET] %s", request.url)
+    index = app.ht_params  # type: ignore[attr-defined]
+    ws = web.WebSocketResponse(heartbeat=KEEP_ALIVE_INTERVAL)
+    await ws.prepare(request)
+    queue = SnapshotQueue(asyncio.get_running_loop())
+    subscription = app.ht_subscriptions.subscribe(queue.put_threadsafe)  # type: ignore[attr-defined]
+
+    async def send_updates() -> None:
+        try:
+            while True:
+                snapshot = await queue.get()
+                if snapshot is not None:
+                    values = index.values_to_json(snapshot.values)
+                    await ws.send_json({"event": "update", "timestamp": snapshot.timestamp, "values": values})
+        except ConnectionResetError:
+            _LOGGER.debug("*** [GET] %s -- client disconnected", request.url)
+
+    sender = asyncio.ensure_future(send_updates())
+    try:
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            try:
+                data = json.loads(msg.data)
+                if not isinstance(data, dict):
+                    raise ValueError("Invalid message, must be a JSON object")
+                if "subscribe" in data:
+                    subscription.add(_subscription_arg(data, "subscribe"))
+                if "unsubscribe" in data:
+                    subscription.remove(_subscription_arg(data, "unsubscribe"))
+                await ws.send_json({"event": "subscribed", "params": subscription.names})
+            except (ValueError, TypeError) as ex:
+                await ws.send_json({"event": "error", "message": str(ex)})
+    finally:
+        sender.cancel()
+        subscription.close()
+        # retrieve the outcome of the sender, so that a failure doesn't go unnoticed
+        for res in await asyncio.gather(sender, return_exceptions=True):
+            if isinstance(res, Exception):
+                _LOGGER.error("*** [GET] %s -- sending the updates failed: %s", request.url, res)
+        _LOGGER.debug("*** [GET] %s -- closed", request.url)
+    return ws
+
+
+@_native
+async def metrics(request: "web.Request") -> Optional["web.StreamResponse"]:
+    """``GET /metrics`` rendered on the event loop."""
+    app: Flask = request.app[FLASK_APP_KEY]
+    text = app.ht_metrics.render()  # type: ignore[attr-defined]
+    return web.Response(body=text.encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+
+def create_aio_app(*args, **kwargs) -> "web.Application":
+    """Create the asyncio variant of the application.
+
+    Takes the same arguments as :func:`~htrest.app.create_app`; the created Flask app serves all requests
+    which aren't handled natively on the event loop.
+
+    :returns: The aiohttp application.
+    :rtype: ``aiohttp.web.Application``
+    :raises RuntimeError:
+        If the optional dependency ``aiohttp`` is not installed.
+    """
+    if web is None:
+        raise RuntimeError("the asyncio variant of the app requires 'aiohttp' (pip install htrest[aio])")
+    flask_app = create_app(*args, **kwargs)
+    app = web.Application()
+    app[FLASK_APP_KEY] = flask_app
+    # the single thread which runs the Flask app and thereby all accesses to the heat pump for the clients
+    app[EXECUTOR_KEY] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="htrest-serial")
+
+    async def on_cleanup(app: "web.Application") -> None:
+        app[EXECUTOR_KEY].shutdown(wait=True)
+
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_get("/api/v1/param/", param_list)
+    app.router.add_get("/api/v1/param/{name}", param)
+    app.router.add_get("/api/v1/stream/", stream)
+    app.router.add_get("/api/v1/ws", websocket)
+    app.router.add_get("/metrics", metrics)
+    app.router.add_route("*", "/{tail:.*}", forward)
+    _LOGGER.info("*** created aiohttp app %s", app)
+    return app
+
+
+def run_aio_app(
+    app: "web.Application",
+    host: str,
+    port: int,
+    backlog: int = 128,
+    shutdown_timeout: float = 10,
+    sock: Optional[socket.socket] = None,
+) -> None:
+    """Serve the asyncio variant of the application until ``SIGINT`` or ``SIGTERM`` is received.
+
+    :param app: The aiohttp application created by :func:`create_aio_app`.
+    :type app: ``aiohttp.web.Application``
+    :param host: The hostname to listen on.
+    :type host: str
+    :param port: The port to listen on.
+    :type port: int
+    :param backlog: The maximal number of connections waiting in the listen backlog.
+    :type backlog: int
+    :param shutdown_timeout: The maximal time in seconds to wait for the active connections on shutdown.
+    :type shutdown_timeout: float
+    :param sock: An already bound and listening socket to take over (default :const:`None`, which means
+        the socket is created for the given host and port).
+    :type sock: ``socket.socket`` or ``None``
+    """
+    web.run_app(
+        app,
+        host=host if sock is None else None,
+        port=port if sock is None else None,
+        sock=sock,
+        backlog=backlog,
+        shutdown_timeout=shutdown_timeout,
+        print=None,
+        access_log=None,
+    )
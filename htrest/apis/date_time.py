@@ -27,7 +27,8 @@ from flask import current_app, request
 from flask_restx import Namespace, Resource, fields
 
 from .. import settings
-from .utils import HtContext
+from ..scheduler import PRIORITY_WRITE
+from .utils import HtContext, ht_read
 
 _LOGGER: Final = logging.getLogger(__name__)
 
@@ -42,6 +43,31 @@ date_time_model: Final = api.model(
             required=True,
             example=datetime.now().replace(microsecond=0).isoformat(),
         ),
+        "offset": fields.Float(
+            description="estimated offset of the heat pump clock against the host clock in seconds",
+            required=False,
+            readonly=True,
+            example=-12.3,
+        ),
+        "error": fields.Float(
+            description="maximal error of the estimated date and time in seconds",
+            required=False,
+            readonly=True,
+            example=0.25,
+        ),
+        "drift": fields.Float(
+            description="estimated drift of the heat pump clock against the host clock in seconds per second",
+            required=False,
+            readonly=True,
+            example=0.000012,
+        ),
+        "measured": fields.DateTime(
+            dt_format="iso8601",
+            description="host time of the latest measurement of the clock offset",
+            required=False,
+            readonly=True,
+            example=datetime.now().replace(microsecond=0).isoformat(),
+        ),
     },
 )
 
@@ -50,11 +76,21 @@ date_time_model: Final = api.model(
 class DateTime(Resource):
     @api.marshal_with(date_time_model)
     def get(self):
-        """Returns the current date and time of the heat pump."""
+        """Returns the current date and time of the heat pump.
+        Note: If the clock sync is enabled, the date and time are estimated from the measured clock offset.
+        """
         _LOGGER.info("*** [GET] %s", request.url)
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
-            dt, _ = current_app.ht_heatpump.get_date_time()  # type: ignore[attr-defined]
-        res = {"datetime": dt}
+        ht_heatpump = current_app.ht_heatpump  # type: ignore[attr-defined]
+        ht_clock = current_app.ht_clock  # type: ignore[attr-defined]
+        if ht_clock.enabled:
+            estimate = ht_clock.estimate()
+            if estimate is None:  # no measurement available (yet), e.g. after the clock has been set
+                ht_read(ht_heatpump, ("clock_sync",), ht_clock.measure)
+                estimate = ht_clock.estimate()
+            res = dict(estimate._asdict(), datetime=estimate.date_time)
+        else:
+            dt, _ = ht_read(ht_heatpump, ("get_date_time",), ht_heatpump.get_date_time)
+            res = {"datetime": dt}
         _LOGGER.debug("*** [GET] %s -> %s", request.url, res)
         return res
 
@@ -75,9 +111,10 @@ class DateTime(Resource):
             dt = datetime.now()
         else:
             dt = datetime.strptime(dt, "%Y-%m-%dT%H:%M:%S")
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
+        with HtContext(current_app.ht_heatpump, PRIORITY_WRITE):  # type: ignore[attr-defined]
             if not settings.READ_ONLY:
                 dt, _ = current_app.ht_heatpump.set_date_time(dt)  # type: ignore[attr-defined]
+                current_app.ht_clock.reset()  # type: ignore[attr-defined]
         res = {"datetime": dt}
         _LOGGER.debug(
             "*** [PUT%s] %s -> %s",
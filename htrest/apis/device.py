@@ -24,9 +24,6 @@ from typing import Final
 
 from flask import current_app, request
 from flask_restx import Namespace, Resource, fields
-from htheatpump import HtParams
-
-from .utils import HtContext
 
 _LOGGER: Final = logging.getLogger(__name__)
 
@@ -55,6 +52,33 @@ device_model: Final = api.model(
             readonly=True,
             example="3.0.20",
         ),
+        "device": fields.String(
+            description="serial device of the connection",
+            required=True,
+            readonly=True,
+            example="/dev/ttyUSB0",
+        ),
+        "baudrate": fields.Integer(
+            min=0,
+            description="baud rate of the serial connection",
+            required=True,
+            readonly=True,
+            example=115200,
+        ),
+        "connected": fields.DateTime(
+            dt_format="iso8601",
+            description="time at which the identity of the heat pump was read (at connect time)",
+            required=True,
+            readonly=True,
+            example="2023-01-01T12:00:00",
+        ),
+        "reconnects": fields.Integer(
+            min=0,
+            description="number of reconnects to the heat pump",
+            required=True,
+            readonly=True,
+            example=0,
+        ),
     },
 )
 
@@ -63,14 +87,12 @@ device_model: Final = api.model(
 class Device(Resource):
     @api.marshal_with(device_model)
     def get(self):
-        """Returns the properties of the heat pump."""
+        """Returns the properties of the heat pump and the details of the serial link.
+
+        The properties are read once at connect time and only refreshed after a reconnect.
+        """
         _LOGGER.info("*** [GET] %s", request.url)
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
-            serial_number = current_app.ht_heatpump.get_serial_number()  # type: ignore[attr-defined]
-            software_version, _ = current_app.ht_heatpump.get_version()  # type: ignore[attr-defined]
-            res = {"serial_number": serial_number, "software_version": software_version}
-            if "Liegenschaft" in HtParams:
-                property_id = current_app.ht_heatpump.get_param("Liegenschaft")  # type: ignore[attr-defined]
-                res.update({"property_id": property_id})
+        identity = current_app.ht_device.get()  # type: ignore[attr-defined]
+        res = {key: value for key, value in identity._asdict().items() if value is not None}
         _LOGGER.debug("*** [GET] %s -> %s", request.url, res)
         return res
@@ -24,9 +24,9 @@ from typing import Final
 
 from flask import current_app, request
 from flask_restx import Namespace, Resource, fields
-from htheatpump import HtParams
 
-from .utils import DotKeyField, HtContext, ParamValueField, bool_as_int
+from ..scheduler import PRIORITY_BULK
+from .utils import DotKeyField, ParamValueField, ht_read, marshal_param_list
 
 _LOGGER: Final = logging.getLogger(__name__)
 
@@ -44,18 +44,19 @@ param_model: Final = api.model("param_model", {"value": ParamValueField})
 @api.response(404, "Parameter(s) not found")
 @api.response(400, "Invalid parameter(s), doesn't represent a 'MP' data point")
 class FastQueryList(Resource):
-    @api.marshal_with(param_list_model)
+    @marshal_param_list(api, param_list_model)
     def get(self):
         """Performs a fast query of a subset or all heat pump parameters representing a 'MP' data point."""
         _LOGGER.info("*** [GET] %s", request.url)
+        index = current_app.ht_params  # type: ignore[attr-defined]
         params = list(request.args.keys())
-        unknown = [name for name in params if name not in HtParams]
+        unknown = index.unknown(params)
         if unknown:
             api.abort(
                 404,
                 "Parameter(s) {} not found".format(", ".join(repr(name) for name in unknown)),
             )
-        invalid = [name for name in params if HtParams[name].dp_type != "MP"]
+        invalid = index.not_mp(params)
         if invalid:
             api.abort(
                 400,
@@ -64,11 +65,12 @@ class FastQueryList(Resource):
                 ),
             )
         if not params:
-            params = [name for name, param in HtParams.items() if param.dp_type == "MP"]
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
-            res = current_app.ht_heatpump.fast_query(*params)  # type: ignore[attr-defined]
-        for name, value in res.items():
-            res[name] = bool_as_int(name, value)
+            params = index.mp_names
+        ht_heatpump = current_app.ht_heatpump  # type: ignore[attr-defined]
+        values = ht_read(
+            ht_heatpump, ("fast_query", tuple(params)), lambda: ht_heatpump.fast_query(*params), PRIORITY_BULK
+        )
+        res = index.values_to_json(values)
         _LOGGER.debug("*** [GET] %s -> %s", request.url, res)
         return res
 
@@ -76,15 +78,19 @@ class FastQueryList(Resource):
 @api.route("/<string:name>")
 @api.param("name", "The parameter name (which represents a 'MP' data point)")
 @api.response(404, "Parameter not found")
+@api.response(400, "Invalid parameter, doesn't represent a 'MP' data point")
 class FastQuery(Resource):
     @api.marshal_with(param_model)
     def get(self, name: str):
         """Performs a fast query of a specific heat pump parameter which represents a 'MP' data point."""
         _LOGGER.info("*** [GET] %s -- name='%s'", request.url, name)
-        if name not in HtParams:
+        index = current_app.ht_params  # type: ignore[attr-defined]
+        if name not in index:
             api.abort(404, "Parameter {!r} not found".format(name))
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
-            value = current_app.ht_heatpump.fast_query(name)  # type: ignore[attr-defined]
-        res = {"value": bool_as_int(name, value[name])}
+        if not index.is_mp(name):
+            api.abort(400, "Parameter {!r} doesn't represent a 'MP' data point".format(name))
+        ht_heatpump = current_app.ht_heatpump  # type: ignore[attr-defined]
+        value = ht_read(ht_heatpump, ("fast_query", (name,)), lambda: ht_heatpump.fast_query(name))
+        res = {"value": index.to_json(name, value[name])}
         _LOGGER.debug("*** [GET] %s -> %s", request.url, res)
         return res
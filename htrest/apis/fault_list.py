@@ -20,12 +20,13 @@
 """ REST API for operations related to the heat pump fault list. """
 
 import logging
-from typing import Final
+from datetime import datetime
+from typing import Final, Optional
 
 from flask import current_app, request
 from flask_restx import Namespace, Resource, fields
 
-from .utils import HtContext
+from .utils import ht_read
 
 _LOGGER: Final = logging.getLogger(__name__)
 
@@ -80,16 +81,57 @@ fault_list_size_model: Final = api.model(
 )
 
 
+def _synced_fault_list():
+    """Return the complete fault list, whereby only the new entries are fetched from the heat pump."""
+    ht_heatpump = current_app.ht_heatpump  # type: ignore[attr-defined]
+    ht_fault_cache = current_app.ht_fault_cache  # type: ignore[attr-defined]
+    return ht_read(ht_heatpump, ("sync_fault_list",), ht_fault_cache.sync)
+
+
+def _int_arg(name: str) -> Optional[int]:
+    """Return the value of a non-negative integer query argument or :const:`None`, if not specified."""
+    value = request.args.get(name)
+    if value is None or value == "":
+        return None
+    if not value.isdigit():
+        api.abort(400, "Invalid value {!r} for {!r}, must be a non-negative integer".format(value, name))
+    return int(value)
+
+
+def _datetime_arg(name: str) -> Optional[datetime]:
+    """Return the value of a date and time query argument (as naive local time) or :const:`None`, if not specified."""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        api.abort(400, "Invalid value {!r} for {!r}, must be an ISO 8601 date and time".format(value, name))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
 @api.route("/")
+@api.param("offset", "Index of the first returned entry (of the filtered list)", type=int)
+@api.param("limit", "Maximal number of returned entries", type=int)
+@api.param("since", "Return only the entries at or after the given date and time (ISO 8601)")
+@api.response(400, "Invalid query argument(s)")
 class FaultList(Resource):
     @api.marshal_list_with(fault_list_entry_model)
     def get(self):
         """Returns the fault list of the heat pump."""
         _LOGGER.info("*** [GET] %s", request.url)
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
-            res = current_app.ht_heatpump.get_fault_list()  # type: ignore[attr-defined]
+        offset, limit, since = _int_arg("offset"), _int_arg("limit"), _datetime_arg("since")
+        res = _synced_fault_list()
+        if since is not None:
+            res = [entry for entry in res if entry["datetime"] >= since]
+        total = len(res)
+        start = offset or 0
+        end = start + limit if limit is not None else None
+        res = res[start:end]
         _LOGGER.debug("*** [GET] %s -> %s", request.url, res)
-        return res
+        return res, 200, {"X-Total-Count": str(total)}
 
 
 @api.route("/size")
@@ -98,25 +140,28 @@ class FaultListSize(Resource):
     def get(self):
         """Returns the fault list size of the heat pump."""
         _LOGGER.info("*** [GET] %s", request.url)
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
-            size = current_app.ht_heatpump.get_fault_list_size()  # type: ignore[attr-defined]
+        ht_heatpump = current_app.ht_heatpump  # type: ignore[attr-defined]
+        size = ht_read(ht_heatpump, ("get_fault_list_size",), ht_heatpump.get_fault_list_size)
         res = {"size": size}
         _LOGGER.debug("*** [GET] %s -> %s", request.url, res)
         return res
 
 
-@api.route("/<int:id>")
-@api.param("id", "The fault list index")
+@api.route("/<int:identifier>")
+@api.param("identifier", "The fault list index")
 @api.response(404, "Fault list entry not found")
 class FaultEntry(Resource):
     @api.marshal_with(fault_list_entry_model)
     def get(self, identifier: int):
         """Returns the fault list entry with the given index."""
         _LOGGER.info("*** [GET] %s -- id=%d", request.url, identifier)
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
-            if identifier not in range(0, current_app.ht_heatpump.get_fault_list_size()):  # type: ignore[attr-defined]
+        # fault list entries never change, so a cached entry can be delivered without any serial traffic
+        res = current_app.ht_fault_cache.entry(identifier)  # type: ignore[attr-defined]
+        if res is None:
+            entries = _synced_fault_list()
+            if identifier not in range(0, len(entries)):
                 api.abort(404, "Fault list entry #{:d} not found".format(identifier))
-            res = current_app.ht_heatpump.get_fault_list(identifier)[0]  # type: ignore[attr-defined]
+            res = entries[identifier]
         _LOGGER.debug("*** [GET] %s -> %s", request.url, res)
         return res
 
@@ -127,9 +172,9 @@ class LastFault(Resource):
     def get(self):
         """Returns the last fault list entry of the heat pump."""
         _LOGGER.info("*** [GET] %s", request.url)
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
-            idx, err, dt, msg = current_app.ht_heatpump.get_last_fault()  # type: ignore[attr-defined]
-            # e.g.: idx, err, dt, msg = (28, 19, datetime.datetime.now(), "EQ_Spreizung")
-            res = {"index": idx, "error": err, "datetime": dt, "message": msg}
+        ht_heatpump = current_app.ht_heatpump  # type: ignore[attr-defined]
+        idx, err, dt, msg = ht_read(ht_heatpump, ("get_last_fault",), ht_heatpump.get_last_fault)
+        # e.g.: idx, err, dt, msg = (28, 19, datetime.datetime.now(), "EQ_Spreizung")
+        res = {"index": idx, "error": err, "datetime": dt, "message": msg}
         _LOGGER.debug("*** [GET] %s -> %s", request.url, res)
         return res
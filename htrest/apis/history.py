@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" REST API for range queries on the history of the sampled heat pump parameters. """
+
+import logging
+from datetime import datetime, timedelta
+from typing import Final
+
+from flask import current_app, request
+from flask_restx import Namespace, Resource, fields
+
+from .utils import ParamValueField
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+api: Final = Namespace("history", description="Range queries on the history of the sampled heat pump parameters.")
+
+# default time range of a query
+DEFAULT_RANGE: Final = timedelta(hours=1)
+
+history_point_model: Final = api.model(
+    "history_point_model",
+    {
+        "datetime": fields.DateTime(
+            dt_format="iso8601",
+            description="date and time of the sample or start of the downsampling interval",
+            required=True,
+            readonly=True,
+            example="2020-01-29T13:10:00",
+        ),
+        "value": ParamValueField(),
+        "min": fields.Float(description="minimal value in the downsampling interval", readonly=True, example=4.2),
+        "max": fields.Float(description="maximal value in the downsampling interval", readonly=True, example=5.1),
+        "avg": fields.Float(description="average value in the downsampling interval", readonly=True, example=4.6),
+        "samples": fields.Integer(
+            min=0,
+            description="number of samples in the downsampling interval",
+            readonly=True,
+            example=10,
+        ),
+    },
+)
+
+
+def _history():
+    """Return the history store of the application or abort the request, if the history is disabled."""
+    store = current_app.ht_history  # type: ignore[attr-defined]
+    if store is None:
+        api.abort(503, "Parameter history not enabled (see '--history-dir')")
+    return store
+
+
+def _datetime_arg(name: str, default: datetime):
+    """Return the value of a date and time query argument (as naive local time) or the default, if not specified."""
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        api.abort(400, "Invalid value {!r} for {!r}, must be an ISO 8601 date and time".format(value, name))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+@api.route("/")
+@api.response(503, "Parameter history not enabled")
+class HistoryList(Resource):
+    def get(self):
+        """Returns the names of all heat pump parameters with a history."""
+        _LOGGER.info("*** [GET] %s", request.url)
+        res = _history().names()
+        _LOGGER.debug("*** [GET] %s -> %s", request.url, res)
+        return res
+
+
+@api.route("/<string:name>")
+@api.param("name", "The parameter name")
+@api.param("start", "Start of the time range (ISO 8601), default: one hour before 'end'")
+@api.param("end", "End of the time range (ISO 8601), default: now")
+@api.param("step", "Length of the downsampling intervals in seconds (min/max/avg), default: no downsampling")
+@api.response(404, "Parameter not found")
+@api.response(400, "Invalid time range or step")
+@api.response(503, "Parameter history not enabled")
+class History(Resource):
+    @api.marshal_list_with(history_point_model, skip_none=True)
+    def get(self, name: str):
+        """Returns the history of a specific heat pump parameter in the given time range."""
+        _LOGGER.info("*** [GET] %s -- name='%s'", request.url, name)
+        store = _history()
+        index = current_app.ht_params  # type: ignore[attr-defined]
+        if name not in index:
+            api.abort(404, "Parameter {!r} not found".format(name))
+        end = _datetime_arg("end", datetime.now())
+        start = _datetime_arg("start", end - DEFAULT_RANGE)
+        if start >= end:
+            api.abort(400, "Invalid time range, 'start' must be before 'end'")
+        step = None
+        if request.args.get("step"):
+            try:
+                step = float(request.args["step"])
+            except ValueError:
+                step = -1
+            if not step > 0:
+                api.abort(400, "Invalid value {!r} for 'step', must be a positive number".format(request.args["step"]))
+        points = store.query(name, start.timestamp(), end.timestamp(), step)
+        if step is None:
+            info = index[name]
+            res = [
+                {"datetime": datetime.fromtimestamp(p.timestamp), "value": info.to_json(info.convert(p.avg))}
+                for p in points
+            ]
+        else:
+            res = [
+                {
+                    "datetime": datetime.fromtimestamp(p.timestamp),
+                    "min": p.min,
+                    "max": p.max,
+                    "avg": p.avg,
+                    "samples": p.samples,
+                }
+                for p in points
+            ]
+        _LOGGER.debug("*** [GET] %s -> %d point(s)", request.url, len(res))
+        return res
@@ -23,10 +23,10 @@ import logging
 
 from flask import current_app, request
 from flask_restx import Namespace, Resource
-from htheatpump import HtParams
 
 from .. import settings
-from .utils import HtContext, NullableParamValueField, bool_as_int, int_as_bool
+from ..scheduler import PRIORITY_WRITE
+from .utils import WRITE_SUPPRESSED_HEADER, HtContext, NullableParamValueField
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -43,7 +43,11 @@ class Overwrite(Resource):
     @api.expect(nullable_param_model)
     @api.marshal_with(nullable_param_model)
     def put(self, name: str):
-        """ Manual overwrite the current value of a specific heat pump parameter. """
+        """Manual overwrite the current value of a specific heat pump parameter.
+
+        Note: If the write filter is enabled, a write of the unchanged value or a write superseded by a later one
+        is skipped; this is reported by the 'X-Write-Suppressed' header ('unchanged' or 'superseded').
+        """
         _LOGGER.info(
             "*** [PUT%s] %s -- name='%s', payload=%s",
             " (read-only)" if settings.READ_ONLY else "",
@@ -51,19 +55,27 @@ class Overwrite(Resource):
             name,
             api.payload,
         )
-        if name not in HtParams:
+        index = current_app.ht_params  # type: ignore[attr-defined]
+        if name not in index:
             api.abort(404, "Parameter {!r} not found".format(name))
         value = api.payload["value"]
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
-            if value is not None:
-                value = int_as_bool(name, value)
-            if not settings.READ_ONLY:
-                value = current_app.ht_heatpump.overwrite_param(name, value)  # type: ignore[attr-defined]
-        res = {"value": bool_as_int(name, value) if value is not None else value}
+        if value is not None:
+            value = index.from_json(name, value)
+
+        def write():
+            with HtContext(current_app.ht_heatpump, PRIORITY_WRITE):  # type: ignore[attr-defined]
+                if settings.READ_ONLY:
+                    return value
+                return current_app.ht_heatpump.overwrite_param(name, value)  # type: ignore[attr-defined]
+
+        write_filter = current_app.ht_write_filter  # type: ignore[attr-defined]
+        value, suppressed = write_filter.write(("overwrite", name), value, write)
+        res = {"value": index.to_json(name, value) if value is not None else value}
         _LOGGER.debug(
-            "*** [PUT%s] %s -> %s",
+            "*** [PUT%s] %s -> %s%s",
             " (read-only)" if settings.READ_ONLY else "",
             request.url,
             res,
+            " (write suppressed: {})".format(suppressed) if suppressed else "",
         )
-        return res
+        return res, 200, {WRITE_SUPPRESSED_HEADER: suppressed} if suppressed else {}
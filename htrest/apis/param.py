@@ -20,14 +20,27 @@
 """ REST API for operations related to the heat pump parameters. """
 
 import logging
-from typing import Final
+from datetime import datetime
+from typing import Final, Iterable, List, Optional
 
 from flask import current_app, request
-from flask_restx import Namespace, Resource, fields
-from htheatpump import HtParams
+from flask_restx import Namespace, Resource, fields, marshal
+from htheatpump import HtParamValueType
 
 from .. import settings
-from .utils import DotKeyField, HtContext, ParamValueField, bool_as_int, int_as_bool
+from ..params import ParamInfo
+from ..scheduler import PRIORITY_BULK, PRIORITY_READ, PRIORITY_WRITE
+from ..write_queue import DONE, FAILED, MERGED, PENDING, RUNNING, WriteJob
+from .utils import (
+    WRITE_SUPPRESSED_HEADER,
+    DotKeyField,
+    HtContext,
+    NullableParamValueField,
+    ParamValueField,
+    ht_read,
+    marshal_param_list,
+    query_params,
+)
 
 _LOGGER: Final = logging.getLogger(__name__)
 
@@ -36,56 +49,188 @@ api: Final = Namespace("param", description="Operations related to the heat pump
 wildcard: Final = fields.Wildcard(DotKeyField)
 param_list_model: Final = api.model("param_list_model", {"*": wildcard})
 param_model: Final = api.model("param_model", {"value": ParamValueField})
+param_write_model: Final = api.model(
+    "param_write_model",
+    {
+        "name": fields.String(description="parameter name", required=True, readonly=True, example="HKR Soll_Raum"),
+        "value": ParamValueField(),
+        "result": NullableParamValueField(),
+        "status": fields.String(
+            description="state of the write ('merged' = superseded by a later write of the same parameter)",
+            required=True,
+            readonly=True,
+            enum=[PENDING, RUNNING, DONE, MERGED, FAILED],
+        ),
+        "error": fields.String(description="error message, if the write failed", readonly=True),
+    },
+)
+param_job_model: Final = api.model(
+    "param_job_model",
+    {
+        "id": fields.String(description="job ID", required=True, readonly=True),
+        "status": fields.String(
+            description="state of the job", required=True, readonly=True, enum=[PENDING, RUNNING, DONE, FAILED]
+        ),
+        "created": fields.DateTime(dt_format="iso8601", description="date and time of the submission", readonly=True),
+        "finished": fields.DateTime(dt_format="iso8601", description="date and time of the completion", readonly=True),
+        "writes": fields.List(fields.Nested(param_write_model), description="the single parameter writes"),
+    },
+)
+
+# name of the query argument to specify the maximal accepted age of sampled parameter values
+MAX_AGE_ARG: Final = "max_age"
+# name of the query argument to request asynchronous writes (alternatively to the header "Prefer: respond-async")
+ASYNC_ARG: Final = "async"
+
+
+def _max_age() -> Optional[float]:
+    """Return the maximal accepted age (in seconds) of sampled parameter values given by the request."""
+    value = request.args.get(MAX_AGE_ARG)
+    if value is None or value == "":
+        return None
+    try:
+        max_age = float(value)
+    except ValueError:
+        max_age = -1
+    if not max_age >= 0:
+        api.abort(400, "Invalid value {!r} for {!r}, must be a non-negative number".format(value, MAX_AGE_ARG))
+    return max_age
+
+
+def _sampled(names: List[str], max_age: Optional[float]):
+    """Return the sampled values of the given parameters and the data age header (if available)."""
+    sampler = current_app.ht_sampler  # type: ignore[attr-defined]
+    snapshot = sampler.get(names, max_age) if sampler is not None else None
+    if snapshot is None:
+        return None, {"X-Data-Age": "0"}
+    return snapshot.values, {"X-Data-Age": "{:.3f}".format(snapshot.age)}
+
+
+def _invalidate(names: Iterable[str]) -> None:
+    """Let the sampler read the given (written) parameters at its next tick."""
+    sampler = current_app.ht_sampler  # type: ignore[attr-defined]
+    if sampler is not None and not settings.READ_ONLY:
+        sampler.invalidate(names)
+
+
+def _check_limits(info: ParamInfo, value: HtParamValueType) -> None:
+    """Abort the request, if the given value is beyond the limits of the parameter."""
+    if not info.in_limits(value):
+        api.abort(
+            400,
+            "Value {!r} of parameter {!r} is beyond the limits [{}, {}]".format(
+                value, info.name, info.min_val, info.max_val
+            ),
+        )
+
+
+def _async() -> bool:
+    """Return :const:`True` if the request asks for an asynchronous processing."""
+    if "respond-async" in request.headers.get("Prefer", ""):
+        return True
+    return request.args.get(ASYNC_ARG, "").lower() in ("1", "true", "yes")
+
+
+def _job_json(job: WriteJob):
+    """Return the representation of a write job in the REST API."""
+    index = current_app.ht_params  # type: ignore[attr-defined]
+    return {
+        "id": job.id,
+        "status": job.status,
+        "created": datetime.fromtimestamp(job.created),
+        "finished": datetime.fromtimestamp(job.finished) if job.finished is not None else None,
+        "writes": [
+            {
+                "name": entry.name,
+                "value": index.to_json(entry.name, entry.value),
+                "result": index.to_json(entry.name, entry.result) if entry.result is not None else None,
+                "status": entry.status,
+                "error": entry.error,
+            }
+            for entry in job.entries
+        ],
+    }
 
 
 @api.route("/")
 class ParamList(Resource):
-    @api.marshal_with(param_list_model)
+    @marshal_param_list(api, param_list_model)
     @api.response(404, "Parameter(s) not found")
+    @api.param(MAX_AGE_ARG, "The maximal accepted age in seconds of sampled parameter values", type=float)
     def get(self):
         """Returns a subset or complete list of the known heat pump parameters with their current value."""
         _LOGGER.info("*** [GET] %s", request.url)
-        params = list(request.args.keys())
-        unknown = [name for name in params if name not in HtParams]
+        max_age = _max_age()
+        index = current_app.ht_params  # type: ignore[attr-defined]
+        params = [name for name in request.args.keys() if name != MAX_AGE_ARG]
+        unknown = index.unknown(params)
         if unknown:
             api.abort(
                 404,
                 "Parameter(s) {} not found".format(", ".join(repr(name) for name in unknown)),
             )
         if not params:
-            params = list(HtParams.keys())
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
-            res = {}
-            for name in params:
-                value = current_app.ht_heatpump.get_param(name)  # type: ignore[attr-defined]
-                res.update({name: bool_as_int(name, value)})
+            params = index.names
+        values, headers = _sampled(params, max_age)
+        calls = 0
+        if values is None:
+            ht_heatpump = current_app.ht_heatpump  # type: ignore[attr-defined]
+            values, calls = ht_read(
+                ht_heatpump,
+                ("query_params", tuple(params)),
+                lambda: query_params(ht_heatpump, params, index),
+                PRIORITY_BULK if len(params) > 1 else PRIORITY_READ,
+            )
+        # number of serial calls compared to individual requests of all parameters
+        headers.update({"X-Serial-Calls": str(calls), "X-Serial-Calls-Saved": str(len(params) - calls)})
+        res = index.values_to_json(values)
         _LOGGER.debug("*** [GET] %s -> %s", request.url, res)
-        return res
+        return res, 200, headers
 
     @api.expect(param_list_model)
-    @api.marshal_with(param_list_model)
+    @marshal_param_list(api, param_list_model)
     @api.response(404, "Parameter(s) not found")
+    @api.response(400, "Value(s) beyond the parameter limits")
+    @api.response(202, "Writes accepted (asynchronous mode)", param_job_model)
+    @api.param(ASYNC_ARG, "Perform the writes asynchronously (same as header 'Prefer: respond-async')", type=bool)
     def put(self):
-        """Sets the current value of several heat pump parameters."""
+        """Sets the current value of several heat pump parameters.
+
+        Note: In the asynchronous mode the writes are queued and the request is answered with 202 and a job ID;
+        the state of the job can be requested by 'GET /param/jobs/<job_id>'. Pending writes to the same
+        parameter are merged, so that only the last value is sent to the heat pump.
+        """
         _LOGGER.info(
             "*** [PUT%s] %s -- payload=%s",
             " (read-only)" if settings.READ_ONLY else "",
             request.url,
             api.payload,
         )
-        unknown = [name for name in api.payload.keys() if name not in HtParams]
+        index = current_app.ht_params  # type: ignore[attr-defined]
+        unknown = index.unknown(api.payload.keys())
         if unknown:
             api.abort(
                 404,
                 "Parameter(s) {} not found".format(", ".join(repr(name) for name in unknown)),
             )
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
+        values = index.values_from_json(api.payload)
+        for name, value in values.items():
+            _check_limits(index[name], value)
+        if _async():
+            job = current_app.ht_write_queue.submit(values)  # type: ignore[attr-defined]
+            _LOGGER.debug("*** [PUT] %s -> job %s", request.url, job.id)
+            location = api.apis[0].url_for(ParamJob, job_id=job.id)
+            return marshal(_job_json(job), param_job_model), 202, {"Location": location}
+        write_filter = current_app.ht_write_filter  # type: ignore[attr-defined]
+        with HtContext(current_app.ht_heatpump, PRIORITY_WRITE):  # type: ignore[attr-defined]
             res = {}
-            for name, value in api.payload.items():
-                value = int_as_bool(name, value)
+            for name, value in values.items():
                 if not settings.READ_ONLY:
                     value = current_app.ht_heatpump.set_param(name, value)  # type: ignore[attr-defined]
-                res.update({name: bool_as_int(name, value)})
+                    write_filter.record(("param", name), value)
+                res.update({name: value})
+        _invalidate(res.keys())
+        res = index.values_to_json(res)
         _LOGGER.debug(
             "*** [PUT%s] %s -> %s",
             " (read-only)" if settings.READ_ONLY else "",
@@ -100,21 +245,32 @@ class ParamList(Resource):
 @api.response(404, "Parameter not found")
 class Param(Resource):
     @api.marshal_with(param_model)
+    @api.param(MAX_AGE_ARG, "The maximal accepted age in seconds of a sampled parameter value", type=float)
     def get(self, name: str):
         """Returns the current value of a specific heat pump parameter."""
         _LOGGER.info("*** [GET] %s -- name='%s'", request.url, name)
-        if name not in HtParams:
+        index = current_app.ht_params  # type: ignore[attr-defined]
+        if name not in index:
             api.abort(404, "Parameter {!r} not found".format(name))
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
-            value = current_app.ht_heatpump.get_param(name)  # type: ignore[attr-defined]
-        res = {"value": bool_as_int(name, value)}
+        values, headers = _sampled([name], _max_age())
+        if values is not None:
+            value = values[name]
+        else:
+            ht_heatpump = current_app.ht_heatpump  # type: ignore[attr-defined]
+            value = ht_read(ht_heatpump, ("get_param", name), lambda: ht_heatpump.get_param(name))
+        res = {"value": index.to_json(name, value)}
         _LOGGER.debug("*** [GET] %s -> %s", request.url, res)
-        return res
+        return res, 200, headers
 
     @api.expect(param_model)
     @api.marshal_with(param_model)
+    @api.response(400, "Value beyond the parameter limits")
     def put(self, name: str):
-        """Sets the current value of a specific heat pump parameter."""
+        """Sets the current value of a specific heat pump parameter.
+
+        Note: If the write filter is enabled, a write of the unchanged value or a write superseded by a later one
+        is skipped; this is reported by the 'X-Write-Suppressed' header ('unchanged' or 'superseded').
+        """
         _LOGGER.info(
             "*** [PUT%s] %s -- name='%s', payload=%s",
             " (read-only)" if settings.READ_ONLY else "",
@@ -122,18 +278,44 @@ class Param(Resource):
             name,
             api.payload,
         )
-        if name not in HtParams:
+        index = current_app.ht_params  # type: ignore[attr-defined]
+        if name not in index:
             api.abort(404, "Parameter {!r} not found".format(name))
-        value = api.payload["value"]
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
-            value = int_as_bool(name, value)
-            if not settings.READ_ONLY:
-                value = current_app.ht_heatpump.set_param(name, value)  # type: ignore[attr-defined]
-        res = {"value": bool_as_int(name, value)}
+        value = index.from_json(name, api.payload["value"])
+        _check_limits(index[name], value)
+
+        def write():
+            with HtContext(current_app.ht_heatpump, PRIORITY_WRITE):  # type: ignore[attr-defined]
+                if settings.READ_ONLY:
+                    return value
+                return current_app.ht_heatpump.set_param(name, value)  # type: ignore[attr-defined]
+
+        write_filter = current_app.ht_write_filter  # type: ignore[attr-defined]
+        value, suppressed = write_filter.write(("param", name), value, write)
+        if not suppressed:
+            _invalidate([name])
+        res = {"value": index.to_json(name, value)}
         _LOGGER.debug(
-            "*** [PUT%s] %s -> %s",
+            "*** [PUT%s] %s -> %s%s",
             " (read-only)" if settings.READ_ONLY else "",
             request.url,
             res,
+            " (write suppressed: {})".format(suppressed) if suppressed else "",
         )
+        return res, 200, {WRITE_SUPPRESSED_HEADER: suppressed} if suppressed else {}
+
+
+@api.route("/jobs/<string:job_id>")
+@api.param("job_id", "The ID of the write job")
+@api.response(404, "Job not found")
+class ParamJob(Resource):
+    @api.marshal_with(param_job_model)
+    def get(self, job_id: str):
+        """Returns the state of an asynchronous write job with the results of the single parameter writes."""
+        _LOGGER.info("*** [GET] %s -- job_id='%s'", request.url, job_id)
+        job = current_app.ht_write_queue.get(job_id)  # type: ignore[attr-defined]
+        if job is None:
+            api.abort(404, "Job {!r} not found".format(job_id))
+        res = _job_json(job)
+        _LOGGER.debug("*** [GET] %s -> %s", request.url, res)
         return res
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" REST API for streaming the changes of the heat pump parameters (Server-Sent Events). """
+
+import json
+import logging
+from typing import Final
+
+from flask import Response, current_app, request, stream_with_context
+from flask_restx import Namespace, Resource
+
+from ..feed import ParamSubscription
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+api: Final = Namespace("stream", description="Streaming of the heat pump parameter changes (Server-Sent Events).")
+
+# interval in seconds for sending a keep-alive comment if nothing changed
+KEEP_ALIVE_INTERVAL: Final = 15.0
+
+
+def _sse(event: str, data: object, event_id: str = "") -> str:
+    """Format a Server-Sent Event."""
+    lines = ["event: {}".format(event)]
+    if event_id:
+        lines.append("id: {}".format(event_id))
+    lines.append("data: {}".format(json.dumps(data)))
+    return "\n".join(lines) + "\n\n"
+
+
+@api.route("/")
+@api.response(404, "Parameter(s) not found")
+@api.response(400, "Invalid deadband value(s)")
+@api.response(503, "Parameter sampling not enabled")
+class ParamStream(Resource):
+    @api.produces(["text/event-stream"])
+    def get(self):
+        """Streams the changed values of a subset or all heat pump parameters as Server-Sent Events.
+        Note: The query arguments are the parameter names with an optional deadband as value
+        (e.g. '?Temp. Aussen=0.5&Stoerung'); a numeric value is only sent if it differs by more than the deadband.
+        """
+        _LOGGER.info("*** [GET] %s", request.url)
+        sampler = current_app.ht_sampler  # type: ignore[attr-defined]
+        if sampler is None:
+            api.abort(503, "Parameter sampling not enabled (see '--sample-interval')")
+        index = current_app.ht_params  # type: ignore[attr-defined]
+        unknown = index.unknown(request.args.keys())
+        if unknown:
+            api.abort(
+                404,
+                "Parameter(s) {} not found".format(", ".join(repr(name) for name in unknown)),
+            )
+        deadbands = {}
+        for name, value in request.args.items():
+            try:
+                deadbands[name] = float(value) if value else 0.0
+            except ValueError:
+                deadbands[name] = -1
+            if not deadbands[name] >= 0:
+                api.abort(400, "Invalid deadband {!r} for parameter {!r}".format(value, name))
+        if not deadbands:
+            deadbands = {name: 0.0 for name in index.names}
+
+        def generate():
+            with ParamSubscription(sampler, deadbands) as subscription:
+                _LOGGER.debug("*** [GET] %s -- subscribed", request.url)
+                while True:
+                    delta = subscription.next_delta(KEEP_ALIVE_INTERVAL)
+                    if delta is None:
+                        yield ": keep-alive\n\n"
+                        continue
+                    values = index.values_to_json(delta.values)
+                    yield _sse("update", values, "{:.3f}".format(delta.timestamp))
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
@@ -26,9 +26,12 @@ from flask import current_app, request
 from flask_restx import Namespace, Resource, fields
 from htheatpump import TimeProgEntry as HtTimeProgEntry
 from htheatpump import TimeProgram as HtTimeProg
+from werkzeug.http import quote_etag
 
 from .. import settings
-from .utils import HtContext
+from ..scheduler import PRIORITY_BULK, PRIORITY_WRITE
+from ..timeprog_cache import etag_of
+from .utils import HtContext, ht_read
 
 _LOGGER: Final = logging.getLogger(__name__)
 
@@ -115,36 +118,65 @@ time_prog_with_entries_model: Final = api.clone(
 )
 
 
+def _conditional(res, not_modified):
+    """Return the response data with an ETag header or an empty 304 response if the client's copy is up to date."""
+    etag = etag_of(res)
+    headers = {"ETag": quote_etag(etag)}
+    if request.if_none_match.contains(etag):
+        return not_modified, 304, headers
+    return res, 200, headers
+
+
+def _time_prog(identifier: int):
+    """Return the (cached) JSON representation of the time program with the given index including its entries."""
+    ht_timeprog_cache = current_app.ht_timeprog_cache  # type: ignore[attr-defined]
+    res = ht_timeprog_cache.get(identifier)
+    if res is None:
+        ht_heatpump = current_app.ht_heatpump  # type: ignore[attr-defined]
+        time_prog = ht_read(
+            ht_heatpump, ("get_time_prog", identifier), lambda: ht_heatpump.get_time_prog(identifier), PRIORITY_BULK
+        )
+        res = time_prog.as_json(with_entries=True)
+        ht_timeprog_cache.put(identifier, res)
+    return res
+
+
 @api.route("/")
+@api.response(304, "Not modified")
 class TimeProgs(Resource):
     @api.marshal_list_with(time_prog_model, skip_none=True)
     def get(self):
         """Returns a list of all available time programs of the heat pump."""
         _LOGGER.info("*** [GET] %s", request.url)
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
-            time_progs = current_app.ht_heatpump.get_time_progs()  # type: ignore[attr-defined]
-        res = [time_prog.as_json(with_entries=False) for time_prog in time_progs]
+        ht_timeprog_cache = current_app.ht_timeprog_cache  # type: ignore[attr-defined]
+        res = ht_timeprog_cache.get_list()
+        if res is None:
+            ht_heatpump = current_app.ht_heatpump  # type: ignore[attr-defined]
+            time_progs = ht_read(ht_heatpump, ("get_time_progs",), ht_heatpump.get_time_progs, PRIORITY_BULK)
+            res = [time_prog.as_json(with_entries=False) for time_prog in time_progs]
+            ht_timeprog_cache.put_list(res)
         _LOGGER.debug("*** [GET] %s -> %s", request.url, res)
-        return res
+        return _conditional(res, [])
 
 
-@api.route("/<int:id>")
-@api.param("id", "The time program index")
+@api.route("/<int:identifier>")
+@api.param("identifier", "The time program index")
 class TimeProg(Resource):
     @api.marshal_with(time_prog_with_entries_model, skip_none=True)
+    @api.response(304, "Not modified")
     def get(self, identifier: int):
         """Returns the time program with the given index of the heat pump."""
         _LOGGER.info("*** [GET] %s -- id=%d", request.url, identifier)
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
-            time_prog = current_app.ht_heatpump.get_time_prog(identifier)  # type: ignore[attr-defined]
-        res = time_prog.as_json(with_entries=True)
+        res = _time_prog(identifier)
         _LOGGER.debug("*** [GET] %s -> %s", request.url, res)
-        return res
+        return _conditional(res, {})
 
     @api.expect(time_prog_with_entries_model, validate=True)
     @api.marshal_with(time_prog_with_entries_model)
     def put(self, identifier: int):
-        """Sets all time program entries of a specific time program of the heat pump."""
+        """Sets all time program entries of a specific time program of the heat pump.
+        Note: Only the entries which differ from the current ones are written to the heat pump.
+        """
         _LOGGER.info(
             "*** [PUT%s] %s -- id=%d, payload=%s",
             " (read-only)" if settings.READ_ONLY else "",
@@ -152,38 +184,76 @@ class TimeProg(Resource):
             identifier,
             api.payload,
         )
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
-            time_prog = current_app.ht_heatpump.get_time_prog(  # type: ignore[attr-defined]
-                identifier, with_entries=False
-            ).as_json(with_entries=False)
+        ht_heatpump = current_app.ht_heatpump  # type: ignore[attr-defined]
+        ht_timeprog_cache = current_app.ht_timeprog_cache  # type: ignore[attr-defined]
+        written = 0
+        with HtContext(ht_heatpump, PRIORITY_WRITE):
+            # current time program (cached or freshly read) to determine the changed entries; read directly
+            # and not merged with reads in flight, which would wait for the heat pump held by this context
+            current = ht_timeprog_cache.get(identifier)
+            if current is None:
+                current = ht_heatpump.get_time_prog(identifier).as_json(with_entries=True)
+            time_prog = {key: value for key, value in current.items() if key != "entries"}
             time_prog.update({"entries": api.payload["entries"]})
-            time_prog = HtTimeProg.from_json(time_prog)
-            if not settings.READ_ONLY:
-                time_prog = current_app.ht_heatpump.set_time_prog(time_prog)  # type: ignore[attr-defined]
-        res = time_prog.as_json(with_entries=True)
+            time_prog = HtTimeProg.from_json(time_prog)  # verifies the new entries
+            res = time_prog.as_json(with_entries=True)
+            for day, day_entries in enumerate(res["entries"]):
+                for num, entry in enumerate(day_entries):
+                    try:
+                        current_entry = current["entries"][day][num]
+                    except IndexError:
+                        current_entry = None
+                    if entry is None:
+                        day_entries[num] = current_entry
+                        continue
+                    if entry == current_entry or settings.READ_ONLY:
+                        continue
+                    try:
+                        entry = ht_heatpump.set_time_prog_entry(
+                            identifier, day, num, HtTimeProgEntry.from_json(entry)
+                        ).as_json()
+                    except Exception:
+                        ht_timeprog_cache.invalidate(identifier)  # state of the time program is unknown
+                        raise
+                    day_entries[num] = entry
+                    written += 1
+        if not settings.READ_ONLY:
+            ht_timeprog_cache.put(identifier, res)
         _LOGGER.debug(
-            "*** [PUT%s] %s -> %s",
+            "*** [PUT%s] %s -> %s (%d entries written)",
             " (read-only)" if settings.READ_ONLY else "",
             request.url,
             res,
+            written,
         )
-        return res
+        return res, 200, {"X-Entries-Written": str(written)}
 
 
-@api.route("/<int:id>/<int:day>/<int:num>")
-@api.param("id", "The time program index")
+@api.route("/<int:identifier>/<int:day>/<int:num>")
+@api.param("identifier", "The time program index")
 @api.param("day", "The day of the time program entry (inside the specified time program)")
 @api.param("num", "The number of the time program entry (of the specified day)")
 class TimeProgEntry(Resource):
     @api.marshal_with(time_prog_entry_model)
+    @api.response(304, "Not modified")
     def get(self, identifier: int, day: int, num: int):
         """Returns a specific time program entry of the heat pump."""
         _LOGGER.info("*** [GET] %s -- id=%d, day=%d, num=%d", request.url, identifier, day, num)
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
-            entry = current_app.ht_heatpump.get_time_prog_entry(identifier, day, num)  # type: ignore[attr-defined]
-        res = entry.as_json()
+        time_prog = current_app.ht_timeprog_cache.get(identifier)  # type: ignore[attr-defined]
+        try:
+            res = time_prog["entries"][day][num] if time_prog is not None else None
+        except IndexError:
+            res = None
+        if res is None:
+            ht_heatpump = current_app.ht_heatpump  # type: ignore[attr-defined]
+            entry = ht_read(
+                ht_heatpump,
+                ("get_time_prog_entry", identifier, day, num),
+                lambda: ht_heatpump.get_time_prog_entry(identifier, day, num),
+            )
+            res = entry.as_json()
         _LOGGER.debug("*** [GET] %s -> %s", request.url, res)
-        return res
+        return _conditional(res, {})
 
     @api.expect(time_prog_entry_model, validate=True)
     @api.marshal_with(time_prog_entry_model)
@@ -198,16 +268,23 @@ class TimeProgEntry(Resource):
             num,
             api.payload,
         )
+        ht_timeprog_cache = current_app.ht_timeprog_cache  # type: ignore[attr-defined]
         entry = HtTimeProgEntry.from_json(api.payload)
-        with HtContext(current_app.ht_heatpump):  # type: ignore[attr-defined]
+        with HtContext(current_app.ht_heatpump, PRIORITY_WRITE):  # type: ignore[attr-defined]
             if not settings.READ_ONLY:
-                entry = current_app.ht_heatpump.set_time_prog_entry(  # type: ignore[attr-defined]
-                    identifier,
-                    day,
-                    num,
-                    entry,
-                )
+                try:
+                    entry = current_app.ht_heatpump.set_time_prog_entry(  # type: ignore[attr-defined]
+                        identifier,
+                        day,
+                        num,
+                        entry,
+                    )
+                except Exception:
+                    ht_timeprog_cache.invalidate(identifier)  # state of the time program is unknown
+                    raise
         res = entry.as_json()
+        if not settings.READ_ONLY:
+            ht_timeprog_cache.set_entry(identifier, day, num, res)
         _LOGGER.debug(
             "*** [PUT%s] %s -> %s",
             " (read-only)" if settings.READ_ONLY else "",
@@ -20,27 +20,47 @@
 """ Miscellaneous helper functions and classes for the REST API. """
 
 from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Final, Hashable, Iterable, Tuple
 
-from flask_restx import fields
-from htheatpump import HtDataTypes, HtHeatpump, HtParams, HtParamValueType
+from flask_restx import Model, Namespace, fields
+from flask_restx.utils import unpack
+from htheatpump import HtHeatpump, HtParamValueType
+from werkzeug.exceptions import HTTPException
 
-from .. import settings
+from ..params import ParamIndex
+from ..scheduler import PRIORITY_READ
+from ..session import HtSession
+
+# response header which reports a write suppressed by the :class:`~htrest.write_filter.WriteFilter`
+WRITE_SUPPRESSED_HEADER: Final = "X-Write-Suppressed"
 
 
 class HtContext:
     """Context manager for auto login/logout on the heat pump.
 
+    The access to the heat pump is serialized by its :class:`~htrest.session.HtSession`, so the
+    context manager can be used concurrently from several threads (e.g. the request handlers and the
+    background parameter sampler). Depending on the session, the heat pump stays logged in across
+    several contexts.
+
     Example:
 
     >>> with HtContext(ht_heatpump):
     ...     print(ht_heatpump.get_version())
     ...
     >>>
+
+    :param heatpump: The :class:`HtHeatpump` instance.
+    :type heatpump: ``HtHeatpump``
+    :param priority: The priority of the access, see :mod:`htrest.scheduler` (default ``PRIORITY_READ``).
+    :type priority: int
     """
 
-    def __init__(self, heatpump: HtHeatpump):
+    def __init__(self, heatpump: HtHeatpump, priority: int = PRIORITY_READ):
         assert heatpump is not None, "'ht_heatpump' must not be None"
         self._heatpump = heatpump
+        self._priority = priority
 
     @property
     def heatpump(self):
@@ -52,11 +72,39 @@ class HtContext:
         return self._heatpump
 
     def __enter__(self):
-        self._heatpump.login()  # Hint: login() will also try a reconnect on failure
+        HtSession.of(self._heatpump).acquire(self._priority)
         return self
 
-    def __exit__(self, *args):
-        self._heatpump.logout()
+    def __exit__(self, exc_type, exc_value, traceback):
+        # an aborted request (e.g. 404) isn't a failure of the connection
+        failed = exc_type is not None and not issubclass(exc_type, HTTPException)
+        HtSession.of(self._heatpump).release(failed=failed)
+
+
+def ht_read(heatpump: HtHeatpump, key: Hashable, func: Callable[[], Any], priority: int = PRIORITY_READ) -> Any:
+    """Perform a read operation on the heat pump inside a :class:`HtContext`, whereby identical
+    read operations (with the same key) which are in flight at the same time are merged.
+
+    Example:
+
+    >>> value = ht_read(ht_heatpump, ("get_param", name), lambda: ht_heatpump.get_param(name))
+
+    :param heatpump: The :class:`HtHeatpump` instance.
+    :type heatpump: ``HtHeatpump``
+    :param key: The key which identifies the read operation.
+    :type key: Hashable
+    :param func: The read operation.
+    :type func: Callable
+    :param priority: The priority of the access, see :mod:`htrest.scheduler` (default ``PRIORITY_READ``).
+    :type priority: int
+    :returns: The (shared) result of the read operation; must not be modified by the caller!
+    """
+
+    def read():
+        with HtContext(heatpump, priority):
+            return func()
+
+    return HtSession.of(heatpump).single_flight.do(key, read)
 
 
 class ParamValueField(fields.Raw):
@@ -126,15 +174,76 @@ class DotKeyField(ParamValueField):
         self.attribute = attribute
 
 
-def bool_as_int(name: str, value: HtParamValueType) -> HtParamValueType:
-    """Convert a boolean value to an integer, if desired (:const:`False` = 0, :const:`True` = 1)."""
-    if settings.BOOL_AS_INT and HtParams[name].data_type == HtDataTypes.BOOL:
-        return 1 if value else 0
-    return value
+def format_param_list(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the marshalled representation of a parameter list (parameter name -> value).
+
+    This is the same result as marshalling with a wildcard model of :class:`DotKeyField`, but in a single
+    pass and with the (dotted) parameter names kept verbatim. Like the wildcard marshalling of flask_restx,
+    the entries are emitted in reverse order, so that the JSON responses stay exactly the same.
+
+    :param data: The parameter values by parameter name.
+    :type data: dict
+    :returns: The marshalled parameter list.
+    :rtype: ``dict``
+    """
+    return dict(reversed(data.items()))
+
 
+def marshal_param_list(api: Namespace, model: Model) -> Callable:
+    """Decorator to marshal the parameter list returned by a resource method; a fast replacement for
+    ``api.marshal_with(model)`` where ``model`` is a wildcard model of :class:`DotKeyField`.
 
-def int_as_bool(name: str, value: HtParamValueType) -> HtParamValueType:
-    """Convert an integer value to a boolean, if desired (``0`` = :const:`False`, anything else :const:`True`)."""
-    if settings.BOOL_AS_INT and HtParams[name].data_type == HtDataTypes.BOOL:
-        return bool(value)
-    return value
+    The wildcard marshalling of flask_restx copies and transforms the whole parameter list for each of its
+    entries (see :class:`DotKeyField`), which results in quadratic costs for a list of all parameters.
+
+    :param api: The namespace of the resource.
+    :type api: ``Namespace``
+    :param model: The (wildcard) model used for the API documentation.
+    :type model: ``Model``
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            resp = func(*args, **kwargs)
+            if isinstance(resp, tuple):
+                data, code, headers = unpack(resp)
+                # only the successful responses are parameter lists (e.g. not "202 Accepted")
+                return (format_param_list(data) if code == 200 else data), code, headers
+            return format_param_list(resp)
+
+        return api.response(200, "Success", model)(wrapper)
+
+    return decorator
+
+
+def query_params(
+    heatpump: HtHeatpump, names: Iterable[str], index: ParamIndex
+) -> Tuple[Dict[str, HtParamValueType], int]:
+    """Read the current values of the given heat pump parameters with as few serial calls as possible.
+
+    All parameters representing a 'MP' data point are read by a single fast query, the remaining ones
+    by individual requests. Must be called inside a :class:`HtContext`.
+
+    :param heatpump: The :class:`HtHeatpump` instance.
+    :type heatpump: ``HtHeatpump``
+    :param names: The names of the parameters to read.
+    :type names: Iterable[str]
+    :param index: The index of the parameter definitions.
+    :type index: ``ParamIndex``
+    :returns: A dict of the parameters with their values (in the requested order) and the number
+        of performed serial calls.
+    :rtype: ``tuple`` ( dict, int )
+    """
+    names = list(names)
+    mp_names = [name for name in names if index.is_mp(name)]
+    values: Dict[str, HtParamValueType] = {}
+    calls = 0
+    if len(mp_names) > 1:
+        values.update(heatpump.fast_query(*mp_names))
+        calls += 1
+    for name in names:
+        if name not in values:
+            values[name] = heatpump.get_param(name)
+            calls += 1
+    return {name: values[name] for name in names}, calls
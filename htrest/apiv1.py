@@ -20,23 +20,31 @@
 """ Heliotherm heat pump REST API server APIv1. """
 
 import logging
+import time
 from typing import Final
 
-from flask import Blueprint  # , current_app, request
+from flask import Blueprint, current_app, g, request
 from flask_restx import Api
 
 from .apis.date_time import api as ns3
 from .apis.device import api as ns1
 from .apis.fast_query import api as ns5
 from .apis.fault_list import api as ns2
+from .apis.history import api as ns9
 from .apis.param import api as ns4
 from .apis.time_prog import api as ns6
 from .apis.overwrite import api as ns7
+from .apis.stream import api as ns8
+from .profiling import PROFILE_SAMPLES_HEADER
+from .startup import RETRY_AFTER
 
 _LOGGER: Final = logging.getLogger(__name__)
 
 blueprint: Final = Blueprint("api", __name__, url_prefix="/api/v1")
 
+# endpoints which are served without a connection to the heat pump (OpenAPI document and Swagger UI)
+_STATIC: Final = ("api.specs", "api.doc", "api.root")
+
 api: Final = Api(
     blueprint,
     title="HtREST",
@@ -51,6 +59,8 @@ api.add_namespace(ns4)
 api.add_namespace(ns5)
 api.add_namespace(ns6)
 api.add_namespace(ns7)
+api.add_namespace(ns8)
+api.add_namespace(ns9)
 
 
 @blueprint.before_request
@@ -64,19 +74,46 @@ def before_request():
     # except Exception as ex:
     #     _LOGGER.error(ex)
     #     raise
-    pass
+    if not current_app.ht_connector.ready and request.endpoint not in _STATIC:  # type: ignore[attr-defined]
+        # answered here instead of raising an exception, since flask_restx logs a stack trace for every 5xx error
+        return {"message": "not connected to the heat pump (yet)"}, 503, {"Retry-After": str(RETRY_AFTER)}
+    g.ht_request_start = time.perf_counter()
+    profiler = current_app.ht_profiler  # type: ignore[attr-defined]
+    if profiler.enabled and profiler.wanted(request.headers):
+        g.ht_profile = profiler.start()
 
 
 @blueprint.after_request
 def after_request(response):
     # _LOGGER.debug("*** @blueprint.after_request -- %s -- %s", __file__, response)
+    start = g.get("ht_request_start")
+    if start is not None:
+        current_app.ht_metrics.observe(  # type: ignore[attr-defined]
+            "htrest_request_duration_seconds",
+            "Duration of the REST API requests.",
+            time.perf_counter() - start,
+            namespace=_namespace(),
+            method=request.method,
+            code=str(response.status_code),
+        )
+    ident = g.pop("ht_profile", None)
+    if ident is not None:
+        samples = current_app.ht_profiler.stop(ident, _namespace())  # type: ignore[attr-defined]
+        response.headers[PROFILE_SAMPLES_HEADER] = str(samples)
     return response
 
 
 @blueprint.teardown_request
 def teardown_request(exc):  # pylint: disable=W0613
     # _LOGGER.debug("*** @blueprint.teardown_request -- %s -- %s", __file__, exc)
-    pass
+    ident = g.pop("ht_profile", None)
+    if ident is not None:  # the request failed before its response was created
+        current_app.ht_profiler.stop(ident, _namespace())  # type: ignore[attr-defined]
+
+
+def _namespace() -> str:
+    path = request.path[len(blueprint.url_prefix or ""):]
+    return path.strip("/").partition("/")[0] or "root"
 
 
 @api.errorhandler
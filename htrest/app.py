@@ -25,9 +25,30 @@ from typing import Final, Optional
 
 from flask import Flask, current_app
 from flask_basicauth import BasicAuth
-from htheatpump import HtHeatpump, VerifyAction
+from htheatpump import HtHeatpump, HtParamValueType, VerifyAction
 
 from . import settings
+from .clock import ClockSync
+from .exporter import blueprint as metrics_blueprint
+from .exporter import register_collectors
+from .fault_cache import FaultListCache
+from .history import HistoryStore
+from .identity import DeviceRegistry
+from .metrics import MetricsRegistry
+from .params import ParamIndex
+from .profiling import RequestProfiler
+from .profiling import blueprint as profile_blueprint
+from .sampler import ADAPTIVE, FAST, ParamSampler, PollSchedule, load_classes
+from .session import HtSession
+from .simulator import HtHeatpumpSimulator
+from .startup import HtConnector, cache_spec
+from .startup import blueprint as health_blueprint
+from .subscriptions import SubscriptionHub
+from .timeprog_cache import TimeProgCache
+from .tracing import SerialTracer
+from .tracing import blueprint as debug_blueprint
+from .write_filter import WriteFilter
+from .write_queue import WriteQueue
 
 _LOGGER: Final = logging.getLogger(__name__)
 
@@ -39,29 +60,167 @@ def create_app(
     bool_as_int: bool = False,
     read_only: bool = False,
     no_param_verification: bool = False,
+    sample_interval: float = 0,
+    session_timeout: float = 0,
+    history_dir: str = "",
+    history_retention: float = 30,
+    fault_cache: str = "",
+    timeprog_cache_ttl: float = 0,
+    simulate: bool = False,
+    write_filter_ttl: float = 0,
+    write_debounce: float = 0,
+    subscription_interval: float = 1,
+    adaptive_sampling: bool = False,
+    sample_classes: str = "",
+    clock_sync_interval: float = 0,
+    clock_max_offset: float = 0,
+    trace_file: str = "",
+    profile_token: str = "",
+    profile_every: int = 0,
+    profile_dir: str = "",
+    lazy_connect: bool = False,
 ) -> Flask:
-    # try to connect to the heat pump
-    ht_heatpump: Final = HtHeatpump(device, baudrate=baudrate)
+    # the heat pump (or the heat pump simulator, if desired); the serial device is opened exclusively,
+    # so that the server stays its only owner
+    ht_heatpump: Final = (
+        HtHeatpumpSimulator(device, baudrate=baudrate)
+        if simulate
+        else HtHeatpump(device, baudrate=baudrate, exclusive=True)
+    )
+    ht_metrics: Final = MetricsRegistry()
+    # trace the operations on the heat pump (latency histograms, the serial call metrics and an optional trace file)
+    ht_tracer: Final = SerialTracer(trace_file, metrics=ht_metrics)
+    ht_tracer.instrument(ht_heatpump)
+    # profile the REST API requests on demand (if desired)
+    ht_profiler: Final = RequestProfiler(profile_token, every=profile_every, directory=profile_dir)
     if no_param_verification:
         ht_heatpump.verify_param_action = VerifyAction.NONE()
-    _LOGGER.info("open connection to heat pump (%s)", ht_heatpump)
-    try:
-        ht_heatpump.open_connection()
-        ht_heatpump.login()
-        _LOGGER.info("successfully connected to heat pump #%d", ht_heatpump.get_serial_number())
-        _LOGGER.info("software version = %s (%d)", *ht_heatpump.get_version())
-    except Exception as ex:
-        _LOGGER.error(ex)
-        raise
-    finally:
-        ht_heatpump.logout()
-
-    def on_exit_app(ht_hp: HtHeatpump):
+
+    # index of the parameter definitions (incl. the conversion of the values for the REST API)
+    ht_params: Final = ParamIndex(bool_as_int)
+
+    # identity of the heat pump, which is read once at connect time and only refreshed after a reconnect
+    ht_device: Final = DeviceRegistry(ht_heatpump, device, baudrate, index=ht_params)
+
+    # model of the clock offset of the heat pump (measured on a schedule, if desired)
+    ht_clock: Final = ClockSync(ht_heatpump, clock_sync_interval, max_offset=clock_max_offset)
+
+    # cache of the (append-only) fault list
+    ht_fault_cache: Final = FaultListCache(ht_heatpump, fault_cache)
+
+    # write-through cache of the time programs
+    ht_timeprog_cache: Final = TimeProgCache(timeprog_cache_ttl)
+
+    # filter for repeated writes of the same parameter (suppression of unchanged values and debouncing)
+    ht_write_filter: Final = WriteFilter(ttl=write_filter_ttl, debounce=write_debounce)
+
+    def on_param_written(name: str, value: HtParamValueType) -> None:
+        ht_write_filter.record(("param", name), value)
+        if ht_sampler is not None:
+            ht_sampler.invalidate([name])
+
+    # queue for the asynchronous parameter writes
+    ht_write_queue: Final = WriteQueue(ht_heatpump, on_write=on_param_written)
+
+    # keep the heat pump logged in across several requests (if desired)
+    ht_session: Final = HtSession.register(ht_heatpump, session_timeout)
+
+    # per-parameter sampling schedule (if desired); without one all parameters are read at every tick
+    ht_schedule: Optional[PollSchedule] = None
+    if sample_interval > 0 and (adaptive_sampling or sample_classes):
+        classes = load_classes(sample_classes) if sample_classes else {}
+        unknown = ht_params.unknown(classes.keys())
+        if unknown:
+            raise ValueError("unknown parameter(s) {} in {!r}".format(", ".join(map(repr, unknown)), sample_classes))
+        ht_schedule = PollSchedule(
+            ht_params.names, sample_interval, classes, default=ADAPTIVE if adaptive_sampling else FAST
+        )
+        _LOGGER.info("sampling schedule: %d configured class(es), adaptive=%s", len(classes), adaptive_sampling)
+
+    # start the background sampling of the heat pump parameters (if desired)
+    ht_sampler: Final = (
+        ParamSampler(ht_heatpump, sample_interval, index=ht_params, schedule=ht_schedule)
+        if sample_interval > 0
+        else None
+    )
+    # record the sampled parameter values in the history store (if desired)
+    ht_history: Optional[HistoryStore] = None
+    if history_dir:
+        if ht_sampler is None:
+            _LOGGER.warning("parameter history disabled, because the parameter sampling is not enabled")
+        else:
+            ht_history = HistoryStore(history_dir, retention=history_retention * 86400)
+            ht_sampler.add_listener(ht_history.append)
+            _LOGGER.info("record parameter history in %r (retention=%.1f days)", history_dir, history_retention)
+
+    # live subscriptions on parameters (the sampling thread is only started on the first subscription)
+    ht_subscriptions: Final = SubscriptionHub(ht_heatpump, subscription_interval, index=ht_params)
+
+    if ht_sampler is not None and ht_write_filter.enabled:
+        # take changes of the parameter values which weren't made by the REST API into account
+        ht_sampler.add_listener(lambda snapshot: ht_write_filter.observe(snapshot.values, snapshot.timestamp))
+
+    def on_connect() -> None:
+        identity = ht_device.refresh(ht_session.stats["reconnects"])
+        _LOGGER.info("successfully connected to heat pump #%d", identity.serial_number)
+        _LOGGER.info("software version = %s", identity.software_version)
+        if ht_clock.enabled:
+            _LOGGER.info("clock offset = %.1f s", ht_clock.measure().offset)
+
+    def on_ready() -> None:
+        if ht_sampler is not None:
+            ht_sampler.start()
+        ht_clock.start()
+
+    # connect to the heat pump (or to the heat pump simulator, if desired), either at once or in the background
+    ht_connector: Final = HtConnector(ht_heatpump, on_connect=on_connect, on_ready=on_ready)
+
+    def on_exit_app(
+        ht_hp: HtHeatpump,
+        ht_smp: Optional[ParamSampler],
+        ht_ses: HtSession,
+        ht_his: Optional[HistoryStore],
+        ht_wrq: WriteQueue,
+        ht_sub: SubscriptionHub,
+        ht_clk: ClockSync,
+        ht_trc: SerialTracer,
+        ht_con: HtConnector,
+    ):
         _LOGGER.debug("*** @on_exit_app -- %s -- %s", __file__, ht_hp)
-        # ht_hp.logout()
+        ht_con.stop()
+        ht_wrq.stop()  # perform the pending writes
+        ht_sub.stop()
+        ht_clk.stop()
+        if ht_smp is not None:
+            ht_smp.stop()
+        if ht_his is not None:
+            ht_his.close()
+        ht_ses.close()  # logout (if still logged in)
         ht_hp.close_connection()
+        ht_trc.close()
 
-    atexit.register(on_exit_app, ht_hp=ht_heatpump)
+    atexit.register(
+        on_exit_app,
+        ht_hp=ht_heatpump,
+        ht_smp=ht_sampler,
+        ht_ses=ht_session,
+        ht_his=ht_history,
+        ht_wrq=ht_write_queue,
+        ht_sub=ht_subscriptions,
+        ht_clk=ht_clock,
+        ht_trc=ht_tracer,
+        ht_con=ht_connector,
+    )
+
+    _LOGGER.info("open connection to heat pump (%s)", ht_heatpump)
+    if lazy_connect:
+        ht_connector.start()
+    else:
+        try:
+            ht_connector.connect()
+        except Exception as ex:
+            _LOGGER.error(ex)
+            raise
 
     # create the Flask app
     app = Flask(__name__)
@@ -78,15 +237,51 @@ def create_app(
         _ = BasicAuth(app)
     _LOGGER.info("*** created Flask app %s with config %s", app, app.config)
 
-    settings.BOOL_AS_INT = bool_as_int
     settings.READ_ONLY = read_only
 
     with app.app_context():
         current_app.ht_heatpump = ht_heatpump  # type: ignore[attr-defined]
+        current_app.ht_params = ht_params  # type: ignore[attr-defined]
+        current_app.ht_device = ht_device  # type: ignore[attr-defined]
+        current_app.ht_clock = ht_clock  # type: ignore[attr-defined]
+        current_app.ht_sampler = ht_sampler  # type: ignore[attr-defined]
+        current_app.ht_session = ht_session  # type: ignore[attr-defined]
+        current_app.ht_history = ht_history  # type: ignore[attr-defined]
+        current_app.ht_fault_cache = ht_fault_cache  # type: ignore[attr-defined]
+        current_app.ht_timeprog_cache = ht_timeprog_cache  # type: ignore[attr-defined]
+        current_app.ht_metrics = ht_metrics  # type: ignore[attr-defined]
+        current_app.ht_tracer = ht_tracer  # type: ignore[attr-defined]
+        current_app.ht_profiler = ht_profiler  # type: ignore[attr-defined]
+        current_app.ht_connector = ht_connector  # type: ignore[attr-defined]
+        current_app.ht_write_queue = ht_write_queue  # type: ignore[attr-defined]
+        current_app.ht_write_filter = ht_write_filter  # type: ignore[attr-defined]
+        current_app.ht_subscriptions = ht_subscriptions  # type: ignore[attr-defined]
+
+        caches = {"timeprog": ht_timeprog_cache, "faultlist": ht_fault_cache, "device": ht_device}
+        if ht_sampler is not None:
+            caches["param"] = ht_sampler
+        register_collectors(
+            ht_metrics,
+            ht_params,
+            ht_sampler,
+            ht_session,
+            caches,
+            ht_write_queue,
+            ht_write_filter,
+            ht_subscriptions,
+            ht_clock,
+            ht_tracer,
+        )
 
+        from htrest.apiv1 import api as apiv1_api
         from htrest.apiv1 import blueprint as apiv1
 
         app.register_blueprint(apiv1)
+        cache_spec(app, apiv1_api)
+        app.register_blueprint(metrics_blueprint)
+        app.register_blueprint(debug_blueprint)
+        app.register_blueprint(profile_blueprint)
+        app.register_blueprint(health_blueprint)
         # _LOGGER.info(apiv1.url_prefix)
         _LOGGER.info(app.url_map)
 
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Model of the clock offset and drift of the heat pump against the clock of the host. """
+
+import collections
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Deque, Dict, Final, NamedTuple, Optional, Tuple
+
+from htheatpump import HtHeatpump
+
+from . import settings
+from .apis.utils import HtContext
+from .scheduler import PRIORITY_BACKGROUND, PRIORITY_WRITE
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+MAX_DRIFT: Final = 100e-6
+""" Maximal assumed drift of the heat pump clock against the host clock (100 ppm, about 8.6 seconds per day). """
+
+
+class ClockSample(NamedTuple):
+    """Single measurement of the clock offset, which lies between :attr:`low` and :attr:`high`."""
+
+    host: float
+    low: float
+    high: float
+
+    @property
+    def offset(self) -> float:
+        """Return the center of the measured offset interval in seconds."""
+        return (self.low + self.high) / 2
+
+
+class ClockEstimate(NamedTuple):
+    """Estimated date and time of the heat pump together with the model parameters."""
+
+    date_time: datetime
+    offset: float
+    error: float
+    drift: float
+    measured: datetime
+
+
+class ClockSync:
+    """Model of the offset of the heat pump clock against the host clock, which is measured on a schedule.
+
+    Since the heat pump reports its date and time only with a resolution of one second, every measurement
+    confines the offset to an interval of about one second (plus the round-trip time of the request). The
+    intervals of several measurements are intersected, whereby every interval is widened by the maximal
+    possible drift since its measurement (see :const:`MAX_DRIFT`); the drift itself is estimated by a
+    least-squares fit of the measured offsets as soon as they span enough time to resolve it. If the
+    intersection becomes empty (e.g. because the clock of the heat pump was set), only the latest
+    measurement is kept.
+
+    If a maximal offset is given, the clock of the heat pump is set to the host time as soon as its offset
+    exceeds the maximal offset for sure (unless the server runs in read-only mode).
+
+    Example:
+
+    >>> clock = ClockSync(ht_heatpump, interval=3600)
+    >>> with HtContext(ht_heatpump):
+    ...     clock.measure()
+    ...
+    >>> clock.start()
+    >>> clock.estimate()
+    ClockEstimate(date_time=datetime.datetime(...), offset=-12.3, error=0.21, drift=1.2e-05, ...)
+
+    :param heatpump: The :class:`HtHeatpump` instance.
+    :type heatpump: ``HtHeatpump``
+    :param interval: The interval in seconds between two measurements (default ``0``, which means
+        the measurements are only performed on demand).
+    :type interval: float
+    :param max_offset: The offset in seconds above which the clock of the heat pump is corrected
+        (default ``0``, which means no correction).
+    :type max_offset: float
+    :param window: The number of measurements which are considered by the model.
+    :type window: int
+    """
+
+    def __init__(self, heatpump: HtHeatpump, interval: float = 0, max_offset: float = 0, window: int = 16) -> None:
+        assert heatpump is not None, "'heatpump' must not be None"
+        assert window > 0, "'window' must be greater than 0"
+        self._heatpump = heatpump
+        self._interval = max(0.0, interval)
+        self._max_offset = max(0.0, max_offset)
+        self._samples: Deque[ClockSample] = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"measurements": 0, "corrections": 0}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        """Return :const:`True` if the clock offset is measured on a schedule."""
+        return self._interval > 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Return the number of measurements and corrections of the heat pump clock."""
+        return dict(self._stats)
+
+    def measure(self) -> ClockSample:
+        """Measure the offset of the heat pump clock and add it to the model.
+
+        The heat pump must already be logged in, e.g. inside a :class:`~htrest.apis.utils.HtContext`.
+
+        :returns: The measurement.
+        :rtype: ``ClockSample``
+        """
+        start = time.time()
+        dt, _ = self._heatpump.get_date_time()
+        end = time.time()
+        # the reported time is truncated to full seconds and was taken somewhere between start and end
+        sample = ClockSample((start + end) / 2, dt.timestamp() - end, dt.timestamp() + 1 - start)
+        with self._lock:
+            self._samples.append(sample)
+            self._stats["measurements"] += 1
+            if self._bounds(sample.host) is None:
+                _LOGGER.info("clock of the heat pump has been set; discard %d measurement(s)", len(self._samples) - 1)
+                self._samples.clear()
+                self._samples.append(sample)
+        _LOGGER.debug("measured clock offset %.3f s (+/- %.3f s)", sample.offset, (sample.high - sample.low) / 2)
+        return sample
+
+    def reset(self) -> None:
+        """Discard all measurements (e.g. after the clock of the heat pump has been set)."""
+        with self._lock:
+            self._samples.clear()
+
+    def estimate(self, now: Optional[float] = None) -> Optional[ClockEstimate]:
+        """Return the estimated date and time of the heat pump.
+
+        :param now: The host time (see :func:`time.time`) for which the estimate is requested
+            (default :const:`None`, which means the current time).
+        :type now: float or None
+        :returns: The estimate or :const:`None` if there is no measurement available.
+        :rtype: ``ClockEstimate`` or ``None``
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if not self._samples:
+                return None
+            latest = self._samples[-1]
+            drift = self._drift()
+            low, high = self._bounds(now) or self._widen(latest, now)
+        offset = min(max(latest.offset + drift * (now - latest.host), low), high)
+        return ClockEstimate(
+            datetime.fromtimestamp(now + offset),
+            offset,
+            max(offset - low, high - offset),
+            drift,
+            datetime.fromtimestamp(latest.host),
+        )
+
+    @staticmethod
+    def _widen(sample: ClockSample, now: float) -> Tuple[float, float]:
+        spread = MAX_DRIFT * abs(now - sample.host)
+        return sample.low - spread, sample.high + spread
+
+    def _bounds(self, now: float) -> Optional[Tuple[float, float]]:
+        low, high = float("-inf"), float("inf")
+        for sample in self._samples:
+            lo, hi = self._widen(sample, now)
+            low, high = max(low, lo), min(high, hi)
+        return (low, high) if low <= high else None
+
+    def _drift(self) -> float:
+        n = len(self._samples)
+        span = self._samples[-1].host - self._samples[0].host
+        width = sum(s.high - s.low for s in self._samples) / n
+        if span * MAX_DRIFT < width:
+            return 0.0  # a drift within the assumed maximum isn't resolvable yet
+        mean_host = sum(s.host for s in self._samples) / n
+        mean_offset = sum(s.offset for s in self._samples) / n
+        var = sum((s.host - mean_host) ** 2 for s in self._samples)
+        if var <= 0:
+            return 0.0
+        cov = sum((s.host - mean_host) * (s.offset - mean_offset) for s in self._samples)
+        return min(max(cov / var, -MAX_DRIFT), MAX_DRIFT)
+
+    def correct(self) -> bool:
+        """Set the clock of the heat pump to the host time if its offset exceeds the maximal offset for sure.
+
+        :returns: :const:`True` if the clock of the heat pump has been set.
+        :rtype: bool
+        """
+        estimate = self.estimate()
+        if self._max_offset <= 0 or estimate is None or abs(estimate.offset) - estimate.error <= self._max_offset:
+            return False
+        if settings.READ_ONLY:
+            _LOGGER.warning("clock offset of %.1f s not corrected (read-only mode)", estimate.offset)
+            return False
+        with HtContext(self._heatpump, PRIORITY_WRITE):
+            self._heatpump.set_date_time(datetime.now())
+            self.reset()
+            self.measure()
+        self._stats["corrections"] += 1
+        _LOGGER.info("corrected clock offset of %.1f s of the heat pump", estimate.offset)
+        return True
+
+    def start(self) -> None:
+        """Start the background measurement thread (if a measurement interval is given)."""
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="htrest-clock", daemon=True)
+        self._thread.start()
+        _LOGGER.info("started clock sync (interval=%.1fs, max. offset=%.1fs)", self._interval, self._max_offset)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the background measurement thread.
+
+        :param timeout: The maximal time in seconds to wait for the thread to finish.
+        :type timeout: float or None
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+            _LOGGER.info("stopped clock sync")
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self._interval):
+            try:
+                with HtContext(self._heatpump, PRIORITY_BACKGROUND):
+                    self.measure()
+                self.correct()
+            except Exception as ex:
+                _LOGGER.error("clock sync failed: %s", ex)
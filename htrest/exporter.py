@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" OpenMetrics exporter endpoint for the heat pump parameters and the server internals. """
+
+import logging
+from typing import Dict, Final, Iterable, Optional, Tuple
+
+from flask import Blueprint, Response, current_app
+
+from .clock import ClockSync
+from .metrics import CONTENT_TYPE, MetricsRegistry
+from .params import ParamIndex
+from .sampler import ParamSampler
+from .session import HtSession
+from .subscriptions import SubscriptionHub
+from .tracing import SerialTracer
+from .write_filter import SUPERSEDED, UNCHANGED, WriteFilter
+from .write_queue import WriteQueue
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+blueprint: Final = Blueprint("metrics", __name__)
+
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+@blueprint.route("/metrics")
+def metrics():
+    """Returns the latest sampled parameter values and the server internals in the OpenMetrics text format."""
+    return Response(current_app.ht_metrics.render(), content_type=CONTENT_TYPE)  # type: ignore[attr-defined]
+
+
+def register_collectors(
+    registry: MetricsRegistry,
+    index: ParamIndex,
+    sampler: Optional[ParamSampler],
+    session: HtSession,
+    caches: Dict[str, object],
+    write_queue: Optional[WriteQueue] = None,
+    write_filter: Optional[WriteFilter] = None,
+    subscriptions: Optional[SubscriptionHub] = None,
+    clock: Optional[ClockSync] = None,
+    tracer: Optional[SerialTracer] = None,
+) -> None:
+    """Register the collectors for the sampled parameter values, the session counters and the cache statistics.
+
+    :param registry: The metrics registry.
+    :type registry: ``MetricsRegistry``
+    :param index: The index of the parameter definitions.
+    :type index: ``ParamIndex``
+    :param sampler: The parameter sampler (or :const:`None` if the sampling is disabled).
+    :type sampler: ``ParamSampler`` or ``None``
+    :param session: The session of the heat pump.
+    :type session: ``HtSession``
+    :param caches: The caches by name; every cache must provide a ``stats`` property with ``hits`` and ``misses``.
+    :type caches: dict
+    :param write_queue: The queue of the asynchronous parameter writes.
+    :type write_queue: ``WriteQueue`` or ``None``
+    :param write_filter: The filter for repeated parameter writes.
+    :type write_filter: ``WriteFilter`` or ``None``
+    :param subscriptions: The hub of the live parameter subscriptions.
+    :type subscriptions: ``SubscriptionHub`` or ``None``
+    :param clock: The model of the clock offset of the heat pump.
+    :type clock: ``ClockSync`` or ``None``
+    :param tracer: The tracer of the operations on the heat pump.
+    :type tracer: ``SerialTracer`` or ``None``
+    """
+
+    def params() -> Iterable[Sample]:
+        if sampler is None or sampler.snapshot is None:
+            return
+        snapshot = sampler.snapshot
+        yield "htrest_param_snapshot_age_seconds", "gauge", "Age of the sampled parameter values.", {}, snapshot.age
+        yield "htrest_param_reads", "counter", "Number of parameter reads of the sampler.", {}, sampler.stats["reads"]
+        schedule = sampler.schedule
+        if schedule is not None:
+            description = "Number of sampled parameters by their current sampling interval class."
+            for cls, count in schedule.stats.items():
+                yield "htrest_param_sampling_class", "gauge", description, {"class": cls}, count
+        for name, value in snapshot.values.items():
+            info = index[name]
+            labels = {"name": name, "dp_type": info.dp_type, "data_type": info.data_type.name}
+            yield "htrest_param_value", "gauge", "Sampled value of the heat pump parameter.", labels, float(value)
+
+    def session_stats() -> Iterable[Sample]:
+        stats = session.stats
+        for key, description in (
+            ("logins", "Number of logins on the heat pump."),
+            ("logouts", "Number of logouts from the heat pump."),
+            ("reuses", "Number of accesses which reused an existing login."),
+            ("reconnects", "Number of logins after a failed operation."),
+            ("merged", "Number of reads merged into an identical read in flight."),
+        ):
+            yield "htrest_session_{}".format(key), "counter", description, {}, stats[key]
+
+    def cache_stats() -> Iterable[Sample]:
+        for cache, obj in caches.items():
+            stats = obj.stats  # type: ignore[attr-defined]
+            hits, misses = stats["hits"], stats["misses"]
+            description = "Number of cache requests."
+            yield "htrest_cache_requests", "counter", description, {"cache": cache, "result": "hit"}, hits
+            yield "htrest_cache_requests", "counter", description, {"cache": cache, "result": "miss"}, misses
+            if hits + misses > 0:
+                ratio = hits / (hits + misses)
+                yield "htrest_cache_hit_ratio", "gauge", "Ratio of the cache hits.", {"cache": cache}, ratio
+
+    def write_queue_stats() -> Iterable[Sample]:
+        if write_queue is None:
+            return
+        stats = write_queue.stats
+        for key, description in (
+            ("jobs", "Number of submitted asynchronous write jobs."),
+            ("writes", "Number of performed asynchronous parameter writes."),
+            ("merged", "Number of asynchronous parameter writes merged into a later write."),
+            ("failed", "Number of failed asynchronous parameter writes."),
+        ):
+            yield "htrest_write_queue_{}".format(key), "counter", description, {}, stats[key]
+
+    def write_filter_stats() -> Iterable[Sample]:
+        if write_filter is None or not write_filter.enabled:
+            return
+        stats = write_filter.stats
+        for key, description in (
+            ("writes", "Number of parameter writes passed by the filter."),
+            ("delayed", "Number of parameter writes delayed by the debouncing."),
+        ):
+            yield "htrest_write_filter_{}".format(key), "counter", description, {}, stats[key]
+        for reason in (UNCHANGED, SUPERSEDED):
+            description = "Number of parameter writes suppressed by the filter."
+            yield "htrest_write_filter_suppressed", "counter", description, {"reason": reason}, stats[reason]
+
+    def subscription_stats() -> Iterable[Sample]:
+        if subscriptions is None:
+            return
+        stats = subscriptions.stats
+        yield "htrest_subscription_clients", "gauge", "Number of live parameter subscriptions.", {}, stats["clients"]
+        yield "htrest_subscription_params", "gauge", "Number of subscribed parameters (union).", {}, stats["params"]
+        description = "Number of samples (fast queries) of the subscribed parameters."
+        yield "htrest_subscription_ticks", "counter", description, {}, stats["ticks"]
+
+    def clock_stats() -> Iterable[Sample]:
+        if clock is None or not clock.enabled:
+            return
+        stats = clock.stats
+        for key, description in (
+            ("measurements", "Number of measurements of the heat pump clock offset."),
+            ("corrections", "Number of corrections of the heat pump clock."),
+        ):
+            yield "htrest_clock_{}".format(key), "counter", description, {}, stats[key]
+        estimate = clock.estimate()
+        if estimate is None:
+            return
+        for name, description, value in (
+            ("offset_seconds", "Estimated offset of the heat pump clock against the host clock.", estimate.offset),
+            ("error_seconds", "Maximal error of the estimated heat pump clock offset.", estimate.error),
+            ("drift", "Estimated drift of the heat pump clock against the host clock (s/s).", estimate.drift),
+        ):
+            yield "htrest_clock_{}".format(name), "gauge", description, {}, value
+
+    def serial_stats() -> Iterable[Sample]:
+        if tracer is None:
+            return
+        for operation, totals in tracer.totals.items():
+            labels = {"operation": operation}
+            yield "htrest_serial_requests", "counter", "Number of serial requests.", labels, totals["requests"]
+            description = "Number of reconnects (retries) during the operations."
+            yield "htrest_serial_retries", "counter", description, labels, totals["retries"]
+            description = "Number of bytes transferred on the serial line."
+            yield "htrest_serial_bytes", "counter", description, dict(labels, direction="sent"), totals["sent"]
+            yield "htrest_serial_bytes", "counter", description, dict(labels, direction="received"), totals["received"]
+
+    registry.add_collector(params)
+    registry.add_collector(session_stats)
+    registry.add_collector(cache_stats)
+    registry.add_collector(write_queue_stats)
+    registry.add_collector(write_filter_stats)
+    registry.add_collector(subscription_stats)
+    registry.add_collector(clock_stats)
+    registry.add_collector(serial_stats)
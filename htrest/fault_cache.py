@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Incrementally synchronized local cache of the heat pump fault list. """
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Final, List, Optional
+
+from htheatpump import HtHeatpump
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+
+class FaultListCache:
+    """Local (optionally persistent) cache of the heat pump fault list.
+
+    Since the fault list is an append-only history, only the entries beyond the last known size
+    are fetched from the heat pump on a synchronization. The last known entry is fetched again with
+    them to detect a reset of the fault list, which causes a complete reload.
+
+    Example:
+
+    >>> cache = FaultListCache(ht_heatpump, "/var/lib/htrest/faultlist.json")
+    >>> with HtContext(ht_heatpump):
+    ...     entries = cache.sync()
+    ...
+
+    :param heatpump: The :class:`HtHeatpump` instance.
+    :type heatpump: ``HtHeatpump``
+    :param filename: The file in which the cached entries are persisted (default ``""``, which means
+        the entries are only cached in memory).
+    :type filename: str
+    """
+
+    def __init__(self, heatpump: HtHeatpump, filename: str = "") -> None:
+        assert heatpump is not None, "'heatpump' must not be None"
+        self._heatpump = heatpump
+        self._filename = filename
+        self._entries: List[Dict[str, object]] = []
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        if filename and os.path.isfile(filename):
+            try:
+                self._entries = self._load(filename)
+                _LOGGER.info("loaded %d cached fault list entries from %r", len(self._entries), filename)
+            except Exception as ex:
+                _LOGGER.warning("failed to load the cached fault list entries from %r: %s", filename, ex)
+
+    @staticmethod
+    def _load(filename: str) -> List[Dict[str, object]]:
+        with open(filename, encoding="utf-8") as f:
+            entries = json.load(f)
+        for i, entry in enumerate(entries):
+            if entry["index"] != i:
+                raise ValueError("fault list index doesn't match [{:d}, should be {:d}]".format(entry["index"], i))
+            entry["datetime"] = datetime.fromisoformat(entry["datetime"])
+        return entries
+
+    def _save(self) -> None:
+        if not self._filename:
+            return
+        entries = [dict(entry, datetime=entry["datetime"].isoformat()) for entry in self._entries]  # type: ignore
+        tmp = self._filename + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp, self._filename)
+        except Exception as ex:
+            _LOGGER.warning("failed to persist the fault list entries in %r: %s", self._filename, ex)
+
+    @property
+    def entries(self) -> List[Dict[str, object]]:
+        """Return the cached fault list entries (without synchronization)."""
+        with self._lock:
+            return list(self._entries)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Return the number of accesses served from the cache (hits) and which needed to fetch entries (misses)."""
+        return {"hits": self._hits, "misses": self._misses}
+
+    def entry(self, index: int) -> Optional[Dict[str, object]]:
+        """Return a cached fault list entry (without synchronization).
+
+        :param index: The fault list index.
+        :type index: int
+        :returns: The fault list entry or :const:`None` if not cached.
+        :rtype: ``dict`` or ``None``
+        """
+        with self._lock:
+            if index not in range(0, len(self._entries)):
+                return None
+            self._hits += 1
+            return self._entries[index]
+
+    def sync(self) -> List[Dict[str, object]]:
+        """Synchronize the cache with the fault list of the heat pump. Must be called inside a
+        :class:`~htrest.apis.utils.HtContext`.
+
+        :returns: The (complete) fault list.
+        :rtype: ``list``
+        """
+        size = self._heatpump.get_fault_list_size()
+        with self._lock:
+            known = len(self._entries)
+            if size == known:
+                self._hits += 1
+                return list(self._entries)
+            self._misses += 1
+            if known == 0 or size < known:
+                # empty cache or reset of the fault list -> complete reload
+                self._entries = self._heatpump.get_fault_list()
+            else:
+                new = self._heatpump.get_fault_list(*range(known - 1, size))
+                if new[0] != self._entries[-1]:
+                    _LOGGER.info("fault list changed, reload all entries")
+                    self._entries = self._heatpump.get_fault_list()
+                else:
+                    self._entries.extend(new[1:])
+            _LOGGER.debug("synchronized fault list (%d -> %d entries)", known, len(self._entries))
+            self._save()
+            return list(self._entries)
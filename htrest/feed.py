@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Change feed which fans out the parameter deltas of the background sampler to several subscribers. """
+
+import logging
+import queue
+import time
+from typing import Dict, Final, Iterable, Optional
+
+from htheatpump import HtParamValueType
+
+from .sampler import ParamSampler, ParamSnapshot
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+
+class DeltaFilter:
+    """Filter which passes only the parameter values which changed (by more than the deadband of
+    the parameter) since the last passed value.
+
+    :param deadbands: The parameter names with their deadband; a numeric value is passed if it differs
+        by more than the deadband from the last passed value, all other values are passed on any change.
+    :type deadbands: dict
+    """
+
+    def __init__(self, deadbands: Dict[str, float]) -> None:
+        self._deadbands = dict(deadbands)
+        self._last: Dict[str, HtParamValueType] = {}
+
+    @property
+    def names(self) -> Iterable[str]:
+        """Return the names of the filtered parameters."""
+        return self._deadbands.keys()
+
+    def _changed(self, name: str, value: HtParamValueType) -> bool:
+        if name not in self._last:
+            return True
+        last = self._last[name]
+        if isinstance(value, bool) or isinstance(last, bool):
+            return value != last
+        return abs(value - last) > self._deadbands[name]
+
+    def update(self, values: Dict[str, HtParamValueType]) -> Dict[str, HtParamValueType]:
+        """Return the changed parameter values of the given values and remember them as last passed values.
+
+        :param values: The current parameter values.
+        :type values: dict
+        :returns: The changed parameter values (of the filtered parameters only).
+        :rtype: ``dict``
+        """
+        delta = {
+            name: value
+            for name, value in values.items()
+            if name in self._deadbands and self._changed(name, value)
+        }
+        self._last.update(delta)
+        return delta
+
+
+class ParamSubscription:
+    """Subscription on the parameter deltas of a :class:`~htrest.sampler.ParamSampler`.
+
+    Every new snapshot of the sampler is queued for the subscriber; if the subscriber is too slow,
+    the oldest snapshots are dropped (the deltas are calculated against the last delivered values,
+    so no change gets lost).
+
+    Example:
+
+    >>> with ParamSubscription(sampler, {"Temp. Aussen": 0.5, "Stoerung": 0}) as sub:
+    ...     delta = sub.next_delta(timeout=15.0)
+    ...
+
+    :param sampler: The sampler providing the snapshots.
+    :type sampler: ``ParamSampler``
+    :param deadbands: The parameter names with their deadband.
+    :type deadbands: dict
+    :param maxsize: The maximal number of queued snapshots.
+    :type maxsize: int
+    """
+
+    def __init__(self, sampler: ParamSampler, deadbands: Dict[str, float], maxsize: int = 8) -> None:
+        self._sampler = sampler
+        self._filter = DeltaFilter(deadbands)
+        self._queue: "queue.Queue[ParamSnapshot]" = queue.Queue(maxsize)
+
+    def __enter__(self) -> "ParamSubscription":
+        self.open()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def open(self) -> None:
+        """Start the subscription; the current snapshot (if available) is delivered as first delta."""
+        snapshot = self._sampler.snapshot
+        if snapshot is not None:
+            self._put(snapshot)
+        self._sampler.add_listener(self._put)
+
+    def close(self) -> None:
+        """Cancel the subscription."""
+        self._sampler.remove_listener(self._put)
+
+    def _put(self, snapshot: ParamSnapshot) -> None:
+        while True:
+            try:
+                self._queue.put_nowait(snapshot)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()  # drop the oldest snapshot
+                except queue.Empty:
+                    pass
+
+    def next_delta(self, timeout: Optional[float] = None) -> Optional[ParamSnapshot]:
+        """Wait for the next snapshot which contains changed values of the subscribed parameters.
+
+        :param timeout: The maximal time in seconds to wait.
+        :type timeout: float or None
+        :returns: A snapshot with the changed parameter values only or :const:`None` on timeout.
+        :rtype: ``ParamSnapshot`` or ``None``
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            remaining = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+            try:
+                snapshot = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            delta = self._filter.update(snapshot.values)
+            if delta:
+                return ParamSnapshot(snapshot.timestamp, delta)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Embedded on-disk time-series history of the sampled heat pump parameters. """
+
+import bisect
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import urllib.parse
+from typing import Dict, Final, List, NamedTuple, Optional, Tuple
+
+from .sampler import ParamSnapshot
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+# segment file layout: header, followed by the column of timestamps and the column of values (float64 each)
+_HEADER: Final = struct.Struct("<4sII")  # magic, capacity, count
+_MAGIC: Final = b"HTS1"
+_SUFFIX: Final = ".seg"
+
+SEGMENT_CAPACITY: Final = 8192  # number of samples per segment
+MAINTENANCE_INTERVAL: Final = 3600.0  # interval in seconds for the retention and compaction of the segments
+
+
+class _Segment:
+    """Columnar, memory-mapped segment file of a single parameter."""
+
+    def __init__(self, path: str, writable: bool = False) -> None:
+        self.path = path
+        self._file = open(path, "r+b" if writable else "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        except BaseException:
+            self._file.close()
+            raise
+        magic, self.capacity, self.count = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or len(self._mm) != _HEADER.size + 16 * self.capacity:
+            self.close()
+            raise ValueError("invalid history segment {!r}".format(path))
+
+    @classmethod
+    def create(cls, path: str, capacity: int) -> "_Segment":
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, capacity, 0))
+            f.truncate(_HEADER.size + 16 * capacity)
+        return cls(path, writable=True)
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+    def append(self, timestamp: float, value: float) -> None:
+        assert not self.full
+        struct.pack_into("<d", self._mm, _HEADER.size + 8 * self.count, timestamp)
+        struct.pack_into("<d", self._mm, _HEADER.size + 8 * (self.capacity + self.count), value)
+        self.count += 1
+        _HEADER.pack_into(self._mm, 0, _MAGIC, self.capacity, self.count)
+
+    def read(self, start: float = float("-inf"), end: float = float("inf")) -> Tuple[List[float], List[float]]:
+        """Return the timestamps and values of the samples in the interval [start, end)."""
+        ts_offset, values_offset = _HEADER.size, _HEADER.size + 8 * self.capacity
+        with memoryview(self._mm) as view:
+            ts = view[ts_offset:ts_offset + 8 * self.count].cast("d")
+            values = view[values_offset:values_offset + 8 * self.count].cast("d")
+            try:
+                lo, hi = bisect.bisect_left(ts, start), bisect.bisect_left(ts, end)  # type: ignore[call-overload]
+                return ts[lo:hi].tolist(), values[lo:hi].tolist()  # type: ignore[return-value]
+            finally:
+                ts.release()
+                values.release()
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+
+class HistoryPoint(NamedTuple):
+    """A (downsampled) point of the parameter history."""
+
+    timestamp: float  #: time of the sample or start of the downsampling interval (seconds since the epoch)
+    min: float  #: minimal value (in the interval)
+    max: float  #: maximal value (in the interval)
+    avg: float  #: average value (in the interval)
+    samples: int  #: number of samples (in the interval)
+
+
+class HistoryStore:
+    """Append-only, on-disk history of the sampled heat pump parameters.
+
+    The samples of every parameter are stored in columnar, memory-mapped segment files with a fixed
+    capacity in a sub-directory of the parameter. Segments older than the retention period are deleted
+    and consecutive, partly filled segments (e.g. after a restart) are merged periodically.
+
+    Example:
+
+    >>> store = HistoryStore("/var/lib/htrest", retention=30 * 86400)
+    >>> sampler.add_listener(store.append)
+    >>> points = store.query("Temp. Aussen", time.time() - 3600, time.time(), step=300)
+
+    :param directory: The directory of the history store.
+    :type directory: str
+    :param retention: The retention period in seconds.
+    :type retention: float
+    :param capacity: The number of samples per segment.
+    :type capacity: int
+    """
+
+    def __init__(self, directory: str, retention: float, capacity: int = SEGMENT_CAPACITY) -> None:
+        assert retention > 0, "'retention' must be greater than zero"
+        assert capacity > 0, "'capacity' must be greater than zero"
+        self._directory = directory
+        self._retention = retention
+        self._capacity = capacity
+        self._active: Dict[str, _Segment] = {}
+        self._lock = threading.Lock()
+        self._last_maintenance = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def directory(self) -> str:
+        """Return the directory of the history store."""
+        return self._directory
+
+    def _param_dir(self, name: str) -> str:
+        return os.path.join(self._directory, urllib.parse.quote(name, safe=""))
+
+    def _segments(self, name: str) -> List[Tuple[float, str]]:
+        """Return the (sorted) list of the segment files of a parameter with their first timestamp."""
+        path = self._param_dir(name)
+        if not os.path.isdir(path):
+            return []
+        res = []
+        for filename in os.listdir(path):
+            if filename.endswith(_SUFFIX):
+                try:
+                    res.append((int(filename[: -len(_SUFFIX)]) / 1000.0, os.path.join(path, filename)))
+                except ValueError:
+                    pass
+        return sorted(res)
+
+    def _new_segment(self, name: str, timestamp: float) -> _Segment:
+        path = self._param_dir(name)
+        os.makedirs(path, exist_ok=True)
+        return _Segment.create(os.path.join(path, "{:015d}{}".format(int(timestamp * 1000), _SUFFIX)), self._capacity)
+
+    def append(self, snapshot: ParamSnapshot) -> None:
+        """Append the values of a snapshot to the history (e.g. as listener of the sampler).
+
+        :param snapshot: The snapshot to append.
+        :type snapshot: ``ParamSnapshot``
+        """
+        with self._lock:
+            for name, value in snapshot.values.items():
+                segment = self._active.get(name)
+                if segment is None or segment.full:
+                    if segment is not None:
+                        segment.close()
+                    segment = self._active[name] = self._new_segment(name, snapshot.timestamp)
+                segment.append(snapshot.timestamp, float(value))
+        if time.monotonic() - self._last_maintenance >= MAINTENANCE_INTERVAL:
+            self._last_maintenance = time.monotonic()
+            self.maintain()
+
+    def names(self) -> List[str]:
+        """Return the names of all parameters with a history."""
+        return sorted(urllib.parse.unquote(name) for name in os.listdir(self._directory))
+
+    def query(self, name: str, start: float, end: float, step: Optional[float] = None) -> List[HistoryPoint]:
+        """Return the history of a parameter in the interval [start, end), optionally downsampled.
+
+        :param name: The parameter name.
+        :type name: str
+        :param start: The start of the interval (seconds since the epoch).
+        :type start: float
+        :param end: The end of the interval (seconds since the epoch).
+        :type end: float
+        :param step: The length of the downsampling intervals in seconds (default :const:`None`,
+            which means no downsampling).
+        :type step: float or None
+        :returns: The samples or downsampled intervals (with min/max/avg values) in chronological order.
+        :rtype: ``list`` of ``HistoryPoint``
+        """
+        assert step is None or step > 0, "'step' must be greater than zero"
+        timestamps: List[float] = []
+        values: List[float] = []
+        with self._lock:
+            segments = self._segments(name)
+            for i, (first, path) in enumerate(segments):
+                following = segments[i + 1][0] if i + 1 < len(segments) else float("inf")
+                if following <= start or first >= end:
+                    continue
+                active = self._active.get(name)
+                segment = active if active is not None and active.path == path else _Segment(path)
+                try:
+                    ts, vals = segment.read(start, end)
+                finally:
+                    if segment is not active:
+                        segment.close()
+                timestamps.extend(ts)
+                values.extend(vals)
+        if step is None:
+            return [HistoryPoint(timestamp, v, v, v, 1) for timestamp, v in zip(timestamps, values)]
+        res: List[HistoryPoint] = []
+        bucket: List[float] = []
+        bucket_start = 0.0
+        for timestamp, v in zip(timestamps, values):
+            current = start + ((timestamp - start) // step) * step
+            if bucket and current != bucket_start:
+                res.append(HistoryPoint(bucket_start, min(bucket), max(bucket), sum(bucket) / len(bucket), len(bucket)))
+                bucket = []
+            bucket_start = current
+            bucket.append(v)
+        if bucket:
+            res.append(HistoryPoint(bucket_start, min(bucket), max(bucket), sum(bucket) / len(bucket), len(bucket)))
+        return res
+
+    def maintain(self) -> None:
+        """Delete the segments older than the retention period and merge consecutive, partly filled segments."""
+        limit = time.time() - self._retention
+        with self._lock:
+            for name in self.names():
+                active = self._active.get(name)
+                segments = self._segments(name)
+                # retention: a segment is outdated if the following one starts before the limit
+                while len(segments) > 1 and segments[1][0] < limit:
+                    _, path = segments.pop(0)
+                    if active is None or active.path != path:
+                        os.remove(path)
+                # compaction of the sealed segments
+                sealed = [path for _, path in segments if active is None or active.path != path]
+                self._compact(sealed)
+
+    def _compact(self, paths: List[str]) -> None:
+        target: Optional[_Segment] = None  # partly filled segment into which the following segments are merged
+        for path in paths:
+            segment = _Segment(path, writable=True)
+            if target is not None and target.count + segment.count <= target.capacity:
+                for ts, value in zip(*segment.read()):
+                    target.append(ts, value)
+                segment.close()
+                os.remove(path)
+                _LOGGER.debug("merged history segment %r into %r", path, target.path)
+                continue
+            if target is not None:
+                target.close()
+            target = None
+            if segment.full:
+                segment.close()
+            else:
+                target = segment
+        if target is not None:
+            target.close()
+
+    def close(self) -> None:
+        """Close all active segments."""
+        with self._lock:
+            for segment in self._active.values():
+                segment.close()
+            self._active.clear()
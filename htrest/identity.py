@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Registry of the (immutable) identity of the connected heat pump. """
+
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Final, NamedTuple, Optional
+
+from htheatpump import HtHeatpump
+
+from .apis.utils import ht_read
+from .params import ParamIndex
+from .session import HtSession
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+
+class DeviceIdentity(NamedTuple):
+    """Identity of the connected heat pump together with the details of the serial link."""
+
+    serial_number: int
+    software_version: str
+    property_id: Optional[int]
+    device: str
+    baudrate: int
+    connected: datetime
+    reconnects: int
+
+
+class DeviceRegistry:
+    """Registry of the identity of the connected heat pump (serial number, software version and
+    property number), which doesn't change as long as the connection persists.
+
+    The identity is read once at connect time and afterwards served from memory; it is only read
+    again from the heat pump after the session performed a reconnect (see :attr:`HtSession.stats`),
+    since the device on the other end of the link may have been replaced or updated in the meantime.
+
+    Example:
+
+    >>> registry = DeviceRegistry(ht_heatpump, "/dev/ttyUSB0", 115200, index)
+    >>> ht_heatpump.login()
+    >>> registry.refresh()
+    >>> ht_heatpump.logout()
+    >>> registry.get()
+    DeviceIdentity(serial_number=123456, software_version='3.0.20', ...)
+
+    :param heatpump: The :class:`HtHeatpump` instance.
+    :type heatpump: ``HtHeatpump``
+    :param device: The serial device of the connection.
+    :type device: str
+    :param baudrate: The baud rate of the serial connection.
+    :type baudrate: int
+    :param index: The index of the parameter definitions (to check whether the property number is known).
+    :type index: ``ParamIndex`` or ``None``
+    """
+
+    def __init__(self, heatpump: HtHeatpump, device: str, baudrate: int, index: Optional[ParamIndex] = None) -> None:
+        assert heatpump is not None, "'heatpump' must not be None"
+        self._heatpump = heatpump
+        self._device = device
+        self._baudrate = baudrate
+        self._index = index
+        self._identity: Optional[DeviceIdentity] = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def identity(self) -> Optional[DeviceIdentity]:
+        """Return the registered identity of the heat pump (or :const:`None` if not read yet)."""
+        return self._identity
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Return the number of requests answered from memory (hits) and from the heat pump (misses)."""
+        return {"hits": self._hits, "misses": self._misses}
+
+    def refresh(self, reconnects: int = 0) -> DeviceIdentity:
+        """Read the identity from the heat pump and register it.
+
+        The heat pump must already be logged in, e.g. inside a :class:`~htrest.apis.utils.HtContext`.
+
+        :param reconnects: The number of reconnects of the session at the time of the read.
+        :type reconnects: int
+        :returns: The registered identity.
+        :rtype: ``DeviceIdentity``
+        """
+        serial_number = self._heatpump.get_serial_number()
+        software_version, _ = self._heatpump.get_version()
+        property_id = None
+        if self._index is not None and "Liegenschaft" in self._index:
+            property_id = self._heatpump.get_param("Liegenschaft")
+        identity = DeviceIdentity(
+            serial_number, software_version, property_id, self._device, self._baudrate, datetime.now(), reconnects
+        )
+        with self._lock:
+            self._identity = identity
+        _LOGGER.info("registered identity of heat pump #%d (software version = %s)", serial_number, software_version)
+        return identity
+
+    def get(self) -> DeviceIdentity:
+        """Return the identity of the heat pump, which is only read from the heat pump if it isn't
+        registered yet or the session performed a reconnect since it was read.
+
+        :returns: The identity of the heat pump.
+        :rtype: ``DeviceIdentity``
+        """
+        session = HtSession.of(self._heatpump)
+        identity = self._identity
+        if identity is not None and identity.reconnects == session.stats["reconnects"]:
+            self._hits += 1
+            return identity
+        self._misses += 1
+        # the number of reconnects is taken inside the context, since the login may perform a reconnect itself
+        return ht_read(self._heatpump, ("device",), lambda: self.refresh(session.stats["reconnects"]))
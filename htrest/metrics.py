@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Collection of internal metrics and their exposition in the OpenMetrics text format. """
+
+import bisect
+import logging
+import threading
+from typing import Callable, Dict, Final, Iterable, List, Optional, Sequence, Tuple
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+CONTENT_TYPE: Final = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# default upper bounds (in seconds) of the latency histogram buckets
+DEFAULT_BUCKETS: Final = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# the methods of HtHeatpump which perform a serial transaction
+SERIAL_OPERATIONS: Final = (
+    "login",
+    "logout",
+    "get_serial_number",
+    "get_version",
+    "get_date_time",
+    "set_date_time",
+    "get_last_fault",
+    "get_fault_list_size",
+    "get_fault_list",
+    "get_param",
+    "set_param",
+    "overwrite_param",
+    "query",
+    "fast_query",
+    "get_time_progs",
+    "get_time_prog",
+    "get_time_prog_entry",
+    "set_time_prog_entry",
+    "set_time_prog",
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra is not None else [])
+    if not items:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(key, _escape(value)) for key, value in items) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, buckets: Sequence[float], value: float) -> None:
+        self.counts[bisect.bisect_left(buckets, value)] += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """Thread-safe registry of counters and latency histograms, which are rendered together with the
+    values of registered collectors in the OpenMetrics text format.
+
+    Example:
+
+    >>> registry = MetricsRegistry()
+    >>> registry.inc("htrest_cache_requests", "Number of cache requests.", cache="param", result="hit")
+    >>> registry.observe("htrest_request_duration_seconds", "Request duration.", 0.012, namespace="param")
+    >>> print(registry.render())
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+
+    def inc(self, name: str, help: str, amount: float = 1, **labels: str) -> None:
+        """Increment a counter.
+
+        :param name: The metric name (without the ``_total`` suffix).
+        :type name: str
+        :param help: The description of the metric.
+        :type help: str
+        :param amount: The increment.
+        :type amount: float
+        :param labels: The labels of the metric.
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, ("counter", help))
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, help: str, value: float, **labels: str) -> None:
+        """Record an observation (e.g. a duration in seconds) in a histogram.
+
+        :param name: The metric name.
+        :type name: str
+        :param help: The description of the metric.
+        :type help: str
+        :param value: The observed value.
+        :type value: float
+        :param labels: The labels of the metric.
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help))
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._buckets)
+            histogram.observe(self._buckets, value)
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]) -> None:
+        """Register a callable which delivers additional metric samples at render time.
+
+        The collector returns an iterable of ``(name, type, help, labels, value)`` tuples, whereby the
+        type is either ``"gauge"`` or ``"counter"`` (the name of a counter without the ``_total`` suffix).
+
+        :param collector: The collector to register.
+        :type collector: Callable
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Render all metrics in the OpenMetrics text format.
+
+        :returns: The OpenMetrics text exposition.
+        :rtype: ``str``
+        """
+        families: Dict[str, Tuple[str, str, List[str]]] = {}
+
+        def family(name: str, metric_type: str, help: str) -> List[str]:
+            return families.setdefault(name, (metric_type, help, []))[2]
+
+        with self._lock:
+            for name, counters in self._counters.items():
+                lines = family(name, *self._help[name])
+                for key, value in counters.items():
+                    lines.append("{}_total{} {}".format(name, _labels(key), _number(value)))
+            for name, histograms in self._histograms.items():
+                lines = family(name, *self._help[name])
+                for key, histogram in histograms.items():
+                    cumulative = 0
+                    for bound, count in zip(self._buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        lines.append(
+                            "{}_bucket{} {}".format(name, _labels(key, ("le", _number(bound))), cumulative)
+                        )
+                    lines.append("{}_count{} {}".format(name, _labels(key), cumulative))
+                    lines.append("{}_sum{} {}".format(name, _labels(key), _number(histogram.sum)))
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                for name, metric_type, help, labels, value in collector():
+                    suffix = "_total" if metric_type == "counter" else ""
+                    key = tuple(sorted(labels.items()))
+                    family(name, metric_type, help).append(
+                        "{}{}{} {}".format(name, suffix, _labels(key), _number(value))
+                    )
+            except Exception as ex:
+                _LOGGER.error("metrics collector %s failed: %s", collector, ex)
+        out = []
+        for name, (metric_type, help, lines) in families.items():
+            out.append("# TYPE {} {}".format(name, metric_type))
+            out.append("# HELP {} {}".format(name, help))
+            out.extend(lines)
+        out.append("# EOF")
+        return "\n".join(out) + "\n"
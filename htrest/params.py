@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Immutable index of the heat pump parameter definitions, built once at the start of the application. """
+
+import logging
+from types import MappingProxyType
+from typing import Callable, Dict, Final, FrozenSet, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+from htheatpump import HtDataTypes, HtParams, HtParamValueType
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+_CONVERTERS: Final = {HtDataTypes.BOOL: bool, HtDataTypes.INT: int, HtDataTypes.FLOAT: float}
+
+
+def _identity(value: HtParamValueType) -> HtParamValueType:
+    return value
+
+
+def _bool_to_int(value: HtParamValueType) -> HtParamValueType:
+    return 1 if value else 0
+
+
+class ParamInfo(NamedTuple):
+    """Definition of a heat pump parameter together with its value converters."""
+
+    name: str  #: the parameter name
+    data_type: HtDataTypes  #: the data type of the parameter value
+    dp_type: str  #: the data point type ("MP" or "SP")
+    dp_number: int  #: the data point number
+    min_val: Optional[HtParamValueType]  #: the lower limit of the parameter value
+    max_val: Optional[HtParamValueType]  #: the upper limit of the parameter value
+    convert: Callable[[float], HtParamValueType]  #: converter of a (stored) number to the data type
+    to_json: Callable[[HtParamValueType], HtParamValueType]  #: converter to the representation in the REST API
+    from_json: Callable[[HtParamValueType], HtParamValueType]  #: converter from the representation in the REST API
+
+    def in_limits(self, value: HtParamValueType) -> bool:
+        """Return :const:`True` if the given value is within the limits of the parameter."""
+        return (self.min_val is None or self.min_val <= value) and (self.max_val is None or value <= self.max_val)
+
+
+class ParamIndex(Mapping[str, ParamInfo]):
+    """Read-only mapping of the parameter names to their :class:`ParamInfo`, together with the precomputed
+    lists of all parameter names and of the parameters representing a 'MP' data point.
+
+    The conversion between the values of the heat pump and their representation in the REST API (booleans
+    as integers, if desired) is fixed at construction time, so that the request handlers don't need to look
+    up the parameter definition and the settings for each single value.
+
+    Example:
+
+    >>> index = ParamIndex(bool_as_int=True)
+    >>> index.unknown(["Stoerung", "Foo"])
+    ['Foo']
+    >>> index.values_to_json({"Stoerung": False, "Temp. Aussen": 4.3})
+    {'Stoerung': 0, 'Temp. Aussen': 4.3}
+
+    :param bool_as_int: Represent boolean values as integers (:const:`False` = 0, :const:`True` = 1).
+    :type bool_as_int: bool
+    """
+
+    def __init__(self, bool_as_int: bool = False) -> None:
+        infos: Dict[str, ParamInfo] = {}
+        for name, param in HtParams.items():
+            as_int = bool_as_int and param.data_type == HtDataTypes.BOOL
+            infos[name] = ParamInfo(
+                name=name,
+                data_type=param.data_type,
+                dp_type=param.dp_type,
+                dp_number=param.dp_number,
+                min_val=param.min_val,
+                max_val=param.max_val,
+                convert=_CONVERTERS.get(param.data_type, float),
+                to_json=_bool_to_int if as_int else _identity,
+                from_json=bool if as_int else _identity,
+            )
+        self._infos: Final = MappingProxyType(infos)
+        self._names: Final = tuple(infos.keys())
+        self._mp_names: Final = tuple(name for name, info in infos.items() if info.dp_type == "MP")
+        self._mp_set: Final = frozenset(self._mp_names)
+        # names of the parameters whose values have to be converted for the REST API
+        self._converted: FrozenSet[str] = frozenset(
+            name for name, info in infos.items() if info.to_json is not _identity
+        )
+        _LOGGER.debug("parameter index with %d parameters (%d 'MP')", len(self._names), len(self._mp_names))
+
+    def __getitem__(self, name: str) -> ParamInfo:
+        return self._infos[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._infos
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        """Return the names of all known parameters."""
+        return self._names
+
+    @property
+    def mp_names(self) -> Tuple[str, ...]:
+        """Return the names of all parameters representing a 'MP' data point."""
+        return self._mp_names
+
+    def is_mp(self, name: str) -> bool:
+        """Return :const:`True` if the given parameter represents a 'MP' data point."""
+        return name in self._mp_set
+
+    def unknown(self, names: Iterable[str]) -> List[str]:
+        """Return the given parameter names which are not known."""
+        return [name for name in names if name not in self._infos]
+
+    def not_mp(self, names: Iterable[str]) -> List[str]:
+        """Return the given parameter names which don't represent a 'MP' data point."""
+        return [name for name in names if name not in self._mp_set]
+
+    def to_json(self, name: str, value: HtParamValueType) -> HtParamValueType:
+        """Convert a parameter value to its representation in the REST API."""
+        return self._infos[name].to_json(value)
+
+    def from_json(self, name: str, value: HtParamValueType) -> HtParamValueType:
+        """Convert a parameter value from its representation in the REST API."""
+        return self._infos[name].from_json(value)
+
+    def values_to_json(self, values: Dict[str, HtParamValueType]) -> Dict[str, HtParamValueType]:
+        """Convert the given parameter values to their representation in the REST API.
+
+        Only the values which actually need a conversion are touched; without any conversion
+        the given dict is returned as it is.
+
+        :param values: The parameter values by parameter name.
+        :type values: dict
+        :returns: The converted parameter values (in the same order).
+        :rtype: ``dict``
+        """
+        converted = self._converted.intersection(values)
+        if not converted:
+            return values
+        res = dict(values)
+        for name in converted:
+            res[name] = self._infos[name].to_json(res[name])
+        return res
+
+    def values_from_json(self, values: Dict[str, HtParamValueType]) -> Dict[str, HtParamValueType]:
+        """Convert the given parameter values from their representation in the REST API.
+
+        :param values: The parameter values by parameter name.
+        :type values: dict
+        :returns: The converted parameter values (in the same order).
+        :rtype: ``dict``
+        """
+        return {name: self._infos[name].from_json(value) for name, value in values.items()}
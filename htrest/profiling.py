@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Opt-in profiling of the REST API requests with output in the collapsed stack format (for flame graphs). """
+
+import collections
+import hmac
+import itertools
+import logging
+import os
+import sys
+import threading
+from typing import Counter, Dict, Final, Mapping, Optional
+
+from flask import Blueprint, Response, abort, current_app, request
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+blueprint: Final = Blueprint("profile", __name__)
+
+# request header which triggers the profiling of a request (with the configured token as value)
+PROFILE_HEADER: Final = "X-HtREST-Profile"
+# response header with the number of stack samples taken during a profiled request
+PROFILE_SAMPLES_HEADER: Final = "X-HtREST-Profile-Samples"
+
+
+def _collapse(frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        # Hint: the qualified name (e.g. "DotKeyField.output") is only available since Python 3.11
+        stack.append("{}:{}".format(frame.f_globals.get("__name__", "?"), getattr(code, "co_qualname", code.co_name)))
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class RequestProfiler:
+    """Sampling profiler for the REST API requests, which records the stacks of the profiled requests in
+    the collapsed stack format (``frame;frame;frame count``, e.g. for ``flamegraph.pl`` or speedscope) by
+    namespace of the REST API (``param``, ``fastquery``, ``timeprog``, ...).
+
+    A request is profiled if it carries the header :const:`PROFILE_HEADER` with the configured token or,
+    if desired, every n-th request automatically. While profiled requests are in progress, a sampling
+    thread takes their stacks at the given interval, so the requests themselves are hardly slowed down.
+    The recorded stacks are kept in memory and, if a directory is given, appended to the file
+    ``<namespace>.collapsed`` in this directory.
+
+    Example:
+
+    >>> profiler = RequestProfiler(token="secret", every=100, directory="/var/lib/htrest/profiles")
+    >>> ident = profiler.start()
+    >>> ...  # handle the request
+    >>> profiler.stop(ident, "param")
+    42
+
+    :param token: The token which must be given in the request header :const:`PROFILE_HEADER` to profile
+        a request (default ``""``, which means profiling on request is disabled).
+    :type token: str
+    :param every: Profile every n-th request automatically (default ``0``, which means never).
+    :type every: int
+    :param directory: The directory in which the collapsed stacks are stored (default ``""``, which means
+        they are only kept in memory).
+    :type directory: str
+    :param interval: The sampling interval in seconds.
+    :type interval: float
+    """
+
+    def __init__(self, token: str = "", every: int = 0, directory: str = "", interval: float = 0.005) -> None:
+        assert interval > 0, "'interval' must be greater than 0"
+        self._token = token
+        self._every = max(0, every)
+        self._directory = directory
+        self._interval = interval
+        self._requests = itertools.count(1)
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._active: Dict[int, Counter[str]] = {}
+        self._stacks: Dict[str, Counter[str]] = {}
+        self._thread: Optional[threading.Thread] = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        """Return :const:`True` if requests are profiled (on request or automatically)."""
+        return bool(self._token) or self._every > 0
+
+    @property
+    def namespaces(self) -> Dict[str, int]:
+        """Return the number of recorded stack samples by namespace."""
+        with self._lock:
+            return {namespace: sum(stacks.values()) for namespace, stacks in self._stacks.items()}
+
+    def wanted(self, headers: Mapping[str, str]) -> bool:
+        """Return :const:`True` if the request with the given headers should be profiled.
+
+        :param headers: The headers of the request.
+        :type headers: Mapping[str, str]
+        :rtype: bool
+        """
+        if self._token and hmac.compare_digest(headers.get(PROFILE_HEADER, ""), self._token):
+            return True
+        return self._every > 0 and next(self._requests) % self._every == 0
+
+    def start(self) -> int:
+        """Start to sample the stack of the current thread.
+
+        :returns: The identifier to stop the sampling by :meth:`stop`.
+        :rtype: int
+        """
+        ident = threading.get_ident()
+        with self._cond:
+            self._active[ident] = collections.Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="htrest-profiler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return ident
+
+    def stop(self, ident: int, namespace: str) -> int:
+        """Stop the sampling started by :meth:`start` and record the sampled stacks for the given namespace.
+
+        :param ident: The identifier returned by :meth:`start`.
+        :type ident: int
+        :param namespace: The namespace of the REST API request.
+        :type namespace: str
+        :returns: The number of stack samples taken.
+        :rtype: int
+        """
+        with self._lock:
+            stacks = self._active.pop(ident, None)
+            if not stacks:
+                return 0
+            self._stacks.setdefault(namespace, collections.Counter()).update(stacks)
+        if self._directory:
+            try:
+                with open(os.path.join(self._directory, namespace + ".collapsed"), "a", encoding="utf-8") as f:
+                    f.writelines("{} {:d}\n".format(stack, count) for stack, count in stacks.items())
+            except OSError as ex:
+                _LOGGER.warning("failed to store the profile of namespace %r: %s", namespace, ex)
+        return sum(stacks.values())
+
+    def collapsed(self, namespace: str) -> Optional[str]:
+        """Return the recorded stacks of the given namespace in the collapsed stack format.
+
+        :param namespace: The namespace of the REST API.
+        :type namespace: str
+        :returns: The collapsed stacks or :const:`None` if there are no stacks recorded for the namespace.
+        :rtype: ``str`` or ``None``
+        """
+        with self._lock:
+            stacks = self._stacks.get(namespace)
+            if stacks is None:
+                return None
+            return "".join("{} {:d}\n".format(stack, count) for stack, count in sorted(stacks.items()))
+
+    def _run(self) -> None:
+        with self._cond:
+            while True:
+                while not self._active:
+                    self._cond.wait()
+                frames = sys._current_frames()
+                for ident, stacks in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[_collapse(frame)] += 1
+                del frames
+                self._cond.wait(self._interval)
+
+
+@blueprint.route("/debug/profile")
+def profile_list():
+    """Returns the number of recorded stack samples by namespace."""
+    _LOGGER.info("*** [GET] %s", request.url)
+    return current_app.ht_profiler.namespaces  # type: ignore[attr-defined]
+
+
+@blueprint.route("/debug/profile/<string:namespace>")
+def profile(namespace: str):
+    """Returns the recorded stacks of the namespace in the collapsed stack format."""
+    _LOGGER.info("*** [GET] %s", request.url)
+    res = current_app.ht_profiler.collapsed(namespace)  # type: ignore[attr-defined]
+    if res is None:
+        abort(404, "no profile recorded for namespace {!r}".format(namespace))
+    return Response(res, content_type="text/plain; charset=utf-8")
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Background sampler which keeps an in-memory snapshot of the heat pump parameters. """
+
+import json
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Final, Iterable, List, Mapping, NamedTuple, Optional
+
+from htheatpump import HtHeatpump, HtParamValueType
+
+from .apis.utils import HtContext, query_params
+from .params import ParamIndex
+from .scheduler import PRIORITY_BACKGROUND
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+# sampling classes of the parameters
+FAST: Final = "fast"  # sampled every tick
+SLOW: Final = "slow"  # sampled every ``slow_factor`` ticks
+STATIC: Final = "static"  # sampled every ``static_factor`` ticks
+ADAPTIVE: Final = "adaptive"  # sampling interval learned from the observed changes (between fast and static)
+CLASSES: Final = (FAST, SLOW, STATIC, ADAPTIVE)
+
+
+class ParamSnapshot(NamedTuple):
+    """Timestamped snapshot of the heat pump parameter values."""
+
+    timestamp: float  #: time of the sample (seconds since the epoch)
+    values: Dict[str, HtParamValueType]  #: the sampled parameter values
+
+    @property
+    def age(self) -> float:
+        """Return the age of the snapshot in seconds."""
+        return max(0.0, time.time() - self.timestamp)
+
+
+class PollSchedule:
+    """Per-parameter sampling schedule of the :class:`ParamSampler`.
+
+    Every parameter has its own sampling interval, given by its class: ``fast`` parameters are sampled every tick,
+    ``slow`` and ``static`` ones every ``slow_factor`` and ``static_factor`` ticks. The interval of ``adaptive``
+    parameters (the default) is learned: it's doubled every time the parameter was read unchanged (up to the
+    interval of the ``static`` class) and reset to a single tick as soon as the parameter changes. The first
+    due times are randomized over the interval, so the reads of the rarely sampled parameters are spread
+    over the ticks instead of being done all at once.
+
+    :param names: The names of the sampled parameters.
+    :type names: Iterable[str]
+    :param interval: The interval of a tick in seconds.
+    :type interval: float
+    :param classes: The configured classes by parameter name; parameters not contained are ``adaptive``.
+    :type classes: Mapping[str, str] or None
+    :param slow_factor: The sampling interval of the ``slow`` parameters in ticks.
+    :type slow_factor: int
+    :param static_factor: The sampling interval of the ``static`` parameters in ticks.
+    :type static_factor: int
+    :param default: The class of the parameters without a configured class.
+    :type default: str
+    :raises ValueError:
+        If a configured class is invalid.
+    """
+
+    def __init__(
+        self,
+        names: Iterable[str],
+        interval: float,
+        classes: Optional[Mapping[str, str]] = None,
+        slow_factor: int = 10,
+        static_factor: int = 60,
+        default: str = ADAPTIVE,
+    ) -> None:
+        assert interval > 0, "'interval' must be greater than zero"
+        assert 1 <= slow_factor <= static_factor, "invalid factors, must be 1 <= 'slow_factor' <= 'static_factor'"
+        classes = classes or {}
+        assert default in CLASSES, "invalid default class {!r}".format(default)
+        invalid = {name: cls for name, cls in classes.items() if cls not in CLASSES}
+        if invalid:
+            raise ValueError("invalid sampling class(es) {!r}, must be one of {}".format(invalid, CLASSES))
+        self._interval = interval
+        self._static_factor = static_factor
+        self._factors = {FAST: 1, SLOW: slow_factor, STATIC: static_factor}
+        self._classes: Dict[str, str] = {name: classes.get(name, default) for name in names}
+        self._ticks: Dict[str, int] = {}  # current sampling interval in ticks
+        self._next: Dict[str, float] = {}  # next due time (monotonic)
+        self._last: Dict[str, HtParamValueType] = {}  # last read values
+        self._lock = threading.Lock()
+        now = time.monotonic()
+        for name, cls in self._classes.items():
+            self._ticks[name] = self._factors.get(cls, 1)
+            self._next[name] = now  # read all parameters once at the start
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Return the number of parameters per current sampling interval class (``fast``, ``slow``, ``static``)."""
+        with self._lock:
+            stats = {FAST: 0, SLOW: 0, STATIC: 0}
+            for ticks in self._ticks.values():
+                stats[FAST if ticks == 1 else (STATIC if ticks >= self._static_factor else SLOW)] += 1
+            return stats
+
+    def due(self, now: float) -> List[str]:
+        """Return the names of the parameters which are due at the tick at the given time.
+
+        :param now: The time of the tick (monotonic).
+        :type now: float
+        :returns: The names of the due parameters.
+        :rtype: ``list``
+        """
+        with self._lock:
+            limit = now + self._interval / 2  # due within this tick
+            return [name for name, due in self._next.items() if due <= limit]
+
+    def update(self, values: Mapping[str, HtParamValueType], now: float) -> None:
+        """Update the schedule with the read values of the due parameters.
+
+        :param values: The read parameter values.
+        :type values: Mapping[str, HtParamValueType]
+        :param now: The time of the read (monotonic).
+        :type now: float
+        """
+        with self._lock:
+            for name, value in values.items():
+                cls = self._classes.get(name)
+                if cls is None:
+                    continue
+                if cls == ADAPTIVE:
+                    changed = name in self._last and self._last[name] != value
+                    if changed:
+                        self._ticks[name] = 1
+                    elif name in self._last:
+                        self._ticks[name] = min(2 * self._ticks[name], self._static_factor)
+                self._last[name] = value
+                ticks = self._ticks[name]
+                # spread the reads of the parameters which aren't sampled every tick
+                jitter = random.randint(0, ticks // 4) if ticks > 1 else 0
+                self._next[name] = now + (ticks - jitter) * self._interval
+
+    def invalidate(self, names: Iterable[str]) -> None:
+        """Sample the given parameters at the next tick (e.g. after they have been written).
+
+        :param names: The names of the parameters.
+        :type names: Iterable[str]
+        """
+        with self._lock:
+            for name in names:
+                if name in self._next:
+                    self._next[name] = 0.0
+                    if self._classes[name] == ADAPTIVE:
+                        self._ticks[name] = 1
+
+
+def load_classes(filename: str) -> Dict[str, str]:
+    """Load the sampling classes of the parameters from a JSON file, e.g. ``{"Temp. Aussen": "fast"}``.
+
+    :param filename: The name of the JSON file.
+    :type filename: str
+    :returns: The sampling classes by parameter name.
+    :rtype: ``dict``
+    :raises ValueError:
+        If the file doesn't contain a JSON object of strings.
+    """
+    with open(filename, encoding="utf-8") as f:
+        classes = json.load(f)
+    if not isinstance(classes, dict) or not all(isinstance(cls, str) for cls in classes.values()):
+        raise ValueError("{!r} must contain a JSON object with the sampling class of each parameter".format(filename))
+    return classes
+
+
+class ParamSampler:
+    """Background poller which periodically reads the heat pump parameters and keeps
+    the latest values as a timestamped snapshot in memory.
+
+    Example:
+
+    >>> sampler = ParamSampler(ht_heatpump, interval=30.0)
+    >>> sampler.start()
+    >>> snapshot = sampler.snapshot
+    >>> sampler.stop()
+
+    :param heatpump: The :class:`HtHeatpump` instance used for the sampling.
+    :type heatpump: ``HtHeatpump``
+    :param interval: The sampling interval in seconds.
+    :type interval: float
+    :param params: The names of the parameters to sample (default :const:`None`, which means all
+        known parameters).
+    :type params: Iterable[str] or None
+    :param index: The index of the parameter definitions (default :const:`None`, which means a new one).
+    :type index: ParamIndex or None
+    :param schedule: The per-parameter sampling schedule (default :const:`None`, which means all parameters
+        are read at every tick); the listeners get the values read at a tick only.
+    :type schedule: PollSchedule or None
+    """
+
+    def __init__(
+        self,
+        heatpump: HtHeatpump,
+        interval: float,
+        params: Optional[Iterable[str]] = None,
+        index: Optional[ParamIndex] = None,
+        schedule: Optional[PollSchedule] = None,
+    ) -> None:
+        assert heatpump is not None, "'heatpump' must not be None"
+        assert interval > 0, "'interval' must be greater than zero"
+        self._heatpump = heatpump
+        self._interval = interval
+        self._index = index if index is not None else ParamIndex()
+        self._params: List[str] = list(params) if params is not None else list(self._index.names)
+        self._schedule = schedule
+        self._snapshot: Optional[ParamSnapshot] = None
+        self._read_times: Dict[str, float] = {}  # time of the last read of the parameters
+        self._listeners: List[Callable[[ParamSnapshot], None]] = []
+        self._listeners_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._reads = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def interval(self) -> float:
+        """Return the sampling interval in seconds."""
+        return self._interval
+
+    @property
+    def schedule(self) -> Optional[PollSchedule]:
+        """Return the per-parameter sampling schedule (or :const:`None` if all parameters are read every tick)."""
+        return self._schedule
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Return the number of requests served from the snapshot (hits) and not served (misses)
+        and the number of parameter reads."""
+        return {"hits": self._hits, "misses": self._misses, "reads": self._reads}
+
+    @property
+    def snapshot(self) -> Optional[ParamSnapshot]:
+        """Return the latest snapshot of the parameter values or :const:`None` if no sample is available yet."""
+        return self._snapshot
+
+    def add_listener(self, listener: Callable[[ParamSnapshot], None]) -> None:
+        """Register a callable which will be called with every new snapshot (from the sampling thread).
+
+        :param listener: The callable to register.
+        :type listener: Callable[[ParamSnapshot], None]
+        """
+        with self._listeners_lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[ParamSnapshot], None]) -> None:
+        """Unregister a callable registered by :meth:`add_listener`.
+
+        :param listener: The callable to unregister.
+        :type listener: Callable[[ParamSnapshot], None]
+        """
+        with self._listeners_lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def get(self, names: Iterable[str], max_age: Optional[float] = None) -> Optional[ParamSnapshot]:
+        """Return the sampled values of the given parameters from the latest snapshot.
+
+        :param names: The names of the requested parameters.
+        :type names: Iterable[str]
+        :param max_age: The maximal accepted age of the snapshot in seconds (default :const:`None`,
+            which means any age).
+        :type max_age: float or None
+        :returns: A snapshot with the values of the requested parameters (with the time of the least recently read
+            one) or :const:`None`, if there is no snapshot available, the values are too old or the snapshot doesn't
+            contain all of the requested parameters.
+        :rtype: ``ParamSnapshot`` or ``None``
+        """
+        snapshot = self._snapshot
+        try:
+            if snapshot is None:
+                raise KeyError
+            names = list(names)
+            res = ParamSnapshot(
+                min((self._read_times[name] for name in names), default=snapshot.timestamp),
+                {name: snapshot.values[name] for name in names},
+            )
+        except KeyError:
+            self._misses += 1
+            return None
+        if max_age is not None and res.age > max_age:
+            self._misses += 1
+            return None
+        self._hits += 1
+        return res
+
+    def invalidate(self, names: Iterable[str]) -> None:
+        """Read the given parameters at the next tick of the schedule (e.g. after they have been written).
+
+        :param names: The names of the parameters.
+        :type names: Iterable[str]
+        """
+        if self._schedule is not None:
+            self._schedule.invalidate(names)
+
+    def sample(self) -> ParamSnapshot:
+        """Read the current values of the sampled parameters (all or the due ones of the schedule) from the
+        heat pump and update the snapshot.
+
+        :returns: The new snapshot.
+        :rtype: ``ParamSnapshot``
+        """
+        names = self._schedule.due(time.monotonic()) if self._schedule is not None else self._params
+        if not names and self._snapshot is not None:
+            return self._snapshot
+        with HtContext(self._heatpump, PRIORITY_BACKGROUND):
+            values, _ = query_params(self._heatpump, names, self._index)
+            timestamp = time.time()  # (still) no write can have happened after the values were read
+        if self._schedule is not None:
+            self._schedule.update(values, time.monotonic())
+        self._reads += len(values)
+        for name in values:
+            self._read_times[name] = timestamp
+        merged = dict(self._snapshot.values) if self._snapshot is not None else {}
+        merged.update(values)
+        snapshot = self._snapshot = ParamSnapshot(timestamp, {name: merged[name] for name in self._params})
+        _LOGGER.debug("sampled %d parameter(s)", len(values))
+        with self._listeners_lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(ParamSnapshot(timestamp, values) if self._schedule is not None else snapshot)
+            except Exception as ex:
+                _LOGGER.error("snapshot listener %s failed: %s", listener, ex)
+        return snapshot
+
+    def start(self) -> None:
+        """Start the background sampling thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="htrest-sampler", daemon=True)
+        self._thread.start()
+        _LOGGER.info("started parameter sampler (interval=%.1fs, %d parameter(s))", self._interval, len(self._params))
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the background sampling thread.
+
+        :param timeout: The maximal time in seconds to wait for the thread to finish.
+        :type timeout: float or None
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        _LOGGER.info("stopped parameter sampler")
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            start = time.monotonic()
+            try:
+                self.sample()
+            except Exception as ex:
+                _LOGGER.error("parameter sampling failed: %s", ex)
+            self._stop_event.wait(max(0.0, self._interval - (time.monotonic() - start)))
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Scheduling of the (strictly serialized) accesses to the serial connection of the heat pump. """
+
+import heapq
+import itertools
+import threading
+from typing import Any, Callable, Dict, Final, Hashable, List, Optional, Tuple
+
+# priorities of the accesses to the heat pump (lower value = higher priority)
+PRIORITY_WRITE: Final = 0  # write accesses (e.g. set a parameter value)
+PRIORITY_READ: Final = 1  # read accesses of single values (e.g. a single parameter)
+PRIORITY_BULK: Final = 2  # bulk read accesses (e.g. all parameters, time programs or the fault list)
+PRIORITY_BACKGROUND: Final = 3  # background tasks (e.g. the parameter sampling)
+
+
+class PriorityLock:
+    """Reentrant lock which grants the access to the waiting thread with the highest priority
+    (lowest value); threads with the same priority are served in the order of their arrival.
+
+    Example:
+
+    >>> lock = PriorityLock()
+    >>> lock.acquire(PRIORITY_WRITE)
+    >>> try:
+    ...     pass  # exclusive access
+    ... finally:
+    ...     lock.release()
+    ...
+    >>>
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition(threading.Lock())
+        self._owner: Optional[int] = None
+        self._count = 0
+        self._waiters: List[Tuple[int, int, int]] = []
+        self._seq = itertools.count()
+
+    def acquire(self, priority: int = PRIORITY_READ) -> None:
+        """Acquire the lock, blocking until all waiting threads with a higher priority are served.
+
+        :param priority: The priority of the access (lower value = higher priority).
+        :type priority: int
+        """
+        ident = threading.get_ident()
+        with self._cond:
+            if self._owner == ident:
+                self._count += 1
+                return
+            entry = (priority, next(self._seq), ident)
+            heapq.heappush(self._waiters, entry)
+            try:
+                while self._owner is not None or self._waiters[0] is not entry:
+                    self._cond.wait()
+            except BaseException:
+                # e.g. a KeyboardInterrupt while waiting; the entry must not block the waiting threads behind it
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiters)
+            self._owner = ident
+            self._count = 1
+
+    def release(self) -> None:
+        """Release the lock.
+
+        :raises RuntimeError:
+            Will be raised if the lock isn't owned by the calling thread.
+        """
+        with self._cond:
+            if self._owner != threading.get_ident():
+                raise RuntimeError("cannot release un-acquired lock")
+            self._count -= 1
+            if self._count == 0:
+                self._owner = None
+                self._cond.notify_all()
+
+    @property
+    def waiting(self) -> int:
+        """Return the number of threads waiting for the lock."""
+        with self._cond:
+            return len(self._waiters)
+
+    def __enter__(self) -> "PriorityLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Merges identical operations which are in flight at the same time, so that the operation
+    is only performed once and all callers share its result.
+
+    Example:
+
+    >>> single_flight = SingleFlight()
+    >>> value = single_flight.do(("get_param", "Temp. Aussen"), lambda: ht_heatpump.get_param("Temp. Aussen"))
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._merged = 0
+
+    @property
+    def merged(self) -> int:
+        """Return the number of operations which were merged into an operation in flight."""
+        return self._merged
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """Perform the given operation or wait for the result of an identical operation in flight.
+
+        :param key: The key which identifies the operation.
+        :type key: Hashable
+        :param func: The operation to perform.
+        :type func: Callable
+        :returns: The (shared) result of the operation; must not be modified by the caller!
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+            else:
+                self._merged += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
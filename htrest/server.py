@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Multi-threaded WSGI server for the production use of the REST API (instead of the Flask development server). """
+
+import json
+import logging
+import signal
+import socket
+import threading
+import time
+from typing import Final, Optional
+
+from flask import Flask, Response
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from .startup import RETRY_AFTER
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+# content type of the endless responses which are served outside of the bounded worker threads
+STREAM_MIMETYPE: Final = "text/event-stream"
+
+
+class _RequestHandler(WSGIRequestHandler):
+    # allow chunked responses (e.g. the event stream); note that werkzeug closes the connection after every
+    # response, so there are no keep-alive connections
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        # clients which don't send their request (or don't receive the response) in time are disconnected
+        # after the client timeout, so that they don't block a worker thread
+        super().setup()
+        self.connection.settimeout(self.server.client_timeout)  # type: ignore[attr-defined]
+
+    def log_request(self, code="-", size="-") -> None:
+        _LOGGER.debug("%s - %r %s %s", self.address_string(), self.requestline, code, size)
+
+
+class _StreamDetacher:
+    """WSGI middleware which detaches the connections answered by an event stream from the bounded worker
+    threads of the :class:`HtServer` or answers them with ``503 Service Unavailable``, if there are already
+    too many streams.
+    """
+
+    def __init__(self, app, server: "HtServer") -> None:
+        self._app = app
+        self._server = server
+
+    def __call__(self, environ, start_response):
+        stream = []
+
+        def stream_start_response(status, headers, exc_info=None):
+            if any(key.lower() == "content-type" and value.startswith(STREAM_MIMETYPE) for key, value in headers):
+                stream.append((status, headers, exc_info))  # decided below, once the app returned
+                return None
+            return start_response(status, headers, exc_info)
+
+        app_iter = self._app(environ, stream_start_response)
+        if not stream:
+            return app_iter
+        if not self._server.detach():
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+            _LOGGER.warning("too many event streams (max. %d), request refused", self._server.max_streams)
+            response = Response(
+                json.dumps({"message": "Too many event streams, please try again later"}) + "\n",
+                503,
+                mimetype="application/json",
+                headers={"Retry-After": str(RETRY_AFTER)},
+            )
+            return response(environ, start_response)
+        start_response(*stream[0])
+        return app_iter
+
+
+class HtServer(BaseWSGIServer):
+    """Multi-threaded WSGI server with a bounded number of worker threads.
+
+    Every connection is served by its own worker thread; if all workers are busy, no further connections are
+    accepted and new clients wait in the (bounded) listen backlog of the socket. Clients which don't send their
+    request in time are disconnected after ``client_timeout`` seconds, so that a single slow client doesn't stall
+    the whole API. The connection is closed after every response (no keep-alive). Connections answered by an
+    event stream (e.g. ``GET /api/v1/stream``) don't count as busy workers, but at most ``max_streams`` of them
+    are served at the same time; further streams are refused with ``503 Service Unavailable``. All threads
+    share the one heat pump connection of the app, whose accesses are serialized by the
+    :class:`~htrest.session.HtSession`.
+
+    Example:
+
+    >>> server = HtServer("0.0.0.0", 8777, app, threads=8)
+    >>> server.serve_forever()
+
+    :param host: The hostname to listen on.
+    :type host: str
+    :param port: The port to listen on.
+    :type port: int
+    :param app: The WSGI application.
+    :type app: ``Flask``
+    :param threads: The maximal number of worker threads (concurrent connections).
+    :type threads: int
+    :param backlog: The maximal number of connections waiting in the listen backlog.
+    :type backlog: int
+    :param client_timeout: The time in seconds after which a client which doesn't send or receive data is
+        disconnected.
+    :type client_timeout: float
+    :param max_streams: The maximal number of concurrent event streams.
+    :type max_streams: int
+    :param sock: An already bound and listening socket to take over (default :const:`None`).
+    :type sock: ``socket.socket`` or ``None``
+    """
+
+    multithread = True
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        app: Flask,
+        threads: int = 8,
+        backlog: int = 64,
+        client_timeout: float = 5,
+        max_streams: int = 16,
+        sock: Optional[socket.socket] = None,
+    ) -> None:
+        assert threads > 0, "'threads' must be greater than zero"
+        self.request_queue_size = backlog  # used by 'server_activate'
+        self.client_timeout = client_timeout
+        self.max_streams = max_streams
+        self._threads = threads
+        self._slots = threading.BoundedSemaphore(threads)
+        self._streams = threading.BoundedSemaphore(max_streams) if max_streams > 0 else None
+        self._worker = threading.local()
+        self._stopping = threading.Event()
+        super().__init__(
+            host,
+            port,
+            _StreamDetacher(app, self),
+            handler=_RequestHandler,
+            fd=sock.fileno() if sock is not None else None,
+        )
+
+    @property
+    def active(self) -> int:
+        """Return the number of busy worker threads."""
+        return self._threads - self._slots._value  # type: ignore[attr-defined]
+
+    @property
+    def streams(self) -> int:
+        """Return the number of active event streams."""
+        return self.max_streams - self._streams._value if self._streams else 0  # type: ignore[attr-defined]
+
+    def detach(self) -> bool:
+        """Detach the connection served by the calling worker thread from the bounded worker threads, because it
+        is answered by an (endless) event stream.
+
+        :returns: :const:`True` if the connection was detached, :const:`False` if there are already too many
+            event streams.
+        :rtype: ``bool``
+        """
+        if self._streams is None or not self._streams.acquire(blocking=False):
+            return False
+        self._worker.detached = True
+        self._slots.release()
+        return True
+
+    def process_request(self, request, client_address) -> None:
+        # wait for a free worker (while waiting, further connections queue up in the listen backlog)
+        while not self._slots.acquire(timeout=0.5):
+            if self._stopping.is_set():
+                self.shutdown_request(request)
+                return
+        thread = threading.Thread(
+            target=self._process, args=(request, client_address), name="htrest-worker", daemon=True
+        )
+        thread.start()
+
+    def _process(self, request, client_address) -> None:
+        self._worker.detached = False
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            if self._worker.detached:
+                self._streams.release()  # type: ignore[union-attr]
+            else:
+                self._slots.release()
+
+    def handle_error(self, request, client_address) -> None:
+        _LOGGER.exception("error while serving the connection from %s", client_address)
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """Stop accepting new connections and wait until the active ones are finished (without the event
+        streams, which don't end by themselves).
+
+        Must not be called from the thread which runs :meth:`serve_forever`.
+
+        :param timeout: The maximal time in seconds to wait for the active connections (:const:`None` = forever).
+        :type timeout: float or None
+        :returns: :const:`True` if all connections finished in time, :const:`False` otherwise.
+        :rtype: ``bool``
+        """
+        self._stopping.set()
+        self.shutdown()  # wait until 'serve_forever' returns
+        self.socket.close()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        acquired = 0
+        while acquired < self._threads:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not self._slots.acquire(timeout=remaining):
+                break
+            acquired += 1
+        for _ in range(acquired):
+            self._slots.release()
+        if acquired < self._threads:
+            _LOGGER.warning("%d connection(s) still active after %s seconds", self._threads - acquired, timeout)
+            return False
+        return True
+
+
+def serve(
+    app: Flask,
+    host: str,
+    port: int,
+    threads: int = 8,
+    backlog: int = 64,
+    client_timeout: float = 5,
+    max_streams: int = 16,
+    shutdown_timeout: float = 10,
+    sock: Optional[socket.socket] = None,
+) -> None:
+    """Serve the app by a :class:`HtServer` until ``SIGINT`` or ``SIGTERM`` is received.
+
+    On shutdown no further connections are accepted and the active ones get ``shutdown_timeout`` seconds to
+    finish; afterwards the function returns, so that the heat pump connection is closed on the exit of
+    the process (see :func:`~htrest.app.create_app`).
+
+    :param app: The WSGI application.
+    :type app: ``Flask``
+    :param host: The hostname to listen on.
+    :type host: str
+    :param port: The port to listen on.
+    :type port: int
+    :param threads: The maximal number of worker threads (concurrent connections).
+    :type threads: int
+    :param backlog: The maximal number of connections waiting in the listen backlog.
+    :type backlog: int
+    :param client_timeout: The time in seconds after which a client which doesn't send or receive data is
+        disconnected.
+    :type client_timeout: float
+    :param max_streams: The maximal number of concurrent event streams.
+    :type max_streams: int
+    :param shutdown_timeout: The maximal time in seconds to wait for the active connections on shutdown.
+    :type shutdown_timeout: float
+    :param sock: An already bound and listening socket to take over (default :const:`None`, which means
+        the socket is created for the given host and port).
+    :type sock: ``socket.socket`` or ``None``
+    """
+    server = HtServer(
+        host,
+        port,
+        app,
+        threads=threads,
+        backlog=backlog,
+        client_timeout=client_timeout,
+        max_streams=max_streams,
+        sock=sock,
+    )
+    stopper: Optional[threading.Thread] = None
+
+    def on_signal(signum, frame) -> None:
+        nonlocal stopper
+        if stopper is None:
+            _LOGGER.info("received signal %d, shutting down the server", signum)
+            # 'shutdown' blocks until 'serve_forever' returns, so it must run in another thread
+            stopper = threading.Thread(target=server.stop, args=(shutdown_timeout,), name="htrest-shutdown")
+            stopper.start()
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, on_signal)
+    _LOGGER.info(
+        "serving on %s:%d (threads=%d, backlog=%d, client timeout=%.1fs, max. streams=%d)",
+        host,
+        server.port,
+        threads,
+        backlog,
+        client_timeout,
+        max_streams,
+    )
+    try:
+        server.serve_forever()
+    finally:
+        if stopper is not None:
+            stopper.join()
+        server.server_close()
+    _LOGGER.info("server stopped")
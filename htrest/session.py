@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Login session management for the connection to the heat pump. """
+
+import logging
+import threading
+import time
+import weakref
+from typing import Dict, Final, Optional
+
+from htheatpump import HtHeatpump
+
+from .scheduler import PRIORITY_BACKGROUND, PRIORITY_READ, PriorityLock, SingleFlight
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+
+class HtSession:
+    """Login session on the heat pump, which serializes the access to the connection and
+    keeps the heat pump logged in across several requests.
+
+    Concurrent accesses are granted in the order of their priority (see :mod:`htrest.scheduler`)
+    and identical read operations in flight can be merged by the :attr:`single_flight` of the session.
+
+    If an idle timeout is given, the heat pump stays logged in until the session was unused
+    for the specified time; a failed operation invalidates the session, so the next access
+    will perform a new login. Without an idle timeout a login/logout is performed for every access.
+
+    Example:
+
+    >>> session = HtSession.register(ht_heatpump, idle_timeout=60.0)
+    >>> session.acquire()
+    >>> try:
+    ...     print(ht_heatpump.get_version())
+    ... finally:
+    ...     session.release()
+    ...
+    >>>
+
+    :param heatpump: The :class:`HtHeatpump` instance.
+    :type heatpump: ``HtHeatpump``
+    :param idle_timeout: The idle time in seconds after which a logout is performed
+        (default ``0``, which means a logout after every access).
+    :type idle_timeout: float
+    """
+
+    _sessions: Final[weakref.WeakKeyDictionary] = weakref.WeakKeyDictionary()
+    _sessions_lock: Final = threading.Lock()
+
+    def __init__(self, heatpump: HtHeatpump, idle_timeout: float = 0) -> None:
+        assert heatpump is not None, "'heatpump' must not be None"
+        self._heatpump = heatpump
+        self._idle_timeout = max(0.0, idle_timeout)
+        self._lock = PriorityLock()
+        self._single_flight = SingleFlight()
+        self._depth = 0
+        self._logged_in = False
+        self._invalidated = False
+        self._last_used = time.monotonic()
+        self._stats: Dict[str, int] = {"logins": 0, "logouts": 0, "reuses": 0, "reconnects": 0}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if self._idle_timeout > 0:
+            self._thread = threading.Thread(target=self._run, name="htrest-session", daemon=True)
+            self._thread.start()
+
+    @classmethod
+    def register(cls, heatpump: HtHeatpump, idle_timeout: float = 0) -> "HtSession":
+        """Create a new session for the given :class:`HtHeatpump` instance and register it.
+
+        :param heatpump: The :class:`HtHeatpump` instance.
+        :type heatpump: ``HtHeatpump``
+        :param idle_timeout: The idle time in seconds after which a logout is performed.
+        :type idle_timeout: float
+        :returns: The new session.
+        :rtype: ``HtSession``
+        """
+        session = cls(heatpump, idle_timeout)
+        with cls._sessions_lock:
+            cls._sessions[heatpump] = session
+        return session
+
+    @classmethod
+    def of(cls, heatpump: HtHeatpump) -> "HtSession":
+        """Return the registered session of the given :class:`HtHeatpump` instance.
+
+        A session without idle timeout is created and registered if there is none.
+
+        :param heatpump: The :class:`HtHeatpump` instance.
+        :type heatpump: ``HtHeatpump``
+        :returns: The session of the heat pump instance.
+        :rtype: ``HtSession``
+        """
+        with cls._sessions_lock:
+            session = cls._sessions.get(heatpump)
+            if session is None:
+                session = cls._sessions[heatpump] = cls(heatpump)
+            return session
+
+    @property
+    def heatpump(self) -> HtHeatpump:
+        """Return the :class:`HtHeatpump` instance of the session."""
+        return self._heatpump
+
+    @property
+    def idle_timeout(self) -> float:
+        """Return the idle timeout of the session in seconds."""
+        return self._idle_timeout
+
+    @property
+    def logged_in(self) -> bool:
+        """Return :const:`True` if the heat pump is currently logged in."""
+        return self._logged_in
+
+    @property
+    def single_flight(self) -> SingleFlight:
+        """Return the :class:`~htrest.scheduler.SingleFlight` which merges identical read operations in flight."""
+        return self._single_flight
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Return the counters of the session (number of logins, logouts, reuses, reconnects and merged reads)."""
+        return dict(self._stats, merged=self._single_flight.merged)
+
+    def acquire(self, priority: int = PRIORITY_READ) -> None:
+        """Acquire exclusive access to the heat pump and make sure it is logged in.
+
+        :param priority: The priority of the access (lower value = higher priority).
+        :type priority: int
+        """
+        self._lock.acquire(priority)
+        self._depth += 1
+        if self._depth > 1:
+            return
+        try:
+            if self._logged_in:
+                self._stats["reuses"] += 1
+                return
+            self._heatpump.login()  # Hint: login() will also try a reconnect on failure
+            self._logged_in = True
+            self._stats["logins"] += 1
+            if self._invalidated:
+                self._stats["reconnects"] += 1
+                self._invalidated = False
+        except BaseException:
+            self._depth -= 1
+            self._lock.release()
+            raise
+
+    def release(self, failed: bool = False) -> None:
+        """Release the access to the heat pump acquired by :meth:`acquire`.
+
+        :param failed: :const:`True` if an operation on the heat pump failed, which invalidates the login.
+        :type failed: bool
+        """
+        try:
+            self._depth -= 1
+            if self._depth == 0:
+                self._last_used = time.monotonic()
+                if self._idle_timeout <= 0 and self._logged_in:
+                    self._logout()
+            if failed:
+                self._logged_in = False
+                self._invalidated = True
+        finally:
+            self._lock.release()
+
+    def close(self) -> None:
+        """Stop the idle supervision and logout from the heat pump."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self._logged_in:
+                self._logout()
+        _LOGGER.info("closed heat pump session (%s)", self.stats)
+
+    def _logout(self) -> None:
+        self._logged_in = False
+        self._stats["logouts"] += 1
+        try:
+            self._heatpump.logout()
+        except Exception as ex:
+            _LOGGER.warning("logout failed: %s", ex)
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(min(self._idle_timeout, 1.0)):
+            if not self._logged_in or time.monotonic() - self._last_used < self._idle_timeout:
+                continue
+            self._lock.acquire(PRIORITY_BACKGROUND)
+            try:
+                if self._logged_in and time.monotonic() - self._last_used >= self._idle_timeout:
+                    _LOGGER.debug("logout after %.1fs of inactivity", self._idle_timeout)
+                    self._logout()
+            finally:
+                self._lock.release()
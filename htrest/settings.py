@@ -29,7 +29,5 @@ RESTX_MASK_SWAGGER: Final = False
 RESTX_ERROR_404_HELP: Final = False
 RESTX_BUNDLE_ERRORS: Final = True
 
-# boolean values are treated as integers (with false equivalent to 0 and true equivalent to 1)
-BOOL_AS_INT: bool = False
 # no write accesses to the heat pump; if you want to be sure, that nothing will be manipulated
 READ_ONLY: bool = False
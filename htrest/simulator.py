@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" In-process simulator of a Heliotherm heat pump for running the server without real hardware.
+
+    The simulator replaces the serial port of :class:`~htheatpump.HtHeatpump` and answers the requests on the
+    level of the serial protocol. Thus, the complete request/response handling of the :mod:`htheatpump` package
+    is exercised and the transmission of each request and response is delayed according to the configured baudrate.
+"""
+
+import datetime
+import logging
+import random
+import re
+import threading
+import time
+from typing import Dict, Final, List, Optional, Tuple
+
+from htheatpump import HtDataTypes, HtHeatpump, HtParams
+from htheatpump.htparams import HtParamValueType
+from htheatpump.protocol import calc_checksum
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+
+BITS_PER_BYTE: Final = 10  # 8 data bits + start bit + stop bit
+PROCESSING_TIME: Final = 0.01  # (assumed) time in seconds the heat pump needs to process a request
+
+_RESPONSE_HEADER: Final = b"\x02\xfd\xe0\xd0\x00\x00"
+_REQUEST_RE: Final = re.compile(rb"^.{6}.~([^;]*);.$", re.DOTALL)
+
+
+class SimulatedDevice:
+    """State of a simulated heat pump (parameter values, date and time, fault list and time programs),
+    which answers the commands of the serial protocol.
+
+    The values of the read-only measurement parameters ("MP" data points) vary slightly on each access.
+
+    :param serial_number: The serial number of the simulated heat pump.
+    :type serial_number: int
+    :param seed: The seed of the random number generator used for the parameter values.
+    :type seed: int
+    """
+
+    VERSION: Final = ("3.0.20", 2321)
+    TIME_PROGS: Final = (("Warmwasser", 7, 2, 15, 7), ("Zirkulationspumpe", 7, 2, 15, 7), ("Heizung", 7, 3, 15, 7))
+
+    def __init__(self, serial_number: int = 123456, seed: int = 0) -> None:
+        self._serial_number = serial_number
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._values: Dict[str, HtParamValueType] = {}
+        for name, param in HtParams.items():
+            if param.data_type == HtDataTypes.FLOAT:
+                self._values[name] = round((param.min_val + param.max_val) / 2, 1)  # type: ignore[operator]
+            else:
+                self._values[name] = param.min_val  # type: ignore[assignment]
+        self._mp_names = {param.dp_number: name for name, param in HtParams.items() if param.dp_type == "MP"}
+        self._clock_offset = datetime.timedelta()
+        now = datetime.datetime.now().replace(microsecond=0)
+        self._faults: List[Tuple[int, datetime.datetime, str]] = [
+            (20 + i % 7, now - datetime.timedelta(days=60 - i), "EQ_Spreizung" if i % 2 else "Hochdruck")
+            for i in range(50)
+        ]
+        self._time_progs: List[Dict[Tuple[int, int], Tuple[int, str, str]]] = [
+            {(day, num): (num % 2, "{:02d}:00".format(num * 3), "{:02d}:00".format(num * 3 + 2))
+             for day in range(nod) for num in range(ead)}
+            for _, ead, _, _, nod in self.TIME_PROGS
+        ]
+
+    def _value(self, name: str) -> HtParamValueType:
+        param = HtParams[name]
+        val = self._values[name]
+        if param.dp_type == "MP" and param.data_type == HtDataTypes.FLOAT:
+            # let the measurement values drift a little bit within their limits
+            val = round(min(max(val + self._random.uniform(-0.2, 0.2), param.min_val), param.max_val), 1)
+            self._values[name] = val
+        return val
+
+    def _param(self, name: str) -> str:
+        param = HtParams[name]
+        return "{},NAME={},VAL={},MAX={},MIN={}".format(
+            param.cmd(),
+            name,
+            param.to_str(self._value(name)),
+            param.to_str(param.max_val),
+            param.to_str(param.min_val),
+        )
+
+    def _fault(self, idx: int) -> str:
+        if not 0 <= idx < len(self._faults):
+            return "ERR,INVALID IDX"
+        err, dt, msg = self._faults[idx]
+        return "AA,{:d},{:d},{},{}".format(idx, err, dt.strftime("%d.%m.%y-%H:%M:%S"), msg)
+
+    def _clock(self) -> str:
+        dt = datetime.datetime.now() + self._clock_offset
+        return "CLK,DA={},TI={},WD={:d}".format(dt.strftime("%d.%m.%y"), dt.strftime("%H:%M:%S"), dt.isoweekday())
+
+    def _time_prog(self, idx: int) -> str:
+        name, ead, nos, ste, nod = self.TIME_PROGS[idx]
+        return "PRI{:d},NAME={},EAD={:d},NOS={:d},STE={:d},NOD={:d},ACS=0,US=1".format(idx, name, ead, nos, ste, nod)
+
+    def _time_prog_entry(self, idx: int, day: int, num: int) -> str:
+        st, beg, end = self._time_progs[idx][(day, num)]
+        return "PRE,PR={:d},DAY={:d},EV={:d},ST={:d},BEG={},END={}".format(idx, day, num, st, beg, end)
+
+    def respond(self, cmd: str) -> List[str]:
+        """Return the response messages of the heat pump for the given command.
+
+        :param cmd: The command (without header and trailer), e.g. ``"SP,NR=9"``.
+        :type cmd: str
+        :returns: The response messages (without header and trailer).
+        :rtype: ``list`` of ``str``
+        """
+        with self._lock:
+            try:
+                return self._respond(cmd)
+            except (KeyError, IndexError, ValueError) as ex:
+                _LOGGER.debug("invalid command %r: %s", cmd, ex)
+                return ["ERR,INVALID CMD"]
+
+    def _respond(self, cmd: str) -> List[str]:
+        if cmd in ("LIN", "LOUT"):
+            return ["OK"]
+        if cmd == "RID":
+            return ["RID,{:d}".format(self._serial_number)]
+        if cmd == "SP,NR=9":
+            return ["SP,NR=9,ID=9,NAME={},LV=0,MT=0,VAL={:d},MAX=0,MIN=0".format(*self.VERSION)]
+        m = re.match(r"^(SP|MP),NR=(\d+)(?:,VAL=(.+))?$", cmd)
+        if m:
+            name = next(n for n, p in HtParams.items() if p.dp_type == m.group(1) and p.dp_number == int(m.group(2)))
+            if m.group(3) is not None:
+                self._values[name] = HtParams[name].from_str(m.group(3))
+            return [self._param(name)]
+        if cmd.startswith("MR,"):
+            resp = []
+            for number in (int(nr) for nr in cmd.split(",")[1:]):
+                name = self._mp_names[number]
+                resp.append("MA,{:d},{},{:d}".format(number, HtParams[name].to_str(self._value(name)), 17))
+            return resp
+        if cmd == "CLK":
+            return [self._clock()]
+        m = re.match(r"^CLK,DA=(\d\d)\.(\d\d)\.(\d\d),TI=(\d\d):(\d\d):(\d\d),WD=\d$", cmd)
+        if m:
+            day, month, year, hour, minute, second = (int(g) for g in m.groups())
+            dt = datetime.datetime(2000 + year, month, day, hour, minute, second)
+            self._clock_offset = dt - datetime.datetime.now()
+            return [self._clock()]
+        if cmd == "ALC":
+            return [self._fault(len(self._faults) - 1)]
+        if cmd == "ALS":
+            return ["SUM={:d}".format(len(self._faults))]
+        if cmd.startswith("AR,"):
+            return [self._fault(int(idx)) for idx in cmd.split(",")[1:]]
+        if cmd == "PRL":
+            return ["SUM={:d}".format(len(self.TIME_PROGS))] + [self._time_prog(i) for i in range(len(self.TIME_PROGS))]
+        m = re.match(r"^PR([ID])(\d+)$", cmd)
+        if m:
+            idx = int(m.group(2))
+            resp = [self._time_prog(idx)]
+            if m.group(1) == "D":
+                resp += [self._time_prog_entry(idx, day, num) for day, num in sorted(self._time_progs[idx])]
+            return resp
+        m = re.match(r"^PRE,PR=(\d+),DAY=(\d+),EV=(\d+)(?:,ST=(\d+),BEG=([\d:]+),END=([\d:]+))?$", cmd)
+        if m:
+            idx, day, num = (int(g) for g in m.group(1, 2, 3))
+            if (day, num) not in self._time_progs[idx]:
+                raise KeyError((day, num))
+            if m.group(4) is not None:
+                self._time_progs[idx][(day, num)] = (int(m.group(4)), m.group(5), m.group(6))
+            return [self._time_prog_entry(idx, day, num)]
+        raise ValueError("unknown command")
+
+    def add_fault(self, error: int, message: str) -> None:
+        """Append a new entry to the fault list of the simulated heat pump.
+
+        :param error: The error code of the new entry.
+        :type error: int
+        :param message: The error message of the new entry.
+        :type message: str
+        """
+        with self._lock:
+            self._faults.append((error, datetime.datetime.now().replace(microsecond=0), message))
+
+
+class SimulatedSerial:
+    """Replacement of a :class:`serial.Serial` port connected to a :class:`SimulatedDevice`.
+
+    The transmission of the request and response bytes is delayed according to the given baudrate; each
+    request additionally takes a constant processing time of the heat pump.
+
+    :param device: The simulated heat pump.
+    :type device: SimulatedDevice
+    :param baudrate: The baudrate of the (simulated) serial connection.
+    :type baudrate: int
+    :param time_scale: Factor applied to all delays (``0`` = no delays at all).
+    :type time_scale: float
+    """
+
+    def __init__(self, device: SimulatedDevice, baudrate: int, time_scale: float = 1.0) -> None:
+        self._device = device
+        self._baudrate = baudrate
+        self.time_scale = time_scale
+        self._buffer = bytearray()
+        self.is_open = True
+
+    def __repr__(self) -> str:
+        return "{}(baudrate={}, time_scale={})".format(self.__class__.__name__, self._baudrate, self.time_scale)
+
+    def _delay(self, num_bytes: int, processing: bool = False) -> None:
+        seconds = num_bytes * BITS_PER_BYTE / self._baudrate + (PROCESSING_TIME if processing else 0)
+        seconds *= self.time_scale
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def write(self, data: bytes) -> int:
+        """Transmit a request to the simulated heat pump and queue its response(s)."""
+        self._delay(len(data), processing=True)
+        m = _REQUEST_RE.match(data)
+        if not m or calc_checksum(data[:-1]) != data[-1]:
+            _LOGGER.warning("invalid request %s", data)
+            return len(data)
+        for resp in self._device.respond(m.group(1).decode("ascii")):
+            payload = "~{};\r\n".format(resp).encode("ascii")
+            msg = _RESPONSE_HEADER + bytes([len(payload)]) + payload
+            self._buffer += msg + bytes([calc_checksum(msg)])
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        """Receive up to the given number of bytes of the queued response(s)."""
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self._delay(len(data))
+        return data
+
+    def reset_input_buffer(self) -> None:
+        self._buffer.clear()
+
+    def reset_output_buffer(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.is_open = False
+
+
+class HtHeatpumpSimulator(HtHeatpump):
+    """Drop-in replacement of :class:`~htheatpump.HtHeatpump` which talks to a :class:`SimulatedDevice`
+    instead of a heat pump connected on a serial port.
+
+    :param device: The name of the (simulated) serial device; only used for logging.
+    :type device: str
+    :param baudrate: The baudrate of the (simulated) serial connection.
+    :type baudrate: int
+    :param time_scale: Factor applied to all simulated transmission delays (``0`` = no delays at all).
+    :type time_scale: float
+    :param simulated_device: The simulated heat pump; a new one will be created if not given.
+    :type simulated_device: SimulatedDevice
+    """
+
+    def __init__(
+        self,
+        device: str = "simulator",
+        baudrate: int = 115200,
+        time_scale: float = 1.0,
+        simulated_device: Optional[SimulatedDevice] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(device, baudrate=baudrate, **kwargs)
+        self._time_scale = time_scale
+        self._device = simulated_device or SimulatedDevice()
+
+    def __repr__(self) -> str:
+        return "{}(baudrate={}, time_scale={})".format(
+            self.__class__.__name__, self._ser_settings["baudrate"], self._time_scale
+        )
+
+    @property
+    def device(self) -> SimulatedDevice:
+        """Return the simulated heat pump."""
+        return self._device
+
+    @property
+    def time_scale(self) -> float:
+        """Return the factor applied to all simulated transmission delays."""
+        return self._time_scale
+
+    @time_scale.setter
+    def time_scale(self, val: float) -> None:
+        self._time_scale = val
+        if self._ser:  # type: ignore[has-type]
+            self._ser.time_scale = val  # type: ignore[has-type]
+
+    def open_connection(self) -> None:
+        if self._ser:  # type: ignore[has-type]
+            raise IOError("serial connection already open")
+        self._ser = SimulatedSerial(self._device, self._ser_settings["baudrate"], self._time_scale)  # type: ignore
+        _LOGGER.info(self._ser)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Startup of the server: connection to the heat pump (at once or in the background) and health endpoints. """
+
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, Final, Optional
+
+from flask import Blueprint, Flask, Response, current_app, render_template, request
+from flask_restx import Api
+from htheatpump import HtHeatpump
+
+from .apis.utils import HtContext
+from .scheduler import PRIORITY_WRITE
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+blueprint: Final = Blueprint("health", __name__)
+
+# the health endpoints of the server
+HEALTH_LIVE: Final = "/health/live"
+HEALTH_READY: Final = "/health/ready"
+# suggested delay in seconds for the clients until they retry a request during the startup
+RETRY_AFTER: Final = 5
+
+
+class HtConnector:
+    """Establishes the connection to the heat pump, either at once (:meth:`connect`) or in a background thread
+    (:meth:`start`), which retries a failed connection attempt with an exponentially growing delay.
+
+    After the login, the ``on_connect`` callback is called with the heat pump still logged in (e.g. to read
+    the identity of the heat pump); after a successful connection the ``on_ready`` callback (e.g. to start
+    the background sampling) and the app is ready to serve the requests on the heat pump.
+
+    Example:
+
+    >>> connector = HtConnector(ht_heatpump, on_connect=lambda: registry.refresh(), on_ready=sampler.start)
+    >>> connector.start()
+    >>> connector.wait(timeout=60)
+    True
+
+    :param heatpump: The :class:`HtHeatpump` instance.
+    :type heatpump: ``HtHeatpump``
+    :param on_connect: Callable which is called after the login on the heat pump.
+    :type on_connect: Callable[[], None] or None
+    :param on_ready: Callable which is called after a successful connection.
+    :type on_ready: Callable[[], None] or None
+    :param max_delay: The maximal delay in seconds between two connection attempts.
+    :type max_delay: float
+    """
+
+    def __init__(
+        self,
+        heatpump: HtHeatpump,
+        on_connect: Optional[Callable[[], None]] = None,
+        on_ready: Optional[Callable[[], None]] = None,
+        max_delay: float = 30,
+    ) -> None:
+        assert heatpump is not None, "'heatpump' must not be None"
+        self._heatpump = heatpump
+        self._on_connect = on_connect
+        self._on_ready = on_ready
+        self._max_delay = max_delay
+        self._started = time.monotonic()
+        self._ready = threading.Event()
+        self._attempts = 0
+        self._error: Optional[str] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        """Return :const:`True` if the connection to the heat pump has been established."""
+        return self._ready.is_set()
+
+    @property
+    def status(self) -> Dict[str, object]:
+        """Return the state of the connection, the number of connection attempts, the error of the last
+        failed attempt and the uptime in seconds."""
+        return {
+            "status": "ready" if self.ready else "connecting",
+            "attempts": self._attempts,
+            "error": self._error,
+            "uptime": time.monotonic() - self._started,
+        }
+
+    def connect(self) -> None:
+        """Connect to the heat pump.
+
+        :raises Exception:
+            If the connection or the login on the heat pump failed.
+        """
+        self._attempts += 1
+        try:
+            if not self._heatpump.is_open:
+                self._heatpump.open_connection()
+            with HtContext(self._heatpump, PRIORITY_WRITE):
+                if self._on_connect is not None:
+                    self._on_connect()
+        except Exception as ex:
+            self._error = str(ex)
+            raise
+        self._error = None
+        self._ready.set()
+        _LOGGER.info("connected to heat pump after %.1fs (%d attempt(s))", self.status["uptime"], self._attempts)
+        if self._on_ready is not None:
+            self._on_ready()
+
+    def start(self) -> None:
+        """Connect to the heat pump in a background thread (until it succeeds or :meth:`stop` is called)."""
+        if self.ready or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="htrest-connect", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the background connection attempts.
+
+        :param timeout: The maximal time in seconds to wait for the thread to finish.
+        :type timeout: float or None
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the connection to the heat pump has been established.
+
+        :param timeout: The maximal time in seconds to wait.
+        :type timeout: float or None
+        :returns: :const:`True` if the connection has been established.
+        :rtype: bool
+        """
+        return self._ready.wait(timeout)
+
+    def _run(self) -> None:
+        delay = 1.0
+        while not self._stop_event.is_set():
+            try:
+                self.connect()
+                return
+            except Exception as ex:
+                _LOGGER.warning("connection attempt #%d failed (retry in %.0fs): %s", self._attempts, delay, ex)
+            if self._stop_event.wait(delay):
+                return
+            delay = min(delay * 2, self._max_delay)
+
+
+def cache_spec(app: Flask, api: Api, base_path: Optional[str] = None) -> None:
+    """Generate the OpenAPI (Swagger) document of the API once and serve it from memory.
+
+    :param app: The Flask app.
+    :type app: ``Flask``
+    :param api: The API, whose ``specs`` endpoint is registered in the app.
+    :type api: ``Api``
+    :param base_path: The path under which the API is served to the clients, if it differs from the one of the
+        app (e.g. ``/api/v1/<unit>`` if the app serves a unit, see :mod:`htrest.units`); the documentation page
+        then refers to the document under this path as well.
+    :type base_path: str or None
+    """
+    with app.test_request_context():
+        schema = api.__schema__
+        specs_url = api.specs_url
+    if base_path is not None:
+        schema = dict(schema, basePath=base_path)
+        specs_url = base_path + "/" + specs_url.rpartition("/")[2]
+
+        def doc():
+            return render_template("swagger-ui.html", title=api.title, specs_url=specs_url)
+
+        app.view_functions["{}.doc".format(api.blueprint.name)] = doc
+    body = json.dumps(schema) + "\n"
+
+    def specs():
+        return Response(body, content_type="application/json")
+
+    app.view_functions["{}.specs".format(api.blueprint.name)] = specs
+    _LOGGER.info("cached OpenAPI document of the API (%d bytes)", len(body))
+
+
+@blueprint.route(HEALTH_LIVE)
+def live():
+    """Returns the liveness of the server (the server is up and serves requests)."""
+    _LOGGER.debug("*** [GET] %s", request.url)
+    return {"status": "alive"}
+
+
+@blueprint.route(HEALTH_READY)
+def ready():
+    """Returns the readiness of the server (the connection to the heat pump has been established)."""
+    _LOGGER.debug("*** [GET] %s", request.url)
+    connector = current_app.ht_connector  # type: ignore[attr-defined]
+    if connector.ready:
+        return connector.status
+    return connector.status, 503, {"Retry-After": str(RETRY_AFTER)}
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Hub for live subscriptions on heat pump parameters, which samples the union of all subscriptions. """
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Final, Iterable, List, Optional
+
+from htheatpump import HtHeatpump
+
+from .apis.utils import HtContext
+from .feed import DeltaFilter
+from .params import ParamIndex
+from .sampler import ParamSnapshot
+from .scheduler import PRIORITY_BACKGROUND
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Subscription of a single client on a set of heat pump parameters, created by :meth:`SubscriptionHub.subscribe`.
+
+    The callback is called (from the sampling thread of the hub) with a snapshot of the changed values of the
+    subscribed parameters only; after every change of the subscribed parameters the current values of all of
+    them are delivered once again.
+    """
+
+    def __init__(self, hub: "SubscriptionHub", callback: Callable[[ParamSnapshot], None]) -> None:
+        self._hub = hub
+        self._callback = callback
+        self._deadbands: Dict[str, float] = {}
+        self._filter = DeltaFilter({})
+
+    @property
+    def names(self) -> List[str]:
+        """Return the names of the subscribed parameters."""
+        return list(self._deadbands.keys())
+
+    def add(self, deadbands: Dict[str, float]) -> None:
+        """Subscribe the given parameters.
+
+        :param deadbands: The parameter names with their deadband; a numeric value is only delivered if it differs
+            by more than the deadband from the last delivered value.
+        :type deadbands: dict
+        :raises ValueError:
+            If a parameter is unknown, doesn't represent a "MP" data point or has an invalid deadband.
+        """
+        self._hub.validate(deadbands)
+        with self._hub._lock:
+            new = not set(deadbands).issubset(self._hub._names())
+            self._deadbands.update(deadbands)
+            self._filter = DeltaFilter(self._deadbands)
+            if new:
+                self._hub._lock.notify()  # sample the new parameters right away
+
+    def remove(self, names: Iterable[str]) -> None:
+        """Unsubscribe the given parameters.
+
+        :param names: The names of the parameters.
+        :type names: Iterable[str]
+        """
+        with self._hub._lock:
+            for name in names:
+                self._deadbands.pop(name, None)
+            self._filter = DeltaFilter(self._deadbands)
+
+    def close(self) -> None:
+        """Cancel the subscription."""
+        self._hub._unsubscribe(self)
+
+    def _deliver(self, snapshot: ParamSnapshot) -> None:
+        delta = self._filter.update(snapshot.values)
+        if delta:
+            self._callback(ParamSnapshot(snapshot.timestamp, delta))
+
+
+class SubscriptionHub:
+    """Hub for the live subscriptions of several clients on heat pump parameters representing a "MP" data point.
+
+    The hub keeps the union of all subscribed parameters and samples them by a single fast query per tick,
+    regardless of the number of clients. If there is no subscription, the heat pump isn't accessed at all.
+
+    Example:
+
+    >>> hub = SubscriptionHub(ht_heatpump, interval=1.0)
+    >>> subscription = hub.subscribe(print)
+    >>> subscription.add({"Temp. Aussen": 0.5, "Stoerung": 0})
+    >>> subscription.close()
+    >>> hub.stop()
+
+    :param heatpump: The :class:`HtHeatpump` instance used for the sampling.
+    :type heatpump: ``HtHeatpump``
+    :param interval: The sampling interval in seconds.
+    :type interval: float
+    :param index: The index of the parameter definitions (default :const:`None`, which means a new one).
+    :type index: ParamIndex or None
+    """
+
+    def __init__(self, heatpump: HtHeatpump, interval: float, index: Optional[ParamIndex] = None) -> None:
+        assert heatpump is not None, "'heatpump' must not be None"
+        assert interval > 0, "'interval' must be greater than zero"
+        self._heatpump = heatpump
+        self._interval = interval
+        self._index = index if index is not None else ParamIndex()
+        self._subscriptions: List[Subscription] = []
+        self._lock = threading.Condition()
+        self._ticks = 0
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Return the number of subscriptions, subscribed parameters (union) and performed samples (ticks)."""
+        with self._lock:
+            return {"clients": len(self._subscriptions), "params": len(self._names()), "ticks": self._ticks}
+
+    def validate(self, deadbands: Dict[str, float]) -> None:
+        """Check the given parameter names and deadbands of a subscription.
+
+        :param deadbands: The parameter names with their deadband.
+        :type deadbands: dict
+        :raises ValueError:
+            If a parameter is unknown, doesn't represent a "MP" data point or has an invalid deadband.
+        """
+        unknown = self._index.unknown(deadbands.keys())
+        if unknown:
+            raise ValueError("Parameter(s) {} not found".format(", ".join(repr(name) for name in unknown)))
+        invalid = self._index.not_mp(deadbands.keys())
+        if invalid:
+            raise ValueError(
+                "Parameter(s) {} doesn't represent a 'MP' data point".format(", ".join(repr(name) for name in invalid))
+            )
+        for name, deadband in deadbands.items():
+            if not isinstance(deadband, (int, float)) or isinstance(deadband, bool) or not deadband >= 0:
+                raise ValueError("Invalid deadband {!r} for parameter {!r}".format(deadband, name))
+
+    def subscribe(self, callback: Callable[[ParamSnapshot], None]) -> Subscription:
+        """Create a new (empty) subscription.
+
+        :param callback: The callable which will be called with the changed values of the subscribed parameters.
+        :type callback: Callable[[ParamSnapshot], None]
+        :returns: The new subscription.
+        :rtype: ``Subscription``
+        """
+        subscription = Subscription(self, callback)
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("subscription hub already stopped")
+            self._subscriptions.append(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="htrest-subscriptions", daemon=True)
+                self._thread.start()
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the sampling thread.
+
+        :param timeout: The maximal time in seconds to wait for the thread to finish.
+        :type timeout: float or None
+        """
+        with self._lock:
+            self._stopped = True
+            self._lock.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _names(self) -> List[str]:
+        # the union of all subscribed parameters (in a stable order)
+        names: Dict[str, None] = {}
+        for subscription in self._subscriptions:
+            names.update(dict.fromkeys(subscription._deadbands))
+        return list(names)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self._stopped and not self._names():
+                    self._lock.wait()
+                if self._stopped:
+                    return
+                names = self._names()
+            start = time.monotonic()
+            try:
+                with HtContext(self._heatpump, PRIORITY_BACKGROUND):
+                    values = self._heatpump.fast_query(*names)
+                    timestamp = time.time()
+            except Exception as ex:
+                _LOGGER.error("sampling of the subscribed parameters failed: %s", ex)
+            else:
+                snapshot = ParamSnapshot(timestamp, values)
+                with self._lock:
+                    self._ticks += 1
+                    subscriptions = list(self._subscriptions)
+                    for subscription in subscriptions:
+                        try:
+                            subscription._deliver(snapshot)
+                        except Exception as ex:
+                            _LOGGER.error("subscription callback %s failed: %s", subscription._callback, ex)
+            with self._lock:
+                if not self._stopped:
+                    self._lock.wait(max(0.0, self._interval - (time.monotonic() - start)))
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Write-through cache of the heat pump time programs. """
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Final, List, Optional, Tuple
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+
+def etag_of(data: Any) -> str:
+    """Return an (unquoted) entity tag for the given JSON-serializable data.
+
+    :param data: The JSON-serializable data.
+    :returns: The entity tag.
+    :rtype: ``str``
+    """
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class TimeProgCache:
+    """Write-through cache of the time programs (in their JSON representation) keyed by the time program index.
+
+    The cached time programs expire after the given time to live and are then read again from the heat pump;
+    the write operations of the REST API update the cached time programs or invalidate them.
+
+    :param ttl: The time to live in seconds of the cached time programs (``0`` = caching disabled).
+    :type ttl: float
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._list: Optional[Tuple[float, List[Dict[str, Any]]]] = None
+        self._progs: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        """Return :const:`True` if the caching is enabled."""
+        return self._ttl > 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Return the number of cache hits and misses."""
+        return {"hits": self._hits, "misses": self._misses}
+
+    def _fresh(self, timestamp: float) -> bool:
+        return time.monotonic() - timestamp < self._ttl
+
+    def _count(self, hit: bool) -> None:
+        if hit:
+            self._hits += 1
+        else:
+            self._misses += 1
+
+    def get_list(self) -> Optional[List[Dict[str, Any]]]:
+        """Return the cached list of the time programs (without entries) or :const:`None` if not cached.
+
+        :returns: The JSON representations of the time programs (must not be modified by the caller!).
+        :rtype: ``list`` or ``None``
+        """
+        with self._lock:
+            res = self._list[1] if self._list is not None and self._fresh(self._list[0]) else None
+            self._count(res is not None)
+            return res
+
+    def put_list(self, time_progs: List[Dict[str, Any]]) -> None:
+        """Store the list of the time programs (without entries) in the cache.
+
+        :param time_progs: The JSON representations of the time programs.
+        :type time_progs: list
+        """
+        if self.enabled:
+            with self._lock:
+                self._list = (time.monotonic(), time_progs)
+
+    def get(self, idx: int) -> Optional[Dict[str, Any]]:
+        """Return the cached time program (with entries) or :const:`None` if not cached.
+
+        :param idx: The time program index.
+        :type idx: int
+        :returns: The JSON representation of the time program (must not be modified by the caller!).
+        :rtype: ``dict`` or ``None``
+        """
+        with self._lock:
+            item = self._progs.get(idx)
+            res = item[1] if item is not None and self._fresh(item[0]) else None
+            self._count(res is not None)
+            return res
+
+    def put(self, idx: int, time_prog: Dict[str, Any]) -> None:
+        """Store the time program (with entries) in the cache.
+
+        :param idx: The time program index.
+        :type idx: int
+        :param time_prog: The JSON representation of the time program.
+        :type time_prog: dict
+        """
+        if self.enabled:
+            with self._lock:
+                self._progs[idx] = (time.monotonic(), time_prog)
+
+    def header(self, idx: int) -> Optional[Dict[str, Any]]:
+        """Return the cached properties (without entries) of the time program or :const:`None` if not cached.
+
+        :param idx: The time program index.
+        :type idx: int
+        :rtype: ``dict`` or ``None``
+        """
+        time_prog = self.get(idx)
+        if time_prog is not None:
+            return {key: value for key, value in time_prog.items() if key != "entries"}
+        for time_prog in self.get_list() or []:
+            if time_prog["index"] == idx:
+                return dict(time_prog)
+        return None
+
+    def set_entry(self, idx: int, day: int, num: int, entry: Dict[str, Any]) -> None:
+        """Update a single entry of a cached time program (write-through).
+
+        :param idx: The time program index.
+        :type idx: int
+        :param day: The day of the time program entry.
+        :type day: int
+        :param num: The number of the time program entry (of the specified day).
+        :type num: int
+        :param entry: The JSON representation of the time program entry.
+        :type entry: dict
+        """
+        with self._lock:
+            item = self._progs.get(idx)
+            if item is None:
+                return
+            timestamp, time_prog = item
+            try:
+                entries = [list(day_entries) for day_entries in time_prog["entries"]]
+                entries[day][num] = entry
+            except (KeyError, IndexError):
+                del self._progs[idx]
+                return
+            self._progs[idx] = (timestamp, dict(time_prog, entries=entries))
+
+    def invalidate(self, idx: Optional[int] = None) -> None:
+        """Remove a time program or, if no index is given, all time programs from the cache.
+
+        :param idx: The time program index (default :const:`None`, which means all).
+        :type idx: int or None
+        """
+        with self._lock:
+            if idx is None:
+                self._list = None
+                self._progs.clear()
+            else:
+                self._progs.pop(idx, None)
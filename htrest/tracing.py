@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tracing of the serial transactions with the heat pump and their latency histograms. """
+
+import collections
+import functools
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Final, List, NamedTuple, Optional, Tuple
+
+from flask import Blueprint, current_app, has_request_context, jsonify, request
+from htheatpump import HtHeatpump
+from htheatpump.protocol import create_request
+
+from .metrics import SERIAL_OPERATIONS, MetricsRegistry
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+blueprint: Final = Blueprint("debug", __name__)
+
+# the operations whose first argument is the name of a parameter
+PARAM_OPERATIONS: Final = ("get_param", "set_param", "overwrite_param")
+
+# number of bytes of a response frame beside the returned message (header, length, "~", ";\r\n" and checksum)
+RESPONSE_OVERHEAD: Final = 12
+
+# the percentiles delivered by the debug endpoint
+PERCENTILES: Final = (50, 90, 99, 99.9)
+
+
+class HdrHistogram:
+    """Histogram with a bounded relative error (similar to an HDR histogram) for durations in seconds.
+
+    The durations are recorded in microseconds in logarithmically growing buckets, each subdivided into
+    linear sub-buckets, so that the relative error of a percentile is below ``2 ** -precision`` over the
+    whole range of values with a small and bounded number of buckets.
+
+    :param precision: The number of significant bits of a recorded value (default ``7``, i.e. less than 1% error).
+    :type precision: int
+    """
+
+    def __init__(self, precision: int = 7) -> None:
+        assert precision > 0, "'precision' must be greater than 0"
+        self._precision = precision
+        self._counts: Dict[Tuple[int, int], int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        """Record a duration.
+
+        :param value: The duration in seconds.
+        :type value: float
+        """
+        us = max(0, int(value * 1e6))
+        shift = max(0, us.bit_length() - self._precision)
+        key = (shift, us >> shift)
+        self._counts[key] = self._counts.get(key, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, percent: float) -> float:
+        """Return the given percentile of the recorded durations.
+
+        :param percent: The percentile (between 0 and 100).
+        :type percent: float
+        :returns: The percentile in seconds (the center of the bucket, but within the recorded minimum
+            and maximum) or ``0.0`` if nothing was recorded.
+        :rtype: ``float``
+        """
+        if self.count == 0:
+            return 0.0
+        target = max(1, round(self.count * percent / 100))
+        cumulative = 0
+        for (shift, value), count in sorted(self._counts.items()):
+            cumulative += count
+            if cumulative >= target:
+                center = ((value << shift) + ((value + 1) << shift)) / 2e6
+                return min(max(center, self.min), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """Return the count, minimum, mean, maximum and the :const:`PERCENTILES` of the recorded durations."""
+        res = {
+            "count": self.count,
+            "min": self.min if self.count else 0.0,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+        }
+        res.update({"p{:g}".format(p): self.percentile(p) for p in PERCENTILES})
+        return res
+
+
+class TraceRecord(NamedTuple):
+    """Trace of a single operation on the heat pump (with all its serial transactions)."""
+
+    timestamp: float
+    source: str
+    operation: str
+    param: str
+    duration: float
+    requests: int
+    retries: int
+    sent: int
+    received: int
+    error: str
+
+
+class _Call:
+    __slots__ = ("requests", "retries", "sent", "received")
+
+    def __init__(self) -> None:
+        self.requests = self.retries = self.sent = self.received = 0
+
+
+class _Stats:
+    __slots__ = ("histogram", "requests", "retries", "sent", "received", "errors")
+
+    def __init__(self) -> None:
+        self.histogram = HdrHistogram()
+        self.requests = self.retries = self.sent = self.received = self.errors = 0
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg._asdict())  # type: ignore[union-attr]
+
+
+class SerialTracer:
+    """Tracer of the operations on the heat pump, which records the duration, the number of serial requests,
+    retries (reconnects) and transferred bytes of every operation in latency histograms per operation and
+    parameter, and optionally writes every trace to a rolling trace file (JSON lines).
+
+    Nested operations (e.g. the verification read of a parameter write) are accounted to the outermost one.
+    The source of an operation is the namespace of the REST API request in which it was performed or the
+    name of the thread for background operations (e.g. ``htrest-sampler``). The trace file is written by a
+    separate thread, so the serial transactions aren't delayed by the file I/O. If a metrics registry is given,
+    the duration and failures of the operations are recorded there as well (``htrest_serial_call_*``), so
+    that the operations are only wrapped once.
+
+    Example:
+
+    >>> tracer = SerialTracer("/var/log/htrest/serial.trace")
+    >>> tracer.instrument(ht_heatpump)
+    >>> ...
+    >>> tracer.summary()
+    {'operations': [...], 'sources': [...], 'recent': [...]}
+
+    :param trace_file: The name of the trace file (default ``""``, which means no trace file).
+    :type trace_file: str
+    :param max_bytes: The size in bytes at which the trace file is rolled over.
+    :type max_bytes: int
+    :param backup_count: The number of rolled over trace files which are kept.
+    :type backup_count: int
+    :param recent: The number of the most recent traces which are kept in memory.
+    :type recent: int
+    :param metrics: The metrics registry which records the duration and failures of the operations (default
+        :const:`None`, which means no metrics).
+    :type metrics: MetricsRegistry or None
+    """
+
+    def __init__(
+        self,
+        trace_file: str = "",
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 5,
+        recent: int = 100,
+        metrics: Optional[MetricsRegistry] = None,
+    ) -> None:
+        self._metrics = metrics
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[str, str], _Stats] = {}
+        self._sources: Dict[Tuple[str, str], HdrHistogram] = {}
+        self._recent: Deque[TraceRecord] = collections.deque(maxlen=recent)
+        self._queue: Optional[queue.SimpleQueue] = None
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        if trace_file:
+            handler = logging.handlers.RotatingFileHandler(
+                trace_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+            )
+            handler.setFormatter(_JsonFormatter())
+            self._queue = queue.SimpleQueue()
+            self._listener = logging.handlers.QueueListener(self._queue, handler)
+            self._listener.start()
+            _LOGGER.info("write serial traces to %r", trace_file)
+
+    def instrument(self, heatpump: HtHeatpump) -> None:
+        """Trace the operations on the given :class:`HtHeatpump` instance.
+
+        :param heatpump: The :class:`HtHeatpump` instance.
+        :type heatpump: ``HtHeatpump``
+        """
+        for operation in SERIAL_OPERATIONS:
+            func = getattr(heatpump, operation, None)
+            if func is not None:
+                setattr(heatpump, operation, self._traced(operation, func))
+        send_request, read_response, reconnect = heatpump.send_request, heatpump.read_response, heatpump.reconnect
+
+        def traced_send_request(cmd: str) -> None:
+            call = getattr(self._local, "call", None)
+            if call is not None:
+                call.requests += 1
+                call.sent += len(create_request(cmd))
+            send_request(cmd)
+
+        def traced_read_response() -> str:
+            resp = read_response()
+            call = getattr(self._local, "call", None)
+            if call is not None:
+                call.received += len(resp) + RESPONSE_OVERHEAD
+            return resp
+
+        def traced_reconnect() -> None:
+            call = getattr(self._local, "call", None)
+            if call is not None:
+                call.retries += 1
+            reconnect()
+
+        heatpump.send_request = traced_send_request  # type: ignore[assignment]
+        heatpump.read_response = traced_read_response  # type: ignore[assignment]
+        heatpump.reconnect = traced_reconnect  # type: ignore[assignment]
+
+    def _traced(self, operation: str, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(self._local, "call", None) is not None:
+                return func(*args, **kwargs)  # nested operation, accounted to the outer one
+            call = self._local.call = _Call()
+            error = ""
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception as ex:
+                error = type(ex).__name__
+                raise
+            finally:
+                duration = time.perf_counter() - start
+                self._local.call = None
+                param = str(args[0]) if operation in PARAM_OPERATIONS and args else ""
+                self._record(
+                    TraceRecord(
+                        time.time(),
+                        _source(),
+                        operation,
+                        param,
+                        duration,
+                        call.requests,
+                        call.retries,
+                        call.sent,
+                        call.received,
+                        error,
+                    )
+                )
+
+        return wrapper
+
+    def _record(self, record: TraceRecord) -> None:
+        with self._lock:
+            stats = self._stats.get((record.operation, record.param))
+            if stats is None:
+                stats = self._stats[(record.operation, record.param)] = _Stats()
+            stats.histogram.record(record.duration)
+            stats.requests += record.requests
+            stats.retries += record.retries
+            stats.sent += record.sent
+            stats.received += record.received
+            stats.errors += 1 if record.error else 0
+            histogram = self._sources.get((record.source, record.operation))
+            if histogram is None:
+                histogram = self._sources[(record.source, record.operation)] = HdrHistogram()
+            histogram.record(record.duration)
+            self._recent.append(record)
+        if self._metrics is not None:
+            if record.error:
+                self._metrics.inc(
+                    "htrest_serial_call_errors",
+                    "Number of failed serial calls to the heat pump.",
+                    operation=record.operation,
+                )
+            self._metrics.observe(
+                "htrest_serial_call_duration_seconds",
+                "Duration of the serial calls to the heat pump.",
+                record.duration,
+                operation=record.operation,
+            )
+        if self._queue is not None:
+            self._queue.put_nowait(logging.makeLogRecord({"msg": record}))
+
+    @property
+    def totals(self) -> Dict[str, Dict[str, int]]:
+        """Return the number of traced operations, errors, requests, retries and sent/received bytes by operation."""
+        res: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            for (operation, _), stats in self._stats.items():
+                totals = res.setdefault(operation, dict.fromkeys(_Stats.__slots__[1:], 0))
+                totals["count"] = totals.get("count", 0) + stats.histogram.count
+                for key in _Stats.__slots__[1:]:
+                    totals[key] += getattr(stats, key)
+        return res
+
+    def summary(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Return the latency histograms (summarized by their percentiles) and counters by operation and
+        parameter, the latency histograms by source and operation and the most recent traces.
+
+        :returns: The summary with the lists ``operations``, ``sources`` and ``recent``.
+        :rtype: ``dict``
+        """
+        with self._lock:
+            operations = [
+                dict(
+                    stats.histogram.summary(),
+                    operation=operation,
+                    param=param,
+                    **{key: getattr(stats, key) for key in _Stats.__slots__[1:]},
+                )
+                for (operation, param), stats in sorted(self._stats.items())
+            ]
+            sources = [
+                dict(histogram.summary(), source=source, operation=operation)
+                for (source, operation), histogram in sorted(self._sources.items())
+            ]
+            recent = [record._asdict() for record in self._recent]
+        return {"operations": operations, "sources": sources, "recent": recent}
+
+    def close(self) -> None:
+        """Flush and close the trace file."""
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
+
+
+def _source() -> str:
+    if has_request_context():
+        path = request.path
+        for prefix in ("/api/v1/", "/"):
+            if path.startswith(prefix):
+                return path[len(prefix):].partition("/")[0] or "root"
+    return threading.current_thread().name
+
+
+@blueprint.route("/debug/serial")
+def serial():
+    """Returns the latency histograms and counters of the operations on the heat pump and the most recent traces."""
+    _LOGGER.info("*** [GET] %s", request.url)
+    return jsonify(current_app.ht_tracer.summary())  # type: ignore[attr-defined]
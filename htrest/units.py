@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Support of several heat pumps (units) in a single server process. """
+
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, Final, Iterable, List, Mapping, Optional, Tuple
+
+from flask import Flask, Response, request
+from flask_basicauth import BasicAuth
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+from .app import create_app
+from .startup import HEALTH_LIVE, HEALTH_READY, RETRY_AFTER, cache_spec
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+# URL prefix of the REST API
+API_PREFIX: Final = "/api/v1"
+# name of the aggregate resource across all units (can't be used as unit name)
+UNITS: Final = "units"
+# regex for a valid unit name
+UNIT_PATTERN: Final = re.compile(r"^[A-Za-z0-9_-]+$")
+# URL prefixes of the resources of the units
+UNIT_PREFIXES: Final = (API_PREFIX, "/metrics", "/debug", "/health")
+# time in seconds to wait for the results of all units of an aggregate request
+AGGREGATE_TIMEOUT: Final = 30
+
+
+class UnitDispatcher:
+    """WSGI middleware which dispatches the requests on ``/api/v1/<unit>/...``, ``/metrics/<unit>``,
+    ``/debug/<unit>/...`` and ``/health/<unit>/...`` to the app of the respective unit (as ``/api/v1/...``,
+    ``/metrics``, ``/debug/...`` and ``/health/...``) and all other requests to the wrapped app; the
+    ``Location`` header of the responses (e.g. redirects) is mapped back to the unit.
+
+    :param app: The wrapped WSGI application.
+    :param units: The apps of the units by unit name.
+    :type units: Mapping[str, Flask]
+    """
+
+    def __init__(self, app, units: Mapping[str, Flask]) -> None:
+        self._app = app
+        self._units = dict(units)
+
+    def _resolve(self, path: str) -> Tuple[Optional[str], str]:
+        for prefix in UNIT_PREFIXES:
+            if path.startswith(prefix + "/"):
+                unit, sep, rest = path[len(prefix) + 1:].partition("/")
+                if unit in self._units:
+                    return unit, prefix + (sep + rest if prefix == API_PREFIX or rest else "")
+        return None, path
+
+    def __call__(self, environ, start_response):
+        unit, path = self._resolve(environ.get("PATH_INFO", ""))
+        if unit is None:
+            return self._app(environ, start_response)
+        environ["PATH_INFO"] = path
+
+        def unit_start_response(status, headers, exc_info=None):
+            headers = [
+                (key, _unit_location(value, unit) if key.lower() == "location" else value) for key, value in headers
+            ]
+            return start_response(status, headers, exc_info)
+
+        return self._units[unit](environ, unit_start_response)
+
+
+def _unit_location(location: str, unit: str) -> str:
+    """Map an URL of the REST API of a unit (e.g. ``/api/v1/param/``) to the one of the server."""
+    head, sep, tail = location.partition(API_PREFIX + "/")
+    return head + sep + unit + "/" + tail if sep else location
+
+
+def unit_kwargs(unit: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the arguments of :func:`~htrest.app.create_app` for a single unit, with separate history
+    directories, fault list cache files, trace files and profile directories per unit.
+
+    :param unit: The unit name.
+    :type unit: str
+    :param kwargs: The arguments common to all units.
+    :type kwargs: dict
+    :returns: The arguments for the unit.
+    :rtype: ``dict``
+    """
+    kwargs = dict(kwargs)
+    if kwargs.get("history_dir"):
+        kwargs["history_dir"] = os.path.join(kwargs["history_dir"], unit)
+    if kwargs.get("fault_cache"):
+        root, ext = os.path.splitext(kwargs["fault_cache"])
+        kwargs["fault_cache"] = "{}-{}{}".format(root, unit, ext)
+    if kwargs.get("trace_file"):
+        root, ext = os.path.splitext(kwargs["trace_file"])
+        kwargs["trace_file"] = "{}-{}{}".format(root, unit, ext)
+    if kwargs.get("profile_dir"):
+        kwargs["profile_dir"] = os.path.join(kwargs["profile_dir"], unit)
+    return kwargs
+
+
+def _get(app: Flask, path: str, query_string: str, headers: List[Tuple[str, str]]) -> Tuple[int, Any]:
+    """Perform a GET request on the app of a unit and return the status code and the decoded JSON body;
+    successful responses which aren't JSON (e.g. the endless event stream) are closed without reading them.
+    """
+    environ = EnvironBuilder(path=path, query_string=query_string, headers=headers).get_environ()
+    body, status, response_headers = run_wsgi_app(app, environ)
+    code = int(status.split()[0])
+    try:
+        mimetype = response_headers.get("Content-Type", "").partition(";")[0].strip()
+        if mimetype != "application/json" and code < 400:
+            return 406, {"message": "unsupported content type {!r}".format(mimetype)}
+        data = b"".join(body)
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+    try:
+        return code, json.loads(data) if data else None
+    except ValueError:
+        return code, {"message": data.decode("utf-8", "replace")}
+
+
+def create_multi_app(units: Mapping[str, Tuple[str, int]], user: Optional[str] = None, **kwargs) -> Flask:
+    """Create the app for several heat pumps, each on its own serial device.
+
+    Every unit gets its own app (see :func:`~htrest.app.create_app`) with its own heat pump connection,
+    session, sampler and caches, so the units are accessed in parallel; the REST API of a unit is available
+    under ``/api/v1/<unit>/...`` (with its OpenAPI document and documentation page), its metrics under
+    ``/metrics/<unit>``. The aggregate resource
+    ``/api/v1/units/<path>`` performs a GET request on ``/api/v1/<path>`` of all units (in parallel, by a
+    worker thread per unit) and returns the results by unit name; only JSON responses can be aggregated
+    (e.g. not the event stream), and a unit which doesn't answer within :data:`AGGREGATE_TIMEOUT` seconds
+    is reported as failed. If the request failed on all units, the aggregate answers with their status (if they
+    all failed the same way) or ``502 Bad Gateway``.
+
+    :param units: The serial device and baudrate of the heat pumps by unit name.
+    :type units: Mapping[str, Tuple[str, int]]
+    :param user: The username and password for the basic access authentication ("<username>:<password>").
+    :type user: str or None
+    :param kwargs: Further arguments of :func:`~htrest.app.create_app`, common to all units.
+    :returns: The Flask app.
+    :rtype: ``Flask``
+    :raises ValueError:
+        If a unit name is invalid or no unit is given.
+    """
+    if not units:
+        raise ValueError("at least one unit must be given")
+    invalid = [unit for unit in units if unit == UNITS or not UNIT_PATTERN.match(unit)]
+    if invalid:
+        raise ValueError("invalid unit name(s) {}".format(", ".join(repr(unit) for unit in invalid)))
+    from htrest.apiv1 import api as apiv1_api
+
+    unit_apps: Dict[str, Flask] = {}
+    for unit, (device, baudrate) in units.items():
+        _LOGGER.info("create app of unit %r (%s, %d baud)", unit, device, baudrate)
+        unit_apps[unit] = create_app(device, baudrate, user, **unit_kwargs(unit, kwargs))
+        # the OpenAPI document of the unit refers to its own REST API (e.g. for "Try it out" of the Swagger UI)
+        cache_spec(unit_apps[unit], apiv1_api, API_PREFIX + "/" + unit)
+    # a worker thread per unit for the aggregate requests
+    workers = {unit: ThreadPoolExecutor(max_workers=1, thread_name_prefix="htrest-" + unit) for unit in units}
+
+    app = Flask(__name__)
+    if user:
+        username, _, password = user.partition(":")
+        app.config["BASIC_AUTH_USERNAME"] = username
+        app.config["BASIC_AUTH_PASSWORD"] = password
+        app.config["BASIC_AUTH_FORCE"] = True
+        _ = BasicAuth(app)
+
+    @app.route(API_PREFIX + "/" + UNITS)
+    def unit_list():
+        """Returns the units with their serial device."""
+        _LOGGER.info("*** [GET] %s", request.url)
+        return {unit: device for unit, (device, _) in units.items()}
+
+    @app.route(API_PREFIX + "/" + UNITS + "/<path:path>")
+    def aggregate(path: str):
+        """Performs the GET request on '/api/v1/<path>' of all units and returns the results by unit name."""
+        _LOGGER.info("*** [GET] %s", request.url)
+        headers = [
+            (key, value)
+            for key, value in request.headers.items()
+            if key.lower() in ("accept", "prefer", "authorization")
+        ]
+        futures = {
+            unit: workers[unit].submit(_get, unit_app, API_PREFIX + "/" + path, request.query_string.decode(), headers)
+            for unit, unit_app in unit_apps.items()
+        }
+        res: Dict[str, Any] = {}
+        failed: Dict[str, int] = {}
+        deadline = time.monotonic() + AGGREGATE_TIMEOUT
+        for unit, future in futures.items():
+            try:
+                status, res[unit] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                status, res[unit] = 504, {"message": "no response within {} seconds".format(AGGREGATE_TIMEOUT)}
+            except Exception as ex:
+                status, res[unit] = 500, {"message": str(ex)}
+            if status != 200:
+                failed[unit] = status
+        _LOGGER.debug("*** [GET] %s -> %s", request.url, res)
+        status = 200
+        if len(failed) == len(res):
+            # the status of the units, if they all failed the same way (e.g. '404 Not Found')
+            statuses = set(failed.values())
+            status = statuses.pop() if len(statuses) == 1 else 502
+        response = Response(json.dumps(res) + "\n", status, mimetype="application/json")
+        if failed:
+            response.headers["X-Failed-Units"] = ", ".join(failed)
+        return response
+
+    @app.route(HEALTH_LIVE)
+    def live():
+        """Returns the liveness of the server."""
+        return {"status": "alive"}
+
+    @app.route(HEALTH_READY)
+    def ready():
+        """Returns the readiness of all units (the connections to the heat pumps have been established)."""
+        connectors = {unit: unit_app.ht_connector for unit, unit_app in unit_apps.items()}  # type: ignore[attr-defined]
+        res = {unit: connector.status for unit, connector in connectors.items()}
+        if all(connector.ready for connector in connectors.values()):
+            return res
+        return res, 503, {"Retry-After": str(RETRY_AFTER)}
+
+    # the first unit serves all remaining requests besides the resources of the units (e.g. the static files of the
+    # Swagger UI, which are the same for all units)
+    first = next(iter(unit_apps.values()))
+    app.wsgi_app = UnitDispatcher(_Fallback(app.wsgi_app, first), unit_apps)  # type: ignore[method-assign]
+    app.ht_units = unit_apps  # type: ignore[attr-defined]
+    _LOGGER.info("*** created app for unit(s) %s", ", ".join(units))
+    return app
+
+
+class _Fallback:
+    """WSGI middleware which passes the requests to the fallback app, which aren't on the resources of the units
+    (i.e. are neither unit nor aggregate requests); requests on an unknown unit are answered by the app.
+    """
+
+    def __init__(self, app, fallback) -> None:
+        self._app = app
+        self._fallback = fallback
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if any(path == prefix or path.startswith(prefix + "/") for prefix in UNIT_PREFIXES):
+            return self._app(environ, start_response)
+        return self._fallback(environ, start_response)
+
+
+def parse_units(values: Iterable[str], baudrate: int) -> Dict[str, Tuple[str, int]]:
+    """Parse unit statements in form of ``<unit>=<device>[:<baudrate>]``.
+
+    :param values: The unit statements.
+    :type values: Iterable[str]
+    :param baudrate: The default baudrate.
+    :type baudrate: int
+    :returns: The serial device and baudrate by unit name.
+    :rtype: ``dict``
+    :raises ValueError:
+        If a statement is invalid.
+    """
+    units: Dict[str, Tuple[str, int]] = {}
+    for value in values:
+        unit, sep, device = value.partition("=")
+        if not sep or not unit or not device:
+            raise ValueError(
+                "{!r} is not a valid unit statement in form of '<unit>=<device>[:<baudrate>]'".format(value)
+            )
+        device, sep, rate = device.rpartition(":") if re.search(r":\d+$", device) else (device, "", "")
+        units[unit] = (device, int(rate) if sep else baudrate)
+    return units
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Filter for repeated writes of heat pump parameters (suppression of unchanged values and debouncing). """
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Final, Hashable, Optional, Tuple
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+# reasons for a suppressed write
+UNCHANGED: Final = "unchanged"  # the value equals the last known value
+SUPERSEDED: Final = "superseded"  # a later write of the same parameter arrived during the debounce window
+
+
+class _State:
+    __slots__ = ("value", "known_since", "last_write", "ticket", "pending")
+
+    def __init__(self) -> None:
+        self.value: Any = None  # last known value
+        self.known_since: Optional[float] = None  # time since when the value is known (None = unknown)
+        self.last_write = 0.0  # time of the last write (monotonic)
+        self.ticket = 0  # number of the latest write request
+        self.pending: Any = None  # value of the latest write request
+
+
+class WriteFilter:
+    """Filter in front of the write operations of the heat pump parameters.
+
+    * A write is skipped if the value equals the last known value of the parameter, which is trusted
+      for ``ttl`` seconds after it was written (or observed by the parameter sampler).
+    * Writes to the same parameter are delayed until ``debounce`` seconds have passed since the previous
+      write; if meanwhile a later write of the same parameter arrives, only the later one is performed.
+
+    Example:
+
+    >>> write_filter = WriteFilter(ttl=300, debounce=2)
+    >>> value, suppressed = write_filter.write(("param", name), value, lambda: ht_heatpump.set_param(name, value))
+
+    :param ttl: The time in seconds for which the last known value of a parameter is trusted (``0`` = no
+        suppression of unchanged values).
+    :type ttl: float
+    :param debounce: The minimal time in seconds between two writes of the same parameter (``0`` = no debouncing).
+    :type debounce: float
+    """
+
+    def __init__(self, ttl: float = 0, debounce: float = 0) -> None:
+        self._ttl = ttl
+        self._debounce = debounce
+        self._states: Dict[Hashable, _State] = {}
+        self._cond = threading.Condition()
+        self._stats = {"writes": 0, "delayed": 0, UNCHANGED: 0, SUPERSEDED: 0}
+
+    @property
+    def enabled(self) -> bool:
+        """Return :const:`True` if the filter is enabled."""
+        return self._ttl > 0 or self._debounce > 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Return the number of performed, delayed and suppressed (``unchanged`` or ``superseded``) writes."""
+        with self._cond:
+            return dict(self._stats)
+
+    def write(self, key: Hashable, value: Any, func: Callable[[], Any]) -> Tuple[Any, Optional[str]]:
+        """Perform the given write operation, unless it is suppressed by the filter.
+
+        :param key: The key which identifies the written parameter, e.g. ``("param", name)``.
+        :type key: Hashable
+        :param value: The value to write.
+        :param func: The write operation; returns the written value.
+        :type func: Callable
+        :returns: The written (or last known, if suppressed) value and the reason of the suppression
+            (``"unchanged"``, ``"superseded"`` or :const:`None` if the write was performed).
+        :rtype: ``tuple`` ( value, str or None )
+        """
+        if not self.enabled:
+            return func(), None
+        with self._cond:
+            state = self._states.setdefault(key, _State())
+            if self._is_known(state, value):
+                self._stats[UNCHANGED] += 1
+                _LOGGER.debug("suppressed write of %s (unchanged value %r)", key, value)
+                return state.value, UNCHANGED
+            state.ticket += 1
+            state.pending = value
+            ticket = state.ticket
+            delayed = False
+            while time.monotonic() < state.last_write + self._debounce:
+                delayed = True
+                self._cond.wait(state.last_write + self._debounce - time.monotonic())
+                if state.ticket != ticket:
+                    self._stats[SUPERSEDED] += 1
+                    _LOGGER.debug("suppressed write of %s (value %r superseded)", key, value)
+                    return state.pending, SUPERSEDED
+            if delayed:
+                self._stats["delayed"] += 1
+            if self._is_known(state, value):  # e.g. written by a previous (delayed) write
+                self._stats[UNCHANGED] += 1
+                return state.value, UNCHANGED
+            state.last_write = time.monotonic()
+            state.known_since = None  # unknown during the write
+        try:
+            result = func()
+        except BaseException:
+            with self._cond:
+                self._cond.notify_all()
+            raise
+        self.record(key, result)
+        with self._cond:
+            self._stats["writes"] += 1
+        return result, None
+
+    def _is_known(self, state: _State, value: Any) -> bool:
+        return state.known_since is not None and time.time() - state.known_since < self._ttl and state.value == value
+
+    def record(self, key: Hashable, value: Any) -> None:
+        """Record the current value of a parameter, e.g. written by another write operation.
+
+        :param key: The key which identifies the parameter, e.g. ``("param", name)``.
+        :type key: Hashable
+        :param value: The current value of the parameter.
+        """
+        with self._cond:
+            state = self._states.setdefault(key, _State())
+            state.value = value
+            state.known_since = time.time()
+            self._cond.notify_all()
+
+    def observe(self, values: Dict[str, Any], timestamp: float) -> None:
+        """Update the last known values of the parameters which have been written before (e.g. with the values
+        sampled by the :class:`~htrest.sampler.ParamSampler`), so that external changes are taken into account.
+
+        :param values: The parameter values by parameter name.
+        :type values: dict
+        :param timestamp: The time the values have been read (seconds since the epoch); values older than
+            the last known value of a parameter are ignored.
+        :type timestamp: float
+        """
+        with self._cond:
+            for name, value in values.items():
+                state = self._states.get(("param", name))
+                if state is not None and state.known_since is not None and state.known_since < timestamp:
+                    state.value = value
+                    state.known_since = timestamp
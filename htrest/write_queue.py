@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Background queue for asynchronous (bulk) writes of heat pump parameters. """
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Final, List, Optional, Tuple
+
+from htheatpump import HtHeatpump, HtParamValueType
+
+from . import settings
+from .apis.utils import HtContext
+from .scheduler import PRIORITY_WRITE
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+# states of the parameter writes and the jobs
+PENDING: Final = "pending"
+RUNNING: Final = "running"
+DONE: Final = "done"
+MERGED: Final = "merged"  # superseded by a later write of the same parameter
+FAILED: Final = "failed"
+
+
+class WriteEntry:
+    """A single parameter write of a :class:`WriteJob`."""
+
+    __slots__ = ("job_id", "name", "value", "status", "result", "error")
+
+    def __init__(self, job_id: str, name: str, value: HtParamValueType) -> None:
+        self.job_id = job_id  #: the ID of the job
+        self.name = name  #: the parameter name
+        self.value = value  #: the requested value
+        self.status = PENDING  #: the state of the write
+        self.result: Optional[HtParamValueType] = None  #: the value returned by the heat pump
+        self.error: Optional[str] = None  #: the error message, if the write failed
+
+
+class WriteJob:
+    """A batch of parameter writes submitted to the :class:`WriteQueue`."""
+
+    def __init__(self, values: Dict[str, HtParamValueType]) -> None:
+        self.id: Final = uuid.uuid4().hex  #: the unique job ID
+        self.created: Final = time.time()  #: time of the submission (seconds since the epoch)
+        self.finished: Optional[float] = None  #: time of the completion (seconds since the epoch)
+        self.entries: Final = [WriteEntry(self.id, name, value) for name, value in values.items()]
+
+    @property
+    def status(self) -> str:
+        """Return the state of the job: ``pending``, ``running``, ``done`` or ``failed``."""
+        states = {entry.status for entry in self.entries}
+        if RUNNING in states or (PENDING in states and len(states) > 1):
+            return RUNNING
+        if PENDING in states:
+            return PENDING
+        return FAILED if FAILED in states else DONE
+
+
+class WriteQueue:
+    """Queue which performs the parameter writes of the submitted jobs in a background thread.
+
+    Writes to the same parameter which are still pending are merged, so that only the last value is sent
+    to the heat pump; the superseded writes are reported as ``merged`` together with the written value.
+
+    Example:
+
+    >>> queue = WriteQueue(ht_heatpump)
+    >>> job = queue.submit({"HKR Soll_Raum": 21.5, "WW Normaltemp.": 48})
+    >>> queue.get(job.id).status
+    'pending'
+
+    :param heatpump: The :class:`HtHeatpump` instance.
+    :type heatpump: ``HtHeatpump``
+    :param max_jobs: The maximal number of finished jobs kept for the status requests.
+    :type max_jobs: int
+    :param on_write: Optional callback which is called with the parameter name and the written value
+        after each successful write.
+    :type on_write: Callable or None
+    """
+
+    def __init__(
+        self,
+        heatpump: HtHeatpump,
+        max_jobs: int = 100,
+        on_write: Optional[Callable[[str, HtParamValueType], None]] = None,
+    ) -> None:
+        assert heatpump is not None, "'heatpump' must not be None"
+        self._heatpump = heatpump
+        self._max_jobs = max_jobs
+        self._on_write = on_write
+        self._jobs: "OrderedDict[str, WriteJob]" = OrderedDict()
+        # the pending writes by parameter name: (value, entries waiting for this write)
+        self._pending: "OrderedDict[str, Tuple[HtParamValueType, List[WriteEntry]]]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._stats = {"jobs": 0, "writes": 0, "merged": 0, "failed": 0}
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Return the number of submitted jobs, performed writes, merged writes and failed writes."""
+        with self._cond:
+            return dict(self._stats)
+
+    def submit(self, values: Dict[str, HtParamValueType]) -> WriteJob:
+        """Submit a batch of parameter writes.
+
+        :param values: The values to write by parameter name.
+        :type values: dict
+        :returns: The new job.
+        :rtype: ``WriteJob``
+        """
+        job = WriteJob(values)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("write queue already stopped")
+            for entry in job.entries:
+                pending = self._pending.get(entry.name)
+                if pending is None:
+                    self._pending[entry.name] = (entry.value, [entry])
+                else:
+                    self._pending[entry.name] = (entry.value, pending[1] + [entry])
+                    self._stats["merged"] += 1
+            self._jobs[job.id] = job
+            self._stats["jobs"] += 1
+            self._evict()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="htrest-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        _LOGGER.info("submitted write job %s (%d parameter(s))", job.id, len(job.entries))
+        return job
+
+    def get(self, job_id: str) -> Optional[WriteJob]:
+        """Return the job with the given ID or :const:`None` if unknown (or already evicted)."""
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def _evict(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished is not None]
+        for job_id in finished[: max(0, len(finished) - self._max_jobs)]:
+            del self._jobs[job_id]
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the background thread after all pending writes are performed.
+
+        :param timeout: The maximal time in seconds to wait for the thread to finish.
+        :type timeout: float or None
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # writes submitted from now on can't be merged into this batch anymore
+                batch, self._pending = self._pending, OrderedDict()
+                for _, entries in batch.values():
+                    for entry in entries:
+                        entry.status = RUNNING
+            for name, (value, entries) in batch.items():
+                self._write(name, value, entries)
+
+    def _write(self, name: str, value: HtParamValueType, entries: List[WriteEntry]) -> None:
+        result: Optional[HtParamValueType] = None
+        error: Optional[str] = "write interrupted"
+        try:
+            try:
+                with HtContext(self._heatpump, PRIORITY_WRITE):
+                    result = value if settings.READ_ONLY else self._heatpump.set_param(name, value)
+                error = None
+            except Exception as ex:
+                _LOGGER.error("asynchronous write of parameter %r failed: %s", name, ex)
+                error = str(ex)
+            if error is None and self._on_write is not None:
+                try:
+                    self._on_write(name, result)
+                except Exception as ex:
+                    _LOGGER.error("write callback %s for parameter %r failed: %s", self._on_write, name, ex)
+        finally:
+            # the entries are always finished, so that the jobs don't stay pending
+            now = time.time()
+            with self._cond:
+                self._stats["writes" if error is None else "failed"] += 1
+                for entry in entries:
+                    entry.result, entry.error = result, error
+                    entry.status = FAILED if error is not None else (DONE if entry is entries[-1] else MERGED)
+                for job_id in {entry.job_id for entry in entries}:
+                    job = self._jobs.get(job_id)
+                    if job is not None and all(e.status not in (PENDING, RUNNING) for e in job.entries):
+                        job.finished = now
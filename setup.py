@@ -49,6 +49,7 @@ def pip(filename: str) -> List[str]:
 
 install_requires = pip("install")
 doc_require = pip("doc")
+aio_require = pip("aio")
 tests_require = pip("test")
 dev_require = tests_require + pip("develop")
 
@@ -80,7 +81,7 @@ setup(
     install_requires=install_requires,
     tests_require=tests_require,
     # dev_require=dev_require,  # UserWarning: Unknown distribution option: 'dev_require'
-    extras_require={"test": tests_require, "doc": doc_require, "dev": dev_require},
+    extras_require={"test": tests_require, "doc": doc_require, "dev": dev_require, "aio": aio_require},
     # Prevent zip archive creation
     zip_safe=False,
     # Keywords that describes the project
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  HtREST - Heliotherm heat pump REST API
+#  Copyright (C) 2023  Daniel Strigl
+
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests of the REST API for the time programs of the heat pump. """
+
+import threading
+import time
+
+import pytest
+
+from htrest.app import create_app
+from htrest.apis.utils import HtContext
+from htrest.scheduler import PRIORITY_BULK
+from htrest.session import HtSession
+
+
+@pytest.fixture
+def app():
+    app = create_app(device="simulator", simulate=True)  # time program cache disabled
+    yield app
+    app.ht_heatpump.time_scale = 0  # type: ignore[attr-defined]
+
+
+def _wait_for_waiters(session: HtSession, num: int) -> None:
+    deadline = time.monotonic() + 5
+    while session._lock.waiting < num:
+        assert time.monotonic() < deadline, "threads didn't queue up for the heat pump"
+        time.sleep(0.01)
+
+
+def test_put_concurrent_to_get(app):
+    """A PUT must not wait for a merged GET of the same time program which itself waits for the PUT."""
+    ht_heatpump = app.ht_heatpump
+    session = HtSession.of(ht_heatpump)
+    current = app.test_client().get("/api/v1/timeprog/0").get_json()
+    results = {}
+
+    def get():
+        results["get"] = app.test_client().get("/api/v1/timeprog/0").status_code
+
+    def put():
+        results["put"] = app.test_client().put("/api/v1/timeprog/0", json=current).status_code
+
+    threads = [threading.Thread(target=get, daemon=True), threading.Thread(target=put, daemon=True)]
+    # hold the heat pump, so that the GET leads the read of the time program and the PUT (with the higher
+    # priority) gets the heat pump first
+    with HtContext(ht_heatpump, PRIORITY_BULK):
+        for num, thread in enumerate(threads, start=1):
+            thread.start()
+            _wait_for_waiters(session, num)
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in threads), "deadlock between GET and PUT"
+    assert results == {"get": 200, "put": 200}